@@ -0,0 +1,149 @@
+#!/usr/bin/python
+#
+# Copyright (C) 2012 Unity Technologies Japan, G.K.
+#
+# Compares the two ways GDataBackend reads list feeds, on the same
+# worksheets of a synthetic document:
+#   gdata     : GetRows, feed made into gdata objects (used for uploads)
+#   iterparse : ReadRows, feed read with ListFeedReader keeping only the
+#               columns the parser uses (used for exports)
+# worksheets are downloaded once from the fake service into a feed cache;
+# each reader then runs in its own process reading them from the cache, and
+# reports wall and cpu time and peak memory (ru_maxrss) with the rows of all
+# worksheets kept, as the parser does.
+#
+# the worksheets are first read by both readers in one process, filling the
+# cache and checking that they give the same rows.
+#
+#   $> python benchmarks/bench_feed.py --features 5000 --locales 20
+#
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import resource
+import subprocess
+
+benchDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchDir, '..'))
+sys.path.insert(0, benchDir)
+
+import generator
+import fakeserver
+
+allReaders = ['gdata', 'iterparse']
+docKey = 'benchdoc'
+
+
+def MakeParser(port, cacheDir):
+	from storelicense import StoreLicenseParser, GDataBackend, FeedCache
+
+	backend = GDataBackend('bench@example.com', 'password', docKey, FeedCache(cacheDir, 1 << 40),
+		fakeserver.FakeServerHttpClient(port))
+	return StoreLicenseParser(None, None, docKey, 1, False, None, backend)
+
+
+#
+# read all worksheets with one reader in this process and write its result to args.result
+#
+def RunReader(args):
+	if args.reader == 'check':
+		with open(args.result, 'wb') as f:
+			json.dump({'same': IsSameRows(args.port, args.cache_dir)}, f)
+		return
+
+	parser = MakeParser(args.port, args.cache_dir)
+	sheetNames = parser._DocumentSheets()
+
+	start = time.time()
+	cpu = time.clock()
+	rows = {}
+	for name in sheetNames:
+		if args.reader == 'gdata':
+			rows[name] = parser.backend.GetRows(parser.sheets[name])
+		else:
+			rows[name] = parser.backend.ReadRows(parser.sheets[name], parser._ParsedColumns(name))
+	result = {'wall': time.time() - start, 'cpu': time.clock() - cpu,
+			  'rows': sum([len(sheetRows) for sheetRows in rows.itervalues()]),
+			  'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+	with open(args.result, 'wb') as f:
+		json.dump(result, f)
+
+
+#
+# True if both readers give the same values for the columns the parser uses.
+# fills the cache on the first run.
+#
+def IsSameRows(port, cacheDir):
+	parser = MakeParser(port, cacheDir)
+	for name in parser._DocumentSheets():
+		columns = parser._ParsedColumns(name)
+		full = [dict([(key, row.values[key]) for key in columns if key in row.values])
+				for row in parser.backend.GetRows(parser.sheets[name])]
+		fast = [row.values for row in parser.backend.ReadRows(parser.sheets[name], columns)]
+		if full != fast:
+			return False
+	return True
+
+
+def MeasureReader(reader, args, port, workDir):
+	resultPath = os.path.join(workDir, reader + '.result')
+	subprocess.check_call([sys.executable, os.path.abspath(__file__), '--reader', reader, '--result', resultPath,
+		'--port', str(port), '--cache-dir', os.path.join(workDir, 'cache')])
+	with open(resultPath, 'rb') as f:
+		result = json.load(f)
+	result['reader'] = reader
+	return result
+
+
+def main():
+	parser = argparse.ArgumentParser(description='compare list feed readers of storelicense.py.')
+	parser.add_argument('--features', type=int, default=2000, help='number of features in the document.')
+	parser.add_argument('--locales', type=int, default=20, help='number of locale sheets.')
+	parser.add_argument('--notes-density', type=float, default=0.1, help='ratio of non-empty notes.')
+	parser.add_argument('--readers', nargs='+', choices=allReaders, default=allReaders, help='readers to run.')
+	parser.add_argument('--json', default='', help='also write results to given json file.')
+	# used by child processes
+	parser.add_argument('--reader', help=argparse.SUPPRESS)
+	parser.add_argument('--result', help=argparse.SUPPRESS)
+	parser.add_argument('--port', type=int, default=0, help=argparse.SUPPRESS)
+	parser.add_argument('--cache-dir', default='', help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.reader:
+		RunReader(args)
+		return
+
+	sheets = generator.GenerateDocument(args.features, args.locales, args.notes_density)
+	workDir = tempfile.mkdtemp(prefix='storelicense-feed-')
+	server = fakeserver.FakeServer(0)
+	server.store.AddDocument(docKey, sheets)
+	server.Start()
+	try:
+		if not MeasureReader('check', args, server.port, workDir)['same']:
+			print 'readers give different rows'
+			sys.exit(1)
+
+		print '{0} features, {1} locales'.format(args.features, args.locales)
+		print '{0:<10} {1:>8} {2:>8} {3:>8} {4:>12}'.format('reader', 'rows', 'wall(s)', 'cpu(s)', 'peak mem(MB)')
+		results = []
+		for reader in args.readers:
+			result = MeasureReader(reader, args, server.port, workDir)
+			results.append(result)
+			print '{0:<10} {1:>8} {2:>8.2f} {3:>8.2f} {4:>12.1f}'.format(
+				reader, result['rows'], result['wall'], result['cpu'], result['maxrss_kb'] / 1024.0)
+	finally:
+		server.shutdown()
+		server.server_close()
+		shutil.rmtree(workDir)
+
+	if args.json is not '':
+		with open(args.json, 'wb') as f:
+			json.dump(results, f, indent=4, sort_keys=True)
+
+if __name__ == '__main__':
+	main()
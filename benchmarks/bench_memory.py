@@ -0,0 +1,107 @@
+#!/usr/bin/python
+#
+# Copyright (C) 2012 Unity Technologies Japan, G.K.
+#
+# Memory benchmark of StoreLicenseInfo.
+# Compares the compact representation with the previous dictionary based
+# one by measuring total size of all objects reachable from the features.
+#
+#   $> python benchmarks/bench_memory.py --features 10000 100000
+#
+
+import os
+import sys
+import argparse
+import gc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from storelicense import StoreLicenseInfo
+
+
+#
+# previous representation of StoreLicenseInfo, kept here as the baseline
+#
+class DictStoreLicenseInfo:
+	def __init__(self):
+		self.title = {}
+		self.description = {}
+		self.category = None
+		self.platform = {}
+		self.notes = {}
+
+		for key in StoreLicenseInfo.knownPlatforms:
+			self.platform[key] = False
+			self.notes[key] = ''
+
+
+#
+# total size of objects reachable from root, each object counted once
+#
+def DeepSizeOf(root):
+	seen = set()
+	total = 0
+	stack = [root]
+	while stack:
+		obj = stack.pop()
+		if id(obj) in seen:
+			continue
+		seen.add(id(obj))
+		total += sys.getsizeof(obj)
+		if isinstance(obj, dict):
+			stack.extend(obj.keys())
+			stack.extend(obj.values())
+		elif isinstance(obj, (list, tuple, set)):
+			stack.extend(obj)
+		if hasattr(obj, '__dict__'):
+			stack.append(obj.__dict__)
+		for slot in getattr(type(obj), '__slots__', ()):
+			if hasattr(obj, slot):
+				stack.append(getattr(obj, slot))
+	return total
+
+
+#
+# make features with the same contents as parsing sheets does: locale keys
+# and platform names come from separate strings for every row.
+#
+def MakeFeatures(cls, count, locales):
+	features = {}
+	for i in xrange(count):
+		obj = cls()
+		title = u'Feature {0}'.format(i)
+		for lang in locales:
+			lang = ''.join(list(lang))  # a new string like the one parsed from each row
+			obj.title[lang] = u'{0} ({1})'.format(title, lang)
+			obj.description[lang] = u'Description of {0} in {1}'.format(title, lang)
+		obj.category = u'general'
+		platform = {}
+		notes = {}
+		for n, key in enumerate(StoreLicenseInfo.knownPlatforms):
+			key = ''.join(list(key))
+			platform[key] = (i + n) % 3 == 0
+			notes[key] = u'' if (i + n) % 5 else u'note'
+		obj.platform = platform
+		obj.notes = notes
+		features[title] = obj
+	return features
+
+
+def main():
+	parser = argparse.ArgumentParser(description='measure memory used by StoreLicenseInfo.')
+	parser.add_argument('--features', type=int, nargs='+', default=[10000, 100000], help='number of features to measure.')
+	parser.add_argument('--locales', type=int, default=3, help='number of locales of each feature.')
+	args = parser.parse_args()
+
+	locales = ['en', 'ja', 'ko', 'zh', 'de', 'fr', 'es', 'it', 'ru', 'pt'][:args.locales]
+
+	print '{0:>10} {1:>16} {2:>16} {3:>8}'.format('features', 'dict (bytes)', 'compact (bytes)', 'saving')
+	for count in args.features:
+		gc.collect()
+		before = DeepSizeOf(MakeFeatures(DictStoreLicenseInfo, count, locales))
+		gc.collect()
+		after = DeepSizeOf(MakeFeatures(StoreLicenseInfo, count, locales))
+		print '{0:>10} {1:>16} {2:>16} {3:>7.1f}%'.format(count, before, after, 100.0 * (before - after) / before)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,76 @@
+#!/usr/bin/python
+#
+# Copyright (C) 2012 Unity Technologies Japan, G.K.
+#
+# Startup time of the offline commands of storelicense.py (validate, diff,
+# convert), which must not import gdata. each command is run repeatedly in a
+# new process on a synthetic json file, and the fastest and median wall
+# times are reported. 'python' (empty interpreter) and 'import gdata' are
+# measured for reference.
+#
+#   $> python benchmarks/bench_startup.py --features 100 --repeat 20
+#
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+benchDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, benchDir)
+
+import generator
+
+script = os.path.join(benchDir, '..', 'storelicense.py')
+
+
+#
+# list of wall times in seconds of running command repeat times
+#
+def Measure(command, repeat):
+	times = []
+	with open(os.devnull, 'wb') as devnull:
+		for i in range(repeat):
+			start = time.time()
+			subprocess.call(command, stdout=devnull)
+			times.append(time.time() - start)
+	return sorted(times)
+
+
+def main():
+	parser = argparse.ArgumentParser(description='measure startup time of offline commands of storelicense.py.')
+	parser.add_argument('--features', type=int, default=100, help='number of features in the json files.')
+	parser.add_argument('--locales', type=int, default=5, help='number of locales in the json files.')
+	parser.add_argument('--repeat', type=int, default=10, help='runs of each command.')
+	args = parser.parse_args()
+
+	workDir = tempfile.mkdtemp(prefix='storelicense-startup-')
+	try:
+		sheets = generator.GenerateDocument(args.features, args.locales)
+		old = os.path.join(workDir, 'old.json')
+		new = os.path.join(workDir, 'new.json')
+		with open(old, 'wb') as f:
+			generator.WriteUploadJSON(sheets, f, 0, 0, 0)
+		with open(new, 'wb') as f:
+			generator.WriteUploadJSON(sheets, f)
+
+		commands = [('python', [sys.executable, '-c', 'pass']),
+					('import gdata', [sys.executable, '-c', 'import gdata.spreadsheet.service']),
+					('validate', [sys.executable, script, 'validate', new]),
+					('diff', [sys.executable, script, 'diff', old, new]),
+					('convert', [sys.executable, script, 'convert', new, '--to', 'properties',
+								 '--output', os.path.join(workDir, 'properties')])]
+
+		print '{0} features, {1} locales, {2} runs each'.format(args.features, args.locales, args.repeat)
+		print '{0:<14} {1:>10} {2:>10}'.format('command', 'min(ms)', 'median(ms)')
+		for name, command in commands:
+			times = Measure(command, args.repeat)
+			print '{0:<14} {1:>10.1f} {2:>10.1f}'.format(name, times[0] * 1000, times[len(times) // 2] * 1000)
+	finally:
+		shutil.rmtree(workDir)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,172 @@
+#!/usr/bin/python
+#
+# Copyright (C) 2012 Unity Technologies Japan, G.K.
+#
+# End to end benchmark of storelicense.py against the fake spreadsheet
+# service in fakeserver.py, with a synthetic document from generator.py.
+# Each scenario runs in its own process on a fresh copy of the document,
+# and reports wall time, API calls made and peak memory (ru_maxrss).
+#
+#   scenarios:
+#     download : read all worksheets
+#     export   : read all worksheets and write json
+#     upload   : --upload a json file with some features changed
+#     fullsync : --upload --fullsync, also removing features
+#
+#   $> python benchmarks/bench_sync.py --features 2000 --locales 20 --latency 50
+#   $> python benchmarks/bench_sync.py --scenarios upload fullsync --batch
+#   $> python benchmarks/bench_sync.py --scenarios download fullsync --page-size 500
+#
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import resource
+import subprocess
+
+benchDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchDir, '..'))
+sys.path.insert(0, benchDir)
+
+import generator
+import fakeserver
+
+allScenarios = ['download', 'export', 'upload', 'fullsync']
+docKey = 'benchdoc'
+
+
+#
+# run one scenario in this process and write its result to args.result
+#
+def RunScenario(args):
+	from storelicense import StoreLicenseParser, GDataBackend, LocalBackend, RequestScheduler
+
+	start = time.time()
+	if args.local is not '':
+		backend = LocalBackend(args.local)
+	else:
+		backend = GDataBackend('bench@example.com', 'password', docKey, None,
+			fakeserver.FakeServerHttpClient(args.port), None, RequestScheduler(args.rate))
+	backend.pageSize = args.page_size
+	parser = StoreLicenseParser(None, None, docKey, args.jobs, args.batch, None, backend)
+
+	# upload prints a line for every row written
+	stdout = sys.stdout
+	sys.stdout = open(os.devnull, 'w')
+	try:
+		if args.scenario == 'download':
+			parser.LoadDocumentFromGoogleDocs()
+		elif args.scenario == 'export':
+			parser.LoadDocumentFromGoogleDocs()
+			with open(os.devnull, 'wb') as f:
+				parser.ExportSheet(f)
+		elif args.chunk_size > 0:
+			parser.UploadJSONFileInChunks(args.upload, args.scenario == 'fullsync', args.chunk_size)
+		else:
+			parser.LoadDocumentFromJSONFile(args.upload)
+			parser.UploadSheet(args.scenario == 'fullsync')
+	finally:
+		sys.stdout.close()
+		sys.stdout = stdout
+
+	result = {'wall': time.time() - start,
+			  'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+	with open(args.result, 'wb') as f:
+		json.dump(result, f)
+
+
+#
+# run scenario in a child process on a fresh document, returns result dictionary
+#
+def MeasureScenario(scenario, sheets, args, workDir):
+	resultPath = os.path.join(workDir, scenario + '.result')
+	command = [sys.executable, os.path.abspath(__file__), '--scenario', scenario, '--result', resultPath,
+			   '--upload', os.path.join(workDir, 'upload.json'), '--jobs', str(args.jobs),
+			   '--chunk-size', str(args.chunk_size), '--page-size', str(args.page_size), '--rate', str(args.rate)]
+	if args.batch:
+		command.append('--batch')
+
+	server = None
+	if args.backend == 'local':
+		localDir = os.path.join(workDir, scenario)
+		generator.WriteCSVDirectory(sheets, localDir)
+		command += ['--local', localDir]
+	else:
+		server = fakeserver.FakeServer(0, args.latency / 1000.0, None, args.quota, args.error_rate, args.lost_rate)
+		# keep some empty rows at the bottom like a real sheet, for --batch inserts
+		server.store.AddDocument(docKey, sheets, len(sheets[0][2]) // 10)
+		server.Start()
+		command += ['--port', str(server.port)]
+
+	try:
+		subprocess.check_call(command)
+		with open(resultPath, 'rb') as f:
+			result = json.load(f)
+	finally:
+		if server is not None:
+			server.shutdown()
+			server.server_close()
+
+	result['scenario'] = scenario
+	if server is not None:
+		result.update(server.store.Counters())
+	return result
+
+
+def main():
+	parser = argparse.ArgumentParser(description='benchmark storelicense.py against a fake spreadsheet service.')
+	parser.add_argument('--features', type=int, default=1000, help='number of features in the document.')
+	parser.add_argument('--locales', type=int, default=20, help='number of locale sheets.')
+	parser.add_argument('--notes-density', type=float, default=0.1, help='ratio of non-empty notes.')
+	parser.add_argument('--latency', type=float, default=0, help='latency added to every request in milliseconds.')
+	parser.add_argument('--scenarios', nargs='+', choices=allScenarios, default=allScenarios, help='scenarios to run.')
+	parser.add_argument('--backend', choices=['gdata', 'local'], default='gdata', help='run against the fake service or local csv files.')
+	parser.add_argument('--jobs', type=int, default=1, help='passed to storelicense.py --jobs.')
+	parser.add_argument('--batch', action='store_true', help='passed to storelicense.py --batch.')
+	parser.add_argument('--chunk-size', type=int, default=0, help='passed to storelicense.py --chunk-size.')
+	parser.add_argument('--page-size', type=int, default=0, help='passed to storelicense.py --page-size.')
+	parser.add_argument('--rate', type=float, default=0, help='passed to storelicense.py --rate.')
+	parser.add_argument('--quota', type=float, default=0, help='requests per second the fake service accepts before answering 429.')
+	parser.add_argument('--error-rate', type=float, default=0, help='ratio of requests the fake service fails with 503.')
+	parser.add_argument('--lost-rate', type=float, default=0, help='ratio of writes the fake service applies but answers with 500.')
+	parser.add_argument('--json', default='', help='also write results to given json file.')
+	# used by child processes
+	parser.add_argument('--scenario', help=argparse.SUPPRESS)
+	parser.add_argument('--result', help=argparse.SUPPRESS)
+	parser.add_argument('--port', type=int, default=0, help=argparse.SUPPRESS)
+	parser.add_argument('--upload', default='', help=argparse.SUPPRESS)
+	parser.add_argument('--local', default='', help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.scenario:
+		RunScenario(args)
+		return
+
+	sheets = generator.GenerateDocument(args.features, args.locales, args.notes_density)
+	workDir = tempfile.mkdtemp(prefix='storelicense-bench-')
+	try:
+		with open(os.path.join(workDir, 'upload.json'), 'wb') as f:
+			generator.WriteUploadJSON(sheets, f)
+
+		print '{0} features, {1} locales, latency {2}ms, backend {3}'.format(
+			args.features, args.locales, args.latency, args.backend)
+		print '{0:<10} {1:>10} {2:>10} {3:>12}'.format('scenario', 'wall(s)', 'api calls', 'peak mem(MB)')
+		results = []
+		for scenario in args.scenarios:
+			result = MeasureScenario(scenario, sheets, args, workDir)
+			results.append(result)
+			print '{0:<10} {1:>10.2f} {2:>10} {3:>12.1f}'.format(
+				scenario, result['wall'], result.get('total_calls', '-'), result['maxrss_kb'] / 1024.0)
+	finally:
+		shutil.rmtree(workDir)
+
+	if args.json is not '':
+		with open(args.json, 'wb') as f:
+			json.dump(results, f, indent=4, sort_keys=True)
+
+if __name__ == '__main__':
+	main()
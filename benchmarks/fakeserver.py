@@ -0,0 +1,521 @@
+#!/usr/bin/python
+#
+# Copyright (C) 2012 Unity Technologies Japan, G.K.
+#
+# Local stand-in for the Google Spreadsheets API, speaking enough of the
+# worksheets / list / cells feed protocol for storelicense.py:
+#
+#   POST   /accounts/ClientLogin
+#   GET    /feeds/worksheets/<key>/private/full
+#   GET    /feeds/list/<key>/<wksht>/private/full    (start-index, max-results, sq)
+#   POST   /feeds/list/<key>/<wksht>/private/full
+#   PUT    /feeds/list/<key>/<wksht>/private/full/<row>/<version>
+#   DELETE /feeds/list/<key>/<wksht>/private/full/<row>/<version>
+#   GET    /feeds/cells/<key>/<wksht>/private/full   (min/max-row/col, return-empty)
+#   POST   /feeds/cells/<key>/<wksht>/private/full/batch
+#
+# every request can be delayed by an artificial latency, and the server
+# counts requests and bytes so benchmarks can report API usage.
+# feed requests need an auth token issued by ClientLogin, else they get 401;
+# FakeStore.RevokeTokens() makes all issued tokens invalid.
+#
+# throttling can be injected to test retries:
+#   quota     : requests per second; requests over it get 429
+#   errorRate : ratio of requests failing with 503, not applied
+#   lostRate  : ratio of writes applied but answered with 500
+#
+#   $> python benchmarks/fakeserver.py --port 8080 --latency 100 --features 1000
+#   $> python benchmarks/fakeserver.py --port 8080 --quota 10 --error-rate 0.05 --lost-rate 0.02
+#
+
+import os
+import sys
+import re
+import time
+import json
+import random
+import argparse
+import threading
+import urlparse
+import BaseHTTPServer
+import SocketServer
+from xml.sax.saxutils import escape, quoteattr
+
+try:
+	from xml.etree import cElementTree as ElementTree
+except ImportError:
+	from xml.etree import ElementTree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import atom.url
+from storelicense import PooledHttpClient
+
+ATOM_NS = 'http://www.w3.org/2005/Atom'
+GSX_NS = 'http://schemas.google.com/spreadsheets/2006/extended'
+GS_NS = 'http://schemas.google.com/spreadsheets/2006'
+BATCH_NS = 'http://schemas.google.com/gdata/batch'
+GD_NS = 'http://schemas.google.com/g/2005'
+
+# urls in feeds always point to the real service; FakeServerHttpClient sends
+# them to the fake server
+SERVICE_URL = 'https://spreadsheets.google.com'
+
+FEED_HEADER = ('<?xml version="1.0" encoding="UTF-8"?>'
+	'<feed xmlns="{0}" xmlns:gsx="{1}" xmlns:gs="{2}" xmlns:batch="{3}" xmlns:gd="{4}" '
+	'xmlns:openSearch="http://a9.com/-/spec/opensearchrss/1.0/">').format(
+	ATOM_NS, GSX_NS, GS_NS, BATCH_NS, GD_NS)
+
+
+#
+# one worksheet: grid of cells, first row is the header.
+# rows below the data are kept empty up to rowCount, like a real sheet.
+#
+class FakeWorksheet:
+	def __init__(self, wksht_id, name, header, rows, rowCount=None):
+		self.wksht_id = wksht_id
+		self.name = name
+		self.grid = [list(header)]
+		self.grid += [[row.get(col, u'') for col in self.Columns()] for row in rows]
+		self.rowIds = [None] + range(1, len(rows) + 1)  # list feed id of each grid row
+		self.nextRowId = len(rows) + 1
+		self.versions = {}  # row id:version
+		self.version = 1  # version of whole worksheet, used for updated
+		rowCount = max(rowCount or 0, len(self.grid))
+		while len(self.grid) < rowCount:
+			self._AppendEmptyRow()
+
+	def _AppendEmptyRow(self):
+		self.grid.append([u''] * len(self.grid[0]))
+		self.rowIds.append(None)
+
+	def Columns(self):
+		return [re.sub(r'[^a-z0-9\-\.]', '', text.lower()) for text in self.grid[0]]
+
+	def Updated(self):
+		return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(1325376000 + self.version)) + '.000Z'
+
+	def Touch(self):
+		self.version += 1
+
+	#
+	# grid index of data rows as seen from list feed: stops at first empty row
+	#
+	def DataRows(self):
+		indexes = []
+		for i in range(1, len(self.grid)):
+			if not any(self.grid[i]):
+				break
+			if self.rowIds[i] is None:
+				self.rowIds[i] = self.nextRowId
+				self.nextRowId += 1
+			indexes.append(i)
+		return indexes
+
+	def IndexOfRow(self, rowId):
+		for i in self.DataRows():
+			if self.rowIds[i] == rowId:
+				return i
+		return None
+
+	def SetRow(self, index, values):
+		columns = self.Columns()
+		self.grid[index] = [values.get(col, u'') if col else self.grid[index][n] for n, col in enumerate(columns)]
+		self.versions[self.rowIds[index]] = self.versions.get(self.rowIds[index], 1) + 1
+		self.Touch()
+
+	def InsertRow(self, values):
+		data = self.DataRows()
+		index = (data[-1] if data else 0) + 1  # first empty row
+		if index == len(self.grid):
+			self._AppendEmptyRow()
+		self.rowIds[index] = self.nextRowId
+		self.nextRowId += 1
+		self.SetRow(index, values)
+		return index
+
+	def DeleteRow(self, index):
+		del self.grid[index]
+		del self.rowIds[index]
+		self.Touch()
+
+	def SetCell(self, row, col, value):
+		while len(self.grid) < row:
+			self._AppendEmptyRow()
+		while len(self.grid[0]) < col:
+			for cells in self.grid:
+				cells.append(u'')
+		self.grid[row - 1][col - 1] = value
+		self.Touch()
+
+
+#
+# documents served by FakeServer, and counters of requests
+#
+class FakeStore:
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.documents = {}  # doc key:list of FakeWorksheet
+		self.calls = {}  # request kind:count
+		self.connections = 0
+		self.bytesIn = 0
+		self.bytesOut = 0
+		self.tokens = set()  # auth tokens issued by ClientLogin
+		self.nextToken = 1
+
+	#
+	# add document made by generator.GenerateDocument
+	#
+	def AddDocument(self, doc_key, sheets, spareRows=0):
+		worksheets = []
+		for i, (name, header, rows) in enumerate(sheets):
+			worksheets.append(FakeWorksheet('od{0}'.format(i + 1), name, header, rows, len(rows) + 1 + spareRows))
+		self.documents[doc_key] = worksheets
+
+	def Worksheet(self, doc_key, wksht_id):
+		for sheet in self.documents[doc_key]:
+			if sheet.wksht_id == wksht_id:
+				return sheet
+		raise KeyError(wksht_id)
+
+	def IssueToken(self):
+		token = 'fake-auth-token-{0}'.format(self.nextToken)
+		self.nextToken += 1
+		self.tokens.add(token)
+		return token
+
+	def RevokeTokens(self):
+		with self.lock:
+			self.tokens.clear()
+
+	def Count(self, kind, bytesIn, bytesOut):
+		with self.lock:
+			self.calls[kind] = self.calls.get(kind, 0) + 1
+			self.bytesIn += bytesIn
+			self.bytesOut += bytesOut
+
+	def ResetCounters(self):
+		with self.lock:
+			self.calls = {}
+			self.connections = 0
+			self.bytesIn = 0
+			self.bytesOut = 0
+
+	def Counters(self):
+		with self.lock:
+			return {'calls': dict(self.calls), 'total_calls': sum(self.calls.values()),
+				'connections': self.connections, 'bytes_in': self.bytesIn, 'bytes_out': self.bytesOut}
+
+	#
+	# contents of document as { worksheet name : list of { column : text } }
+	#
+	def Snapshot(self, doc_key):
+		with self.lock:
+			result = {}
+			for sheet in self.documents[doc_key]:
+				columns = sheet.Columns()
+				result[sheet.name] = [dict([(col, sheet.grid[i][n]) for n, col in enumerate(columns) if col])
+					for i in sheet.DataRows()]
+			return result
+
+
+class FakeRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	# keep connections open between requests, like the real service
+	protocol_version = 'HTTP/1.1'
+	disable_nagle_algorithm = True
+
+	def setup(self):
+		BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+		with self.server.store.lock:
+			self.server.store.connections += 1
+
+	def log_message(self, format, *args):
+		pass
+
+	def do_GET(self):
+		self._Handle('GET')
+
+	def do_POST(self):
+		self._Handle('POST')
+
+	def do_PUT(self):
+		self._Handle('PUT')
+
+	def do_DELETE(self):
+		self._Handle('DELETE')
+
+	def _Handle(self, method):
+		server = self.server
+		length = int(self.headers.get('Content-Length') or 0)
+		body = self.rfile.read(length) if length else ''
+		if server.latency:
+			time.sleep(server.latency)
+
+		url = urlparse.urlparse(self.path)
+		query = dict(urlparse.parse_qsl(url.query))
+		parts = url.path.strip('/').split('/')
+		kind = '{0} {1}'.format(method, parts[1] if len(parts) > 1 and parts[0] == 'feeds' else parts[-1])
+
+		status, headers, response = server.Intercept(self, method, kind)
+		if status is None:
+			try:
+				with server.store.lock:
+					status, headers, response = self._Dispatch(method, parts, query, body)
+			except KeyError, e:
+				status, headers, response = 404, {}, 'Not found: {0}'.format(e)
+			if method != 'GET' and parts[0] == 'feeds' and server.Chance(server.lostRate):
+				status, headers, response = 500, {}, 'Internal error (request was applied)'
+		server.store.Count(kind, len(body), len(response))
+
+		self.send_response(status)
+		for key in headers:
+			self.send_header(key, headers[key])
+		self.send_header('Content-Length', str(len(response)))
+		self.end_headers()
+		self.wfile.write(response)
+
+	def _Dispatch(self, method, parts, query, body):
+		store = self.server.store
+		if parts == ['accounts', 'ClientLogin']:
+			return 200, {'Content-Type': 'text/plain'}, 'SID=fake\nLSID=fake\nAuth={0}\n'.format(store.IssueToken())
+
+		if parts[0] != 'feeds' or len(parts) < 5:
+			return 404, {}, ''
+		auth = self.headers.get('Authorization', '')
+		if auth[len('GoogleLogin auth='):] not in store.tokens:
+			return 401, {}, 'Token invalid'
+
+		feed = parts[1]
+		doc_key = parts[2]
+		if feed == 'worksheets':
+			return self._Worksheets(doc_key)
+
+		sheet = store.Worksheet(doc_key, parts[3])
+		rest = parts[6:]
+		if feed == 'list':
+			if method == 'GET' and not rest:
+				return self._ListFeed(doc_key, sheet, query)
+			if method == 'POST':
+				index = sheet.InsertRow(self._ParseListEntry(body))
+				return 201, {'Content-Type': 'application/atom+xml'}, self._ListEntry(doc_key, sheet, index, True)
+			index = sheet.IndexOfRow(int(rest[0]))
+			if index is None:
+				return 404, {}, 'Row not found'
+			if method == 'GET':
+				return 200, {'Content-Type': 'application/atom+xml'}, self._ListEntry(doc_key, sheet, index, True)
+			if len(rest) > 1 and int(rest[1]) != sheet.versions.get(sheet.rowIds[index], 1):
+				return 409, {}, 'Version conflict'
+			if method == 'PUT':
+				sheet.SetRow(index, self._ParseListEntry(body))
+				return 200, {'Content-Type': 'application/atom+xml'}, self._ListEntry(doc_key, sheet, index, True)
+			if method == 'DELETE':
+				sheet.DeleteRow(index)
+				return 200, {}, ''
+
+		if feed == 'cells':
+			if method == 'GET':
+				return self._CellsFeed(doc_key, sheet, query)
+			if method == 'POST' and rest == ['batch']:
+				return self._CellsBatch(doc_key, sheet, body)
+
+		return 404, {}, ''
+
+	def _Worksheets(self, doc_key):
+		worksheets = self.server.store.documents[doc_key]
+		out = [FEED_HEADER]
+		for sheet in worksheets:
+			url = '{0}/feeds/worksheets/{1}/private/full/{2}'.format(SERVICE_URL, doc_key, sheet.wksht_id)
+			out.append(u'<entry><id>{0}</id><updated>{1}</updated><title type="text">{2}</title>'
+				u'<link rel="edit" type="application/atom+xml" href="{0}/{5}"/>'
+				u'<gs:rowCount>{3}</gs:rowCount><gs:colCount>{4}</gs:colCount></entry>'.format(
+				url, sheet.Updated(), escape(sheet.name), len(sheet.grid), len(sheet.grid[0]), sheet.version))
+		out.append(u'</feed>')
+		return 200, {'Content-Type': 'application/atom+xml'}, u''.join(out).encode('utf-8')
+
+	def _ListFeed(self, doc_key, sheet, query):
+		indexes = sheet.DataRows()
+		if 'sq' in query:
+			indexes = self._Select(sheet, indexes, query['sq'])
+		total = len(indexes)
+		start = int(query.get('start-index', 1))
+		indexes = indexes[start - 1:]
+		if 'max-results' in query:
+			indexes = indexes[:int(query['max-results'])]
+		out = [FEED_HEADER,
+			u'<updated>{0}</updated><openSearch:totalResults>{1}</openSearch:totalResults>'
+			u'<openSearch:startIndex>{2}</openSearch:startIndex>'.format(sheet.Updated(), total, start)]
+		for index in indexes:
+			out.append(self._ListEntry(doc_key, sheet, index, False))
+		out.append(u'</feed>')
+		return 200, {'Content-Type': 'application/atom+xml'}, u''.join(out).encode('utf-8')
+
+	#
+	# rows matching structured query; only equality of columns joined with
+	# 'or' is supported: title = "A" or title = "B"
+	#
+	def _Select(self, sheet, indexes, sq):
+		terms = re.findall(r'([a-z0-9\-\.]+)\s*=\s*"([^"]*)"', sq)
+		if not terms or re.sub(r'[a-z0-9\-\.]+\s*=\s*"[^"]*"', '', sq).replace('or', '').strip():
+			raise KeyError('unsupported query: ' + sq)
+		columns = sheet.Columns()
+		wanted = [(columns.index(col), value.decode('utf-8')) for col, value in terms if col in columns]
+		return [index for index in indexes if [1 for n, value in wanted if sheet.grid[index][n] == value]]
+
+	def _ListEntry(self, doc_key, sheet, index, isDocument):
+		rowId = sheet.rowIds[index]
+		url = '{0}/feeds/list/{1}/{2}/private/full/{3}'.format(SERVICE_URL, doc_key, sheet.wksht_id, rowId)
+		out = []
+		if isDocument:
+			out.append(u'<?xml version="1.0" encoding="UTF-8"?><entry xmlns="{0}" xmlns:gsx="{1}">'.format(ATOM_NS, GSX_NS))
+		else:
+			out.append(u'<entry>')
+		out.append(u'<id>{0}</id><updated>{1}</updated>'
+			u'<link rel="self" type="application/atom+xml" href="{0}"/>'
+			u'<link rel="edit" type="application/atom+xml" href="{0}/{2}"/>'.format(
+			url, sheet.Updated(), sheet.versions.get(rowId, 1)))
+		for n, col in enumerate(sheet.Columns()):
+			if col:
+				out.append(u'<gsx:{0}>{1}</gsx:{0}>'.format(col, escape(sheet.grid[index][n])))
+		out.append(u'</entry>')
+		text = u''.join(out)
+		return text.encode('utf-8') if isDocument else text
+
+	def _ParseListEntry(self, body):
+		values = {}
+		for element in ElementTree.fromstring(body):
+			if element.tag.startswith('{' + GSX_NS + '}'):
+				text = element.text or u''
+				values[element.tag[len(GSX_NS) + 2:]] = text if isinstance(text, unicode) else text.decode('utf-8')
+		return values
+
+	def _CellsFeed(self, doc_key, sheet, query):
+		minRow = int(query.get('min-row', 1))
+		maxRow = int(query.get('max-row', len(sheet.grid)))
+		minCol = int(query.get('min-col', 1))
+		maxCol = int(query.get('max-col', len(sheet.grid[0])))
+		returnEmpty = query.get('return-empty') == 'true'
+		base = '{0}/feeds/cells/{1}/{2}/private/full'.format(SERVICE_URL, doc_key, sheet.wksht_id)
+		out = [FEED_HEADER,
+			u'<link rel="http://schemas.google.com/g/2005#batch" type="application/atom+xml" href="{0}/batch"/>'.format(base)]
+		for row in range(minRow, min(maxRow, len(sheet.grid)) + 1):
+			for col in range(minCol, min(maxCol, len(sheet.grid[0])) + 1):
+				value = sheet.grid[row - 1][col - 1]
+				if not value and not returnEmpty:
+					continue
+				out.append(u'<entry><id>{0}/R{1}C{2}</id>'
+					u'<link rel="edit" type="application/atom+xml" href="{0}/R{1}C{2}/1"/>'
+					u'<gs:cell row="{1}" col="{2}" inputValue={3}>{4}</gs:cell></entry>'.format(
+					base, row, col, quoteattr(value), escape(value)))
+		out.append(u'</feed>')
+		return 200, {'Content-Type': 'application/atom+xml'}, u''.join(out).encode('utf-8')
+
+	def _CellsBatch(self, doc_key, sheet, body):
+		out = [FEED_HEADER]
+		for entry in ElementTree.fromstring(body).findall('{' + ATOM_NS + '}entry'):
+			batchId = entry.find('{' + BATCH_NS + '}id')
+			cell = entry.find('{' + GS_NS + '}cell')
+			value = cell.get('inputValue') or u''
+			if not isinstance(value, unicode):
+				value = value.decode('utf-8')
+			sheet.SetCell(int(cell.get('row')), int(cell.get('col')), value)
+			out.append(u'<entry><batch:id>{0}</batch:id><batch:operation type="update"/>'
+				u'<batch:status code="200" reason="Success"/>'
+				u'<gs:cell row="{1}" col="{2}" inputValue={3}/></entry>'.format(
+				escape(batchId.text if batchId is not None else u''), cell.get('row'), cell.get('col'), quoteattr(value)))
+		out.append(u'</feed>')
+		return 200, {'Content-Type': 'application/atom+xml'}, u''.join(out).encode('utf-8')
+
+
+class FakeServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+	def __init__(self, port=0, latency=0.0, store=None, quota=0, errorRate=0.0, lostRate=0.0, seed=0):
+		BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), FakeRequestHandler)
+		self.store = store or FakeStore()
+		self.latency = latency  # seconds added to every request
+		self.quota = float(quota)  # requests per second, 0 for no quota
+		self.errorRate = errorRate
+		self.lostRate = lostRate
+		self.random = random.Random(seed)
+		self.lock = threading.Lock()
+		self.tokens = self.quota
+		self.lastFill = time.time()
+
+	@property
+	def port(self):
+		return self.server_address[1]
+
+	def Chance(self, rate):
+		with self.lock:
+			return rate > 0 and self.random.random() < rate
+
+	#
+	# hook to answer a request without touching the store.
+	# returns (status, headers, body), or (None, None, None) to handle it normally.
+	# by default injects quota and error responses.
+	#
+	def Intercept(self, handler, method, kind):
+		if self.quota > 0:
+			with self.lock:
+				now = time.time()
+				self.tokens = min(self.quota, self.tokens + (now - self.lastFill) * self.quota)
+				self.lastFill = now
+				if self.tokens < 1:
+					return 429, {}, 'Rate limit exceeded'
+				self.tokens -= 1
+		if kind != 'POST ClientLogin' and self.Chance(self.errorRate):
+			return 503, {}, 'Service unavailable'
+		return None, None, None
+
+	def Start(self):
+		thread = threading.Thread(target=self.serve_forever)
+		thread.daemon = True
+		thread.start()
+		return self
+
+
+#
+# atom http client sending every request to the fake server instead of
+# Google. use as GDataBackend(..., http_client=FakeServerHttpClient(port)).
+#
+class FakeServerHttpClient(PooledHttpClient):
+	def __init__(self, port, host='127.0.0.1'):
+		PooledHttpClient.__init__(self)
+		self.host = host
+		self.port = port
+
+	def request(self, operation, url, data=None, headers=None):
+		if not isinstance(url, atom.url.Url):
+			url = atom.url.parse_url(url)
+		url = atom.url.Url(protocol='http', host=self.host, port=self.port, path=url.path, params=url.params)
+		return PooledHttpClient.request(self, operation, url, data=data, headers=headers)
+
+
+def main():
+	sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+	import generator
+
+	parser = argparse.ArgumentParser(description='serve a synthetic store document with a fake spreadsheet service.')
+	parser.add_argument('--port', type=int, default=8080, help='port to listen on.')
+	parser.add_argument('--latency', type=float, default=0, help='latency added to every request in milliseconds.')
+	parser.add_argument('--key', default='fakedoc', help='document key of the served document.')
+	parser.add_argument('--features', type=int, default=1000, help='number of features in the document.')
+	parser.add_argument('--locales', type=int, default=20, help='number of locale sheets.')
+	parser.add_argument('--notes-density', type=float, default=0.1, help='ratio of non-empty notes.')
+	parser.add_argument('--quota', type=float, default=0, help='requests per second, over which requests get 429.')
+	parser.add_argument('--error-rate', type=float, default=0, help='ratio of requests failing with 503.')
+	parser.add_argument('--lost-rate', type=float, default=0, help='ratio of writes applied but answered with 500.')
+	args = parser.parse_args()
+
+	server = FakeServer(args.port, args.latency / 1000.0, None, args.quota, args.error_rate, args.lost_rate)
+	server.store.AddDocument(args.key, generator.GenerateDocument(args.features, args.locales, args.notes_density))
+	print 'serving {0} on 127.0.0.1:{1}'.format(args.key, server.port)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	print json.dumps(server.store.Counters(), indent=4)
+
+if __name__ == '__main__':
+	main()
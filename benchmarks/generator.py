@@ -0,0 +1,156 @@
+#!/usr/bin/python
+#
+# Copyright (C) 2012 Unity Technologies Japan, G.K.
+#
+# Synthetic store documents for benchmarks, with the same worksheet layout as
+# the real one: default, platform, notes, how to use and one sheet per locale.
+#
+#   $> python benchmarks/generator.py --features 5000 --locales 30 --csv ./mystore --json ./mystore.json
+#
+
+import os
+import sys
+import csv
+import json
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from storelicense import StoreLicenseInfo
+
+knownLocales = ['ja', 'ko', 'zh-cn', 'zh-tw', 'de', 'fr', 'es', 'it', 'pt', 'ru',
+				'nl', 'sv', 'pl', 'tr', 'da', 'fi', 'no', 'cs', 'hu', 'th']
+
+categories = ['general', 'graphics', 'audio', 'physics', 'scripting', 'networking', 'editor']
+
+words = ['unity', 'engine', 'render', 'shader', 'light', 'shadow', 'mesh', 'terrain',
+		 'audio', 'physics', 'cloth', 'script', 'asset', 'build', 'profiler', 'network']
+
+
+#
+# names of count locales; locale names only use letters like real ones
+#
+def LocaleNames(count):
+	names = knownLocales[:count]
+	i = 0
+	while len(names) < count:
+		names.append('x' + chr(ord('a') + i // 26 % 26) + chr(ord('a') + i % 26))
+		i += 1
+	return names
+
+
+def _Sentence(rand, count):
+	return u' '.join([rand.choice(words) for i in range(count)])
+
+
+#
+# document as list of (worksheet name, header, rows), each row a dictionary
+# { list feed column name : text }.
+#   notesDensity: ratio of non-empty cells in notes sheet
+#
+def GenerateDocument(features, locales, notesDensity=0.1, seed=0):
+	rand = random.Random(seed)
+	platforms = StoreLicenseInfo.knownPlatforms
+	default = []
+	platform = []
+	notes = []
+	titles = []
+	for i in range(features):
+		title = u'Feature {0:06d} {1}'.format(i, _Sentence(rand, 2))
+		titles.append(title)
+		default.append({'title': title,
+			'description': _Sentence(rand, 12) + u' <a href=\'http://unity3d.com/\'>Read more</a>',
+			'category': rand.choice(categories)})
+		row = {'ref-title': title}
+		for key in platforms:
+			row[key] = u'check' if rand.random() < 0.7 else u''
+		platform.append(row)
+		row = {'ref-title': title}
+		for key in platforms:
+			row[key] = _Sentence(rand, 3) if rand.random() < notesDensity else u''
+		notes.append(row)
+
+	sheets = [('default', ['Title', 'Description', 'Category'], default),
+			  ('platform', ['Ref-Title'] + platforms, platform),
+			  ('notes', ['Ref-Title'] + platforms, notes),
+			  ('how to use', ['Text'], [{'text': u'Edit default sheet first.'}])]
+	for lang in LocaleNames(locales):
+		rows = [{'ref-title': title, 'title': u'[{0}] {1}'.format(lang, title),
+				 'description': u'[{0}] {1}'.format(lang, _Sentence(rand, 12))} for title in titles]
+		sheets.append((lang, ['Ref-Title', 'Title', 'Description'], rows))
+	return sheets
+
+
+#
+# json file for --upload made from document, with some features changed:
+#   modified: ratio of features with new description
+#   removed: ratio of features left out (removed by --fullsync)
+#   added: ratio of new features
+#
+def WriteUploadJSON(sheets, out, modified=0.05, removed=0.02, added=0.02, seed=1):
+	rand = random.Random(seed)
+	platforms = StoreLicenseInfo.knownPlatforms
+	byName = dict([(name, rows) for name, header, rows in sheets])
+	locales = [name for name, header, rows in sheets[4:]]
+
+	features = []
+	for i, row in enumerate(byName['default']):
+		if rand.random() < removed:
+			continue
+		feature = {'title': row['title'], 'description': row['description'], 'category': row['category'],
+				   'platform': [byName['platform'][i][key] for key in platforms],
+				   'notes': [byName['notes'][i][key] for key in platforms]}
+		for lang in locales:
+			feature['title_' + lang] = byName[lang][i]['title']
+			feature['description_' + lang] = byName[lang][i]['description']
+		if rand.random() < modified:
+			feature['description'] = _Sentence(rand, 12)
+		features.append(feature)
+
+	for i in range(int(len(byName['default']) * added)):
+		title = u'New Feature {0:06d}'.format(i)
+		feature = {'title': title, 'description': _Sentence(rand, 12), 'category': rand.choice(categories),
+				   'platform': [u'check'] * len(platforms), 'notes': [u''] * len(platforms)}
+		for lang in locales:
+			feature['title_' + lang] = u'[{0}] {1}'.format(lang, title)
+			feature['description_' + lang] = u'[{0}] {1}'.format(lang, feature['description'])
+		features.append(feature)
+
+	json.dump({'features': features}, out, sort_keys=True, indent=4)
+
+
+#
+# write document as directory of csv files for LocalBackend
+#
+def WriteCSVDirectory(sheets, path):
+	if not os.path.isdir(path):
+		os.makedirs(path)
+	for name, header, rows in sheets:
+		columns = [text.lower() for text in header]
+		with open(os.path.join(path, name + '.csv'), 'wb') as f:
+			writer = csv.writer(f)
+			writer.writerow(header)
+			for row in rows:
+				writer.writerow([row.get(col, u'').encode('utf-8') for col in columns])
+
+
+def main():
+	parser = argparse.ArgumentParser(description='generate synthetic store document.')
+	parser.add_argument('--features', type=int, default=1000, help='number of features.')
+	parser.add_argument('--locales', type=int, default=20, help='number of locale sheets.')
+	parser.add_argument('--notes-density', type=float, default=0.1, help='ratio of non-empty notes.')
+	parser.add_argument('--seed', type=int, default=0, help='random seed.')
+	parser.add_argument('--csv', default='', help='write document as csv directory for local backend.')
+	parser.add_argument('--json', default='', help='write json file to upload, with some features changed.')
+	args = parser.parse_args()
+
+	sheets = GenerateDocument(args.features, args.locales, args.notes_density, args.seed)
+	if args.csv is not '':
+		WriteCSVDirectory(sheets, args.csv)
+	if args.json is not '':
+		with open(args.json, 'wb') as f:
+			WriteUploadJSON(sheets, f)
+
+if __name__ == '__main__':
+	main()
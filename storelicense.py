@@ -30,48 +30,338 @@ try:
 	from xml.etree import ElementTree
 except ImportError:
 	from elementtree import ElementTree
+try:
+	from xml.etree import cElementTree
+except ImportError:
+	cElementTree = ElementTree
 
-import gdata.spreadsheet.service
-import gdata.service
-import atom.service
-import gdata.spreadsheet
-import atom
 import getopt
 import sys
 import string
 import argparse
 import json
-import fileinput
 import re
+import codecs
+import os
+import hashlib
+import threading
+import csv
+import collections
+import contextlib
+import time
+import random
+import copy
+import Queue
+from multiprocessing.pool import ThreadPool
 
 g_charcode = 'utf-8'
 
 
+#
+# gdata, atom and the network modules are imported only by commands that
+# talk to Google Docs, so offline commands (validate, diff, convert) start
+# quickly and also work where gdata is not installed.
+#
+def ImportGData():
+	global gdata, atom, httplib, socket
+	import gdata.spreadsheet.service
+	import gdata.service
+	import gdata.spreadsheet
+	import atom.service
+	import atom.http
+	import httplib
+	import socket
+
+
+# json string literal of text, as json.dumps writes it (c encoder when available)
+g_encodeJSONString = json.encoder.encode_basestring_ascii
+
+# compact json of a value, for hashing. dictionaries are given as sorted
+# lists of items: with sort_keys json uses its slow python encoder
+g_encodeJSON = json.JSONEncoder(separators=(',', ':')).encode
+
+# one shared instance of each locale key string (see LocaleDict)
+g_localeKeys = {}
+
+
+#
+# dictionary {locale : text} which keeps a single shared instance of each
+# locale key, so thousands of features do not hold their own copies of 'en', 'ja', ...
+# isChanged is set by every change, and cleared by StoreLicenseInfo when it
+# drops its cached fragments (see StoreLicenseInfo.Fragment).
+#
+class LocaleDict(dict):
+	__slots__ = ('isChanged',)
+
+	def __init__(self, texts=()):
+		dict.__init__(self)
+		self.isChanged = False
+		self.update(texts)
+
+	def __setitem__(self, key, value):
+		dict.__setitem__(self, g_localeKeys.setdefault(key, key), value)
+		self.isChanged = True
+
+	def __delitem__(self, key):
+		dict.__delitem__(self, key)
+		self.isChanged = True
+
+	def update(self, *args, **kwargs):
+		for key, value in dict(*args, **kwargs).iteritems():
+			self[key] = value
+
+	def setdefault(self, key, value=None):
+		if key not in self:
+			self[key] = value
+		return self[key]
+
+	def pop(self, *args):
+		self.isChanged = True
+		return dict.pop(self, *args)
+
+	def popitem(self):
+		self.isChanged = True
+		return dict.popitem(self)
+
+	def clear(self):
+		self.isChanged = True
+		dict.clear(self)
+
+
+#
+# dictionary-like view of StoreLicenseInfo.platform.
+# flags are stored as a bitmask in the order of StoreLicenseInfo.knownPlatforms.
+#
+class PlatformFlags(object):
+	__slots__ = ('_owner',)
+
+	def __init__(self, owner):
+		self._owner = owner
+
+	def __getitem__(self, key):
+		return bool(self._owner._platformBits & (1 << StoreLicenseInfo.platformIndex[key]))
+
+	def __setitem__(self, key, value):
+		bit = 1 << StoreLicenseInfo.platformIndex[key]
+		if value:
+			self._owner._platformBits |= bit
+		else:
+			self._owner._platformBits &= ~bit
+		self._owner._Changed()
+
+	def __contains__(self, key):
+		return key in StoreLicenseInfo.platformIndex
+
+	def __iter__(self):
+		return iter(StoreLicenseInfo.knownPlatforms)
+
+	def __len__(self):
+		return len(StoreLicenseInfo.knownPlatforms)
+
+	def __eq__(self, other):
+		return dict(self.items()) == dict(other.items())
+
+	def __ne__(self, other):
+		return not self == other
+
+	def __repr__(self):
+		return repr(dict(self.items()))
+
+	def get(self, key, default=None):
+		return self[key] if key in self else default
+
+	def keys(self):
+		return list(StoreLicenseInfo.knownPlatforms)
+
+	def items(self):
+		return [(key, self[key]) for key in StoreLicenseInfo.knownPlatforms]
+
+
+#
+# dictionary-like view of StoreLicenseInfo.notes.
+# notes are stored in a fixed size list in the order of StoreLicenseInfo.knownPlatforms.
+#
+class PlatformNotes(object):
+	__slots__ = ('_owner',)
+
+	def __init__(self, owner):
+		self._owner = owner
+
+	def __getitem__(self, key):
+		return self._owner._notes[StoreLicenseInfo.platformIndex[key]]
+
+	def __setitem__(self, key, value):
+		self._owner._notes[StoreLicenseInfo.platformIndex[key]] = value
+		self._owner._Changed()
+
+	def __contains__(self, key):
+		return key in StoreLicenseInfo.platformIndex
+
+	def __iter__(self):
+		return iter(StoreLicenseInfo.knownPlatforms)
+
+	def __len__(self):
+		return len(StoreLicenseInfo.knownPlatforms)
+
+	def __eq__(self, other):
+		return dict(self.items()) == dict(other.items())
+
+	def __ne__(self, other):
+		return not self == other
+
+	def __repr__(self):
+		return repr(dict(self.items()))
+
+	def get(self, key, default=None):
+		return self[key] if key in self else default
+
+	def keys(self):
+		return list(StoreLicenseInfo.knownPlatforms)
+
+	def items(self):
+		return zip(StoreLicenseInfo.knownPlatforms, self._owner._notes)
+
+
 # features = dictionary { title_en : obj }
 # value of features
-#   obj.title 		= dictionary {"en":"title text of en", "ja":"title text of ja", ...}
-#   obj.description = dictionary {"en":"description text of en", "ja":"description text of ja", ...}
+#   obj.title 		= LocaleDict {"en":"title text of en", "ja":"title text of ja", ...}
+#   obj.description = LocaleDict {"en":"description text of en", "ja":"description text of ja", ...}
 #   obj.category 	= "category text"
-#	obj.platform	= dictionary {"Unity":False, "Unity Pro":True, ...}
-#	obj.notes		= dictionary {"Unity":"note", "Unity Pro":"note", ...}
+#	obj.platform	= PlatformFlags {"unity":False, "unitypro":True, ...}
+#	obj.notes		= PlatformNotes {"unity":"note", "unitypro":"note", ...}
+#
+# platform and notes can also be replaced with a dictionary; keys not in
+# knownPlatforms are ignored, and missing ones become False / ''.
+#
+# after KeepFragments(), the texts made of a feature for export (its
+# document, hash and the part of each output file, see Fragment) are kept
+# until one of its fields changes, so a long running process (i.e. --watch)
+# exporting again only formats the features changed since the last export.
+# features do not keep them by default: the texts take about as much memory
+# as the exported files.
 #
-class StoreLicenseInfo:
+class StoreLicenseInfo(object):
 	# note: the order of knownPlatforms is the order of platform/notes array
 	# in exporting format
 	knownPlatforms = ['unitypro', 'unity', 'iospro', 'ios',
 					  'androidpro', 'android', 'flashpro', 'flash']
+	platformIndex = dict([(key, i) for i, key in enumerate(knownPlatforms)])
 	default_locale = 'en'
 
+	__slots__ = ('_title', '_description', '_category', '_platformBits', '_notes', '_fragments')
+
 	def __init__(self):
-		self.title = {}
-		self.description = {}
-		self.category = None
-		self.platform = {}
-		self.notes = {}
+		self._title = LocaleDict()
+		self._description = LocaleDict()
+		self._category = None
+		self._platformBits = 0
+		self._notes = [''] * len(StoreLicenseInfo.knownPlatforms)
+		self._fragments = None  # name:text, None unless kept (see KeepFragments)
 
-		for key in StoreLicenseInfo.knownPlatforms:
-			self.platform[key] = False
-			self.notes[key] = ''
+	def _GetTitle(self):
+		return self._title
+
+	def _SetTitle(self, title):
+		self._title = LocaleDict(title)
+		self._Changed()
+
+	title = property(_GetTitle, _SetTitle)
+
+	def _GetDescription(self):
+		return self._description
+
+	def _SetDescription(self, description):
+		self._description = LocaleDict(description)
+		self._Changed()
+
+	description = property(_GetDescription, _SetDescription)
+
+	def _GetCategory(self):
+		return self._category
+
+	def _SetCategory(self, category):
+		self._category = category
+		self._Changed()
+
+	category = property(_GetCategory, _SetCategory)
+
+	def _GetPlatform(self):
+		return PlatformFlags(self)
+
+	def _SetPlatform(self, platform):
+		bits = 0
+		for i, key in enumerate(StoreLicenseInfo.knownPlatforms):
+			if platform.get(key):
+				bits |= 1 << i
+		self._platformBits = bits
+		self._Changed()
+
+	platform = property(_GetPlatform, _SetPlatform)
+
+	def _GetNotes(self):
+		return PlatformNotes(self)
+
+	def _SetNotes(self, notes):
+		self._notes = [notes.get(key, '') for key in StoreLicenseInfo.knownPlatforms]
+		self._Changed()
+
+	notes = property(_GetNotes, _SetNotes)
+
+	#
+	# True if other has the same title, description, category, platform and notes
+	#
+	def HasSameContents(self, other):
+		return (self._platformBits == other._platformBits and self._category == other._category and
+				self._notes == other._notes and self._title == other._title and
+				self._description == other._description)
+
+	#
+	# keep texts made by Fragment from now on
+	#
+	def KeepFragments(self):
+		if self._fragments is None:
+			self._fragments = {}
+
+	#
+	# drop kept texts, called whenever a field changes
+	#
+	def _Changed(self):
+		if self._fragments is not None:
+			self._fragments = {}
+
+	#
+	# text of given name made of this feature by build(*args). after
+	# KeepFragments it is made once and then kept until the feature changes;
+	# texts are only made by the export thread or, once Document() has been
+	# called, by any number of threads.
+	#
+	def Fragment(self, name, build, *args):
+		fragments = self._fragments
+		if fragments is None:
+			return build(*args)
+		if self._title.isChanged or self._description.isChanged:
+			fragments = self._fragments = {}
+			self._title.isChanged = self._description.isChanged = False
+		try:
+			return fragments[name]
+		except KeyError:
+			text = fragments[name] = build(*args)
+			return text
+
+	#
+	# JSONObject() kept with the fragments; it may be shared, and must not be modified.
+	#
+	def Document(self):
+		return self.Fragment('document', self.JSONObject)
+
+	#
+	# compact json of Document(), with keys sorted. Document() can be given
+	# when already made.
+	#
+	def CompactJSON(self, document=None):
+		if document is None:
+			document = self.Document()
+		return self.Fragment('compact', lambda: g_encodeJSON(sorted(document.items())))
 
 	def showInfo(self):
 		print '------------------------'
@@ -90,573 +380,3824 @@ class StoreLicenseInfo:
 	#   "notes"       : ["&nbsp;","&nbsp;","&nbsp;","&nbsp;","&nbsp;","&nbsp;","&nbsp;","&nbsp;"]
 	# },
 	def JSONExpression(self):
-		uTitleDesc = self._JSONExpression_localizedTitleDescription()
-		uPlatform = self._JSONExpression_platform()
-		uNotes = self._JSONExpression_notes()
-		out_string = u'''{{
-			{0},
-			"category"		:	"{1}",
-			"platform"		:	[{2}],
-			"notes"			:	[{3}]
-		}}'''  # {{ and }} is escape for {} not being recognized as formatter
-		return out_string.format(uTitleDesc, self.category, uPlatform, uNotes).encode(g_charcode)
-
-	def _JSONExpression_localizedTitleDescription(self):
-
-		out_string = u''
-		keys = self.title.keys()
-		for key in keys:
+		return self.Fragment('expression', lambda: json.dumps(self.Document(), sort_keys=True).encode(g_charcode))
+
+	#
+	# md5 of the contents of feature; the same for equal features in any run.
+	# CompactJSON() can be given when already made.
+	#
+	def ContentHash(self, text=None):
+		if text is None:
+			text = self.CompactJSON()
+		return self.Fragment('hash', lambda: hashlib.md5(text).hexdigest())
+
+	#
+	# dictionary of StoreLicenseInfo in the form of JSONExpression
+	#
+	def JSONObject(self):
+		obj = {}
+		for key in self.title:
 			if key == self.default_locale:
-				out_string += u'"title" : "{0}",'.format(self.title[key])
-				out_string += u'"description" : "{0}"'.format(self.description[key])
+				obj['title'] = self.title[key]
+				obj['description'] = self.description[key]
 			else:
-				out_string += u'"title_{0}" : "{1}",'.format(key, self.title[key])
-				out_string += u'"description_{0}" : "{1}"'.format(key, self.description[key])
-			if key != keys[-1]:
-				out_string += u','
-		return out_string
-
-	def _JSONExpression_platform(self):
-		out_string = u''
-		for key in StoreLicenseInfo.knownPlatforms:
-			check = u"check" if self.platform[key] else u""
-			out_string += u'"{0}"'.format(check)
-			if key != StoreLicenseInfo.knownPlatforms[-1]:
-				out_string += u','
-		return out_string
-
-	def _JSONExpression_notes(self):
-		out_string = u''
-		for key in StoreLicenseInfo.knownPlatforms:
-			note = self.notes[key]
-			out_string += u'"{0}"'.format(note)
-			if key != StoreLicenseInfo.knownPlatforms[-1]:
-				out_string += u','
-		return out_string
+				obj['title_' + key] = self.title[key]
+				obj['description_' + key] = self.description[key]
+		obj['category'] = u'{0}'.format(self.category)
+		obj['platform'] = [u'check' if self._platformBits & (1 << i) else u'' for i in range(len(self._notes))]
+		obj['notes'] = list(self._notes)
+		return obj
 
 
 #
-#  Unity Store json file manager
-#  All data stored in Google docs (Spreadsheet)
+# reads elements of "features" array in json file one at a time,
+# without loading whole file in memory.
 #
-class StoreLicenseParser:
-	def __init__(self, email, password, doc_key):
-		self.gd_client = gdata.spreadsheet.service.SpreadsheetsService()
-		self.gd_client.email = email
-		self.gd_client.password = password
-		self.gd_client.source = 'SpreadSheetToJson'
-		self.gd_client.ProgrammaticLogin()
-		self.doc_key = doc_key
-		self.curr_wksht_id = 'default'
-		self.list_feed = None
-		self.knownSheets = ['default', 'notes', 'platform', 'how to use']
-		self.sheets = {}  # name:id dictionary of each sheets
-		self.features = {}  # all values representation
-		# login and get all necessary information from spreadsheet on google
-		# docs
-		self._GetAllWorksheetsIds()
+#   for feature in JSONFeatureReader('store.json'):
+#       print feature['title']
+#
+class JSONFeatureReader:
+	def __init__(self, file_path, chunk_bytes=65536):
+		self.file_path = file_path
+		self.chunk_bytes = chunk_bytes
 
-	# Get the list of worksheets
-	def _GetAllWorksheetsIds(self):
-		feed = self.gd_client.GetWorksheetsFeed(self.doc_key)
+	def __iter__(self):
+		self.decoder = json.JSONDecoder()
+		self.textDecoder = codecs.getincrementaldecoder('utf-8-sig')()
+		self.buf = u''
+		self.pos = 0
+		self.eof = False
+		self.f = open(self.file_path, 'rb')
+		try:
+			self._Expect(u'{')
+			while self._Peek() != u'}':
+				key = self._Decode()
+				self._Expect(u':')
+				if key == u'features':
+					for feature in self._IterArray():
+						yield feature
+					return
+				self._Decode()  # skip value of other keys
+				if self._Peek() == u',':
+					self._Expect(u',')
+			raise ValueError('"features" not found in {0}'.format(self.file_path))
+		finally:
+			self.f.close()
 
-		# sheet id looks like this:
-		#   https://spreadsheets.google.com/feeds/worksheets/0AqJa9l8Ism8gdE9JeWFxMnhGS1FYZHdQQ01SNDNOTmc/private/full/od5
-		# sheet id of file is the last token (i.e:od5)
-		for i, entry in enumerate(feed.entry):
-			id_parts = entry.id.text.split('/')
-			worksheet_id = id_parts[len(id_parts) - 1]
-			worksheet_name = entry.title.text
-			self.sheets[worksheet_name] = worksheet_id
+	def _IterArray(self):
+		self._Expect(u'[')
+		if self._Peek() == u']':
+			return
+		while True:
+			yield self._Decode()
+			if self._Peek() == u']':
+				return
+			self._Expect(u',')
 
 	#
-	# Get all sheets and make intermediate object for exporting/importing
+	# read more text into buffer. returns False at end of file.
 	#
-	def _SheetToObject(self):
-		self._ParseDefaultSheet()
-		self._ParsePlatformSheet()
-		self._ParseNotesSheet()
-
-		# if not known sheet, must be for localization:
-		for key in self.sheets:
-			if key not in self.knownSheets:
-				self._ParseLocalizedSheet(key)
+	def _Fill(self, size=None):
+		if self.eof:
+			return False
+		self.buf = self.buf[self.pos:]
+		self.pos = 0
+		data = self.f.read(max(size or 0, self.chunk_bytes))
+		if not data:
+			self.eof = True
+			self.buf += self.textDecoder.decode('', True)
+			return False
+		self.buf += self.textDecoder.decode(data)
+		return True
 
 	#
-	# takes care of 'default' sheet
+	# next non-whitespace character without consuming it, or u'' at end of file
 	#
-	def _ParseDefaultSheet(self):
-		feed = self.gd_client.GetListFeed(self.doc_key, self.sheets['default'])
+	def _Peek(self):
+		while True:
+			while self.pos < len(self.buf) and self.buf[self.pos] in u' \t\r\n':
+				self.pos += 1
+			if self.pos < len(self.buf):
+				return self.buf[self.pos]
+			if not self._Fill():
+				return u''
 
-		if not isinstance(feed, gdata.spreadsheet.SpreadsheetsListFeed):
-			print "Error: feed is not SpreadsheetsListFeed."
-			return
-
-		for i, entry in enumerate(feed.entry):
-			obj = StoreLicenseInfo()
-			for key in entry.custom:
-				s = u'' if None == entry.custom[key].text else unicode(entry.custom[key].text)
-				if key == 'title':
-					obj.title[StoreLicenseInfo.default_locale] = s
-				elif key == 'description':
-					obj.description[StoreLicenseInfo.default_locale] = s
-				elif key == 'category':
-					obj.category = s
-			self.features[ obj.title[StoreLicenseInfo.default_locale] ] = obj
+	def _Expect(self, c):
+		if self._Peek() != c:
+			raise ValueError('Expecting {0} at {1} in {2}'.format(c, self.pos, self.file_path))
+		self.pos += 1
 
 	#
-	# takes care of platform checksheet
+	# decode one json value. buffer is extended until the value is complete.
 	#
-	def _ParsePlatformSheet(self):
-		feed = self.gd_client.GetListFeed(self.doc_key, self.sheets['platform'])
+	def _Decode(self):
+		self._Peek()
+		while True:
+			try:
+				obj, end = self.decoder.raw_decode(self.buf, self.pos)
+				# a number at the end of buffer may continue in the next chunk
+				if end < len(self.buf) or self.eof:
+					self.pos = end
+					return obj
+			except ValueError:
+				if self.eof:
+					raise
+			self._Fill(len(self.buf) - self.pos)
+
+
+#
+# checks features of a json file to upload, in one pass keeping only titles
+# and locales, so every problem is reported at once before anything is sent:
+#   - "title" missing, not a text, or the same as the title of another feature
+#   - "description", "category", "platform" or "notes" missing
+#   - "platform" / "notes" not a list of one text per knownPlatforms
+#   - "description", "category", "title_xx", "description_xx" not a text
+#   - "title_xx" without "description_xx", or the other way around
+#   - (CheckWorksheets) locales without a worksheet, which would not be uploaded
+# modified features of a changeset only have the changed keys, and null for
+# a locale removed from the feature; Check them with isPartial, which only
+# requires "title".
+#
+#   validator = FeatureValidator()
+#   for feature in JSONFeatureReader(file_path):
+#       validator.Check(feature)
+#   validator.CheckWorksheets(parser.sheets)
+#   print validator.problems
+#
+class FeatureValidator:
+	requiredKeys = ['description', 'category', 'platform', 'notes']  # besides "title"
+
+	def __init__(self):
+		self.problems = []
+		self.count = 0  # features checked
+		self.titles = set()
+		self.locales = set()  # locales of all features, default locale included
 
-		if not isinstance(feed, gdata.spreadsheet.SpreadsheetsListFeed):
-			print "Error: feed is not SpreadsheetsListFeed."
+	def Check(self, feature, isPartial=False):
+		self.count += 1
+		if not isinstance(feature, dict):
+			self._Problem(None, 'not an object')
 			return
+		title = feature.get('title')
+		if not isinstance(title, basestring) or not title:
+			self._Problem(None, '"title" missing or not a text')
+			title = None
+		elif title in self.titles:
+			self._Problem(title, 'more than one feature has this title')
+		else:
+			self.titles.add(title)
+		self.locales.add(StoreLicenseInfo.default_locale)
+		if not isPartial:
+			for key in self.requiredKeys:
+				if key not in feature:
+					self._Problem(title, '"{0}" missing'.format(key))
 
-		for i, entry in enumerate(feed.entry):
-			ref_title = ''
-			plaf_dic = {}
+		titleLocales = set()
+		descLocales = set()
+		for key, value in feature.iteritems():
+			if key in ('platform', 'notes'):
+				if isPartial and value is None:
+					continue
+				if not isinstance(value, list) or len(value) != len(StoreLicenseInfo.knownPlatforms):
+					self._Problem(title, '"{0}" is not a list of {1} texts'.format(key, len(StoreLicenseInfo.knownPlatforms)))
+				elif [text for text in value if not isinstance(text, basestring)]:
+					self._Problem(title, '"{0}" has values that are not texts'.format(key))
+				continue
+			if key in ('title', 'description', 'category'):
+				locales = None
+			else:
+				match = StoreLicenseParser.pattern_title.search(key)
+				locales = titleLocales
+				if not match:
+					match = StoreLicenseParser.pattern_desc.search(key)
+					locales = descLocales
+				if not match:
+					continue
+				locales.add(match.group(1))
+				if isPartial and value is None:
+					continue
+			if not isinstance(value, basestring):
+				self._Problem(title, '"{0}" is not a text'.format(key))
 
-			for key in entry.custom:
-				s = u'' if None == entry.custom[key].text else unicode(entry.custom[key].text)
-				if key == 'ref-title':
-					ref_title = s
+		self.locales |= titleLocales | descLocales
+		if not isPartial:
+			for locale in sorted(titleLocales ^ descLocales):
+				if locale in titleLocales:
+					self._Problem(title, '"title_{0}" without "description_{0}"'.format(locale))
 				else:
-					plaf_dic[key] = (s.strip() == 'check')
+					self._Problem(title, '"description_{0}" without "title_{0}"'.format(locale))
 
-			try:
-				obj = self.features[ref_title]
-				obj.platform = plaf_dic
-			except KeyError:
-				print 'ParsePlatform: {0} not found.'.format(ref_title)
-				pass
+	#
+	# check that every locale has a worksheet; sheet_names are all worksheets
+	#
+	def CheckWorksheets(self, sheet_names):
+		self.problems += self.WorksheetProblems(sheet_names)
 
 	#
-	# takes care of notes sheet
+	# problems CheckWorksheets would add, without adding them, so one
+	# validator can be checked against many documents
 	#
-	def _ParseNotesSheet(self):
-		feed = self.gd_client.GetListFeed(self.doc_key, self.sheets['notes'])
+	def WorksheetProblems(self, sheet_names):
+		return ['locale "{0}" has no worksheet'.format(locale) for locale in sorted(self.locales)
+				if locale != StoreLicenseInfo.default_locale and locale not in sheet_names]
 
-		if not isinstance(feed, gdata.spreadsheet.SpreadsheetsListFeed):
-			print "Error: feed is not SpreadsheetsListFeed."
-			return
+	def _Problem(self, title, message):
+		if title is None:
+			self.problems.append(u'feature {0}: {1}'.format(self.count, message))
+		else:
+			self.problems.append(u'feature {0} "{1}": {2}'.format(self.count, title, message))
 
-		for i, entry in enumerate(feed.entry):
-			ref_title = ''
-			note_dic = {}
 
-			for key in entry.custom:
-				s = u'' if None == entry.custom[key].text else unicode(entry.custom[key].text)
-				if key == 'ref-title':
-					ref_title = s
-				else:
-					note_dic[key] = s
+#
+# changes of one worksheet, computed by StoreLicenseParser.ComputeChangeSet
+#   deletes = [(title, row)]
+#   updates = [(title, row, newData)]
+#   inserts = [(title, newData)]
+#
+class SheetChangeSet:
+	def __init__(self, label, sheet_name, rows=None):
+		self.label = label  # name used in log, i.e. 'Default', 'Localization(ja)'
+		self.sheet_name = sheet_name
+		self.rows = rows  # list of SheetRow the changes were computed against, None if they were streamed
+		self.appended = 0  # rows added to the sheet after rows were read
+		self.removed = set()  # id() of rows in deletes already removed from the sheet
+		self.deletes = []
+		self.updates = []
+		self.inserts = []
 
-			try:
-				obj = self.features[ref_title]
-				obj.notes = note_dic
-			except KeyError:
-				print 'ParseNote: {0} not found.'.format(ref_title)
-				pass
+	def IsEmpty(self):
+		return not (self.deletes or self.updates or self.inserts)
+
+
+#
+# changes between two json files, keyed by title in default locale, as
+# written by "storelicense.py diff OLD NEW --changeset FILE":
+#
+#   { "added"    : [ feature, ... ],
+#     "removed"  : [ title, ... ],
+#     "modified" : [ { "title" : title, "fields" : { key : new value }, ... ] }
+#
+# added features are complete, as in the json file. modified ones only have
+# the keys whose value changed ('description', 'platform', 'title_ja', ...),
+# with null for a locale no longer in the feature. such locales are left as
+# they are in the spreadsheet, like --upload does.
+#
+class DocumentChangeSet:
+	def __init__(self, added=None, removed=None, modified=None):
+		self.added = added or []
+		self.removed = removed or []
+		self.modified = modified or []
 
 	#
-	# takes care of localization sheet for all locales found
+	# changes from old to new, dictionaries { title : StoreLicenseInfo }.
+	# one pass over each; features are compared by their json documents.
 	#
-	def _ParseLocalizedSheet(self, lang):
-		feed = self.gd_client.GetListFeed(self.doc_key, self.sheets[lang])
+	@staticmethod
+	def Compute(old, new):
+		changes = DocumentChangeSet()
+		for key in sorted(new):
+			if key not in old:
+				changes.added.append(new[key].JSONObject())
+				continue
+			oldObj = old[key].JSONObject()
+			newObj = new[key].JSONObject()
+			fields = dict([(name, newObj.get(name)) for name in set(oldObj) | set(newObj)
+				if oldObj.get(name) != newObj.get(name)])
+			if fields:
+				changes.modified.append({'title': key, 'fields': fields})
+		changes.removed = sorted([key for key in old if key not in new])
+		return changes
 
-		if not isinstance(feed, gdata.spreadsheet.SpreadsheetsListFeed):
-			print "Error: feed is not SpreadsheetsListFeed."
-			return
+	@staticmethod
+	def Read(file_path):
+		with open(file_path, 'rb') as f:
+			changeset = json.load(f)
+		return DocumentChangeSet(changeset.get('added'), changeset.get('removed'), changeset.get('modified'))
 
-		for i, entry in enumerate(feed.entry):
-			ref_title = ''
-			localized_title = ''
-			localized_desc = ''
+	def Write(self, out):
+		json.dump({'added': self.added, 'removed': self.removed, 'modified': self.modified}, out,
+			sort_keys=True, indent=4)
+		out.write('\n')
 
-			for key in entry.custom:
-				s = u'' if None == entry.custom[key].text else unicode(entry.custom[key].text)
-				if key == 'ref-title':
-					ref_title = s
-				elif key == 'title':
-					localized_title = s
-				elif key == 'description':
-					localized_desc = s
+	def IsEmpty(self):
+		return not (self.added or self.removed or self.modified)
 
-			try:
-				obj = self.features[ref_title]
-				obj.title[lang] = localized_title
-				obj.description[lang] = localized_desc
-			except KeyError:
-				print 'ParseLocalized: {0} for {1} not found.'.format(ref_title, lang)
-				pass
+
+#
+# write-ahead journal of an upload (--journal), to finish an interrupted
+# upload with --resume instead of reading and comparing every sheet again.
+# one json object per line:
+#   { "journal" : 1, "key" : doc key }
+#   { "plan" : sheet name, "label" : label, "deletes" : [ key ],
+#     "updates" : [ [ key, data ] ], "inserts" : [ [ key, data ] ] }
+#   { "done" : sheet name, "kind" : "delete" / "update" / "insert", "key" : key }
+# plans of all sheets are on disk before the first write, and a "done" line
+# is added after each write the service confirmed. a write applied but not
+# yet recorded is found again by StoreLicenseParser.ResumeUpload, so rows
+# are never inserted twice. the file is removed once the upload finishes.
+#
+class UploadJournal:
+	def __init__(self, file_path):
+		self.file_path = file_path
+		self.file = None
+		self.lock = threading.Lock()
 
 	#
-	# prepare internal data structure from google docs contents
+	# start journal of given list of SheetChangeSet, replacing any earlier one
 	#
-	def LoadDocumentFromGoogleDocs(self):
-		self._SheetToObject()
+	def Start(self, doc_key, changes):
+		with open(self.file_path + '.tmp', 'wb') as f:
+			f.write(g_encodeJSON({'journal': 1, 'key': doc_key}) + '\n')
+			for change in changes:
+				if change.IsEmpty():
+					continue
+				f.write(g_encodeJSON({'plan': change.sheet_name, 'label': change.label,
+					'deletes': [feature for feature, row in change.deletes],
+					'updates': [[feature, newData] for feature, row, newData in change.updates],
+					'inserts': [[feature, newData] for feature, newData in change.inserts]}) + '\n')
+			f.flush()
+			os.fsync(f.fileno())
+		os.rename(self.file_path + '.tmp', self.file_path)
+		self.file = open(self.file_path, 'ab')
+
+	def Done(self, sheet_name, kind, key):
+		with self.lock:
+			self.file.write(g_encodeJSON({'done': sheet_name, 'kind': kind, 'key': key}) + '\n')
+			self.file.flush()
 
 	#
-	# prepare internal data structure from given json file
+	# upload has finished, remove journal
 	#
-	def LoadDocumentFromJSONFile(self, file_path):
-		jsonStr = ''
-		#with fileinput.input(files=(file_path)) as f:
-		f = fileinput.input(files=(file_path))
-		for line in f:
-			jsonStr += line.strip()
-		jsonObj = json.loads(jsonStr)
+	def Finish(self):
+		self.Close()
+		os.remove(self.file_path)
 
-		pattern_title = re.compile("title_([a-z\-_]+)")
-		pattern_desc = re.compile("description_([a-z\-_]+)")
+	def Close(self):
+		if self.file is not None:
+			self.file.close()
+			self.file = None
 
-		for feature in jsonObj["features"]:
-			obj = StoreLicenseInfo()
-			for key in feature:
-				if key == 'title':
-					obj.title[StoreLicenseInfo.default_locale] = feature[key]
-				elif key == 'description':
-					obj.description[
-						StoreLicenseInfo.default_locale] = feature[key]
-				elif key == 'category':
-					obj.category = feature[key]
-				elif key == 'platform':
-					pf_list = feature[key]
-					for i in range(len(StoreLicenseInfo.knownPlatforms)):
-						obj.platform[StoreLicenseInfo.knownPlatforms[
-							i]] = (pf_list[i].strip() == 'check')
-				elif key == 'notes':
-					nt_list = feature[key]
-					for i in range(len(StoreLicenseInfo.knownPlatforms)):
-						obj.notes[
-							StoreLicenseInfo.knownPlatforms[i]] = nt_list[i]
+	#
+	# (doc key, [(label, sheet name, deletes, updates, inserts)]) of writes
+	# not done yet, in the order they were planned. None if there is no journal.
+	#
+	@staticmethod
+	def Read(file_path):
+		if not os.path.exists(file_path):
+			return None
+		doc_key = None
+		plans = []
+		done = collections.Counter()  # (sheet name, kind, key):number of writes done
+		with open(file_path, 'rb') as f:
+			for line in f:
+				try:
+					entry = json.loads(line)
+				except ValueError:
+					continue  # last line written only partly
+				if 'journal' in entry:
+					doc_key = entry['key']
+				elif 'plan' in entry:
+					plans.append(entry)
+				elif 'done' in entry:
+					done[(entry['done'], entry['kind'], entry['key'])] += 1
+
+		def pending(sheet_name, kind, items, keyOf):
+			remaining = []
+			for item in items:
+				if done[(sheet_name, kind, keyOf(item))] > 0:
+					done[(sheet_name, kind, keyOf(item))] -= 1
 				else:
-					# if none of known keys, try find localized title/desc
-					search_localized_title = pattern_title.search(key)
-					if search_localized_title:
-						locale = search_localized_title.groups(0)[0]
-						obj.title[locale] = feature[key]
-					else:
-						search_localized_desc = pattern_desc.search(key)
-						if search_localized_desc:
-							locale = search_localized_desc.groups(0)[0]
-							obj.description[locale] = feature[key]
+					remaining.append(item)
+			return remaining
 
-			self.features[feature['title']] = obj
+		return doc_key, [(plan['label'], plan['plan'],
+			pending(plan['plan'], 'delete', plan['deletes'], lambda key: key),
+			pending(plan['plan'], 'update', plan['updates'], lambda item: item[0]),
+			pending(plan['plan'], 'insert', plan['inserts'], lambda item: item[0])) for plan in plans]
 
-	#
-	# print internal structure in json form
-	#
-	def ExportSheet(self):
-		self._PrintInJSON()
+
+#
+# on-disk cache of downloaded feeds, keyed by document key and worksheet id.
+# each entry is stored as two files: <hash>.xml (feed body) and <hash>.meta
+# (json with 'updated' of the worksheet). least recently used entries
+# are removed once the total size exceeds max_bytes.
+#
+class FeedCache:
+	def __init__(self, cache_dir, max_bytes):
+		self.cache_dir = cache_dir
+		self.max_bytes = max_bytes
+		self.lock = threading.Lock()
+		if not os.path.isdir(cache_dir):
+			os.makedirs(cache_dir, 0700)
+
+	def _Path(self, doc_key, wksht_id):
+		return os.path.join(self.cache_dir, hashlib.sha1('{0}/{1}'.format(doc_key, wksht_id)).hexdigest())
 
 	#
-	# print internal structure in json form
+	# returns (meta, body) or None if not cached
 	#
-	def _PrintInJSON(self):
-		jsonStr = ''
-		jsonStr += '{ "features": [ '
-		keys = self.features.keys()
-		for key in keys:
-			objStr = self.features[key].JSONExpression()
-			jsonStr += objStr
-			if key != keys[-1]:
-				jsonStr += ','
-		jsonStr += ']}'
-		jsonObj = json.loads(jsonStr)
-		print json.dumps(jsonObj, sort_keys=True, indent=4).encode('utf-8')
+	def Get(self, doc_key, wksht_id):
+		cached = self.Open(doc_key, wksht_id)
+		if cached is None:
+			return None
+		meta, f = cached
+		with f:
+			return meta, f.read()
 
 	#
-	# upload internal structure to google doc
+	# returns (meta, file open for reading the body) or None if not cached
 	#
-	def UploadSheet(self, isFullSync):
-		self._UpdateDefaultSheet(isFullSync)
-		self._UpdatePlatformSheet(isFullSync)
-		self._UpdateNotesSheet(isFullSync)
-		for key in self.sheets:
-			if key not in self.knownSheets:
-				self._UpdateLocalizedSheet(isFullSync, key)
+	def Open(self, doc_key, wksht_id):
+		path = self._Path(doc_key, wksht_id)
+		with self.lock:
+			try:
+				with open(path + '.meta', 'rb') as f:
+					meta = json.load(f)
+				f = open(path + '.xml', 'rb')
+				# mark as recently used
+				os.utime(path + '.xml', None)
+			except (IOError, OSError, ValueError):
+				return None
+		return meta, f
+
+	def Put(self, doc_key, wksht_id, meta, body):
+		self.PutFrom(doc_key, wksht_id, meta, lambda f: f.write(body))
 
 	#
-	# update sheet from local data: for default sheet
+	# body is written by write(file), and its result is returned. the file is
+	# a temporary one until write returns, so a failed download leaves the
+	# entry as it was.
 	#
-	def _UpdateDefaultSheet(self, isFullSync):
-		feed = self.gd_client.GetListFeed(self.doc_key, self.sheets['default'])
+	def PutFrom(self, doc_key, wksht_id, meta, write):
+		path = self._Path(doc_key, wksht_id)
+		temp_path = '{0}.{1}.tmp'.format(path, threading.current_thread().ident)
+		try:
+			with open(temp_path, 'wb') as f:
+				result = write(f)
+		except:
+			os.remove(temp_path)
+			raise
+		with self.lock:
+			os.rename(temp_path, path + '.xml')
+			with open(path + '.meta', 'wb') as f:
+				json.dump(meta, f)
+			self._Evict()
+		return result
 
-		existing_feature_list = []
-		for i, entry in enumerate(feed.entry):
-			existing_feature_list.append(unicode(entry.custom['title'].text))
-
-		#
-		# removing unexisting entries
-		if isFullSync:
-			removing_item_set = set(existing_feature_list) - set(self.features.keys())
-			for feature in removing_item_set:
-				for i, entry in enumerate(feed.entry):
-					if feature == unicode(entry.custom['title'].text):
-						print '[Default]: Removing item:{0}'.format(feature)
-						self.gd_client.DeleteRow(entry)
-
-		#
-		# modifying existing entries with local data
-		for i, entry in enumerate(feed.entry):
-			strTitle = unicode(entry.custom['title'].text)
-			try:
-				obj = self.features[strTitle]
-				newData = {}
-				newData['title'] 		= obj.title[StoreLicenseInfo.default_locale]
-				newData['description'] 	= obj.description[StoreLicenseInfo.default_locale]
-				newData['category'] 	= obj.category
-				isDirty = ( entry.custom['title'].text != newData['title'] )
-				isDirty |= ( entry.custom['description'].text != newData['description'] )
-				isDirty |= ( entry.custom['category'].text != newData['category'] )
-				if isDirty:
-					print "[Default]: Updating:{0}".format(strTitle)
-					self.gd_client.UpdateRow(entry,newData)
-			except KeyError:
-				pass  # don't worry if strTitle is not found
+	def Clear(self):
+		with self.lock:
+			for name in os.listdir(self.cache_dir):
+				if name.endswith('.xml') or name.endswith('.meta'):
+					os.remove(os.path.join(self.cache_dir, name))
 
-		#
-		# adding new entries only exist in local data
-		new_item_set = set(self.features.keys()) - set(existing_feature_list)
-		for feature in new_item_set:
-			try:
-				obj = self.features[feature]
-				newData = {}
-				newData['title'] 		= obj.title[StoreLicenseInfo.default_locale]
-				newData['description'] 	= obj.description[StoreLicenseInfo.default_locale]
-				newData['category'] 	= obj.category
-				entry = self.gd_client.InsertRow(newData, self.doc_key, self.sheets['default'])
-				if not isinstance(entry, gdata.spreadsheet.SpreadsheetsList):
-					print '[Default]: Error: Failed to add {0}'.format(feature)
-				else:
-					print '[Default]: Adding:{0}'.format(feature)
-			except KeyError:
-				print '[Default]: FATAL: Object for "{0}" not found.'.format(feature)
-				pass  # don't worry if strTitle is not found
+	def _Evict(self):
+		entries = []
+		total = 0
+		for name in os.listdir(self.cache_dir):
+			if not name.endswith('.xml'):
+				continue
+			path = os.path.join(self.cache_dir, name)
+			st = os.stat(path)
+			entries.append((st.st_mtime, st.st_size, path[:-len('.xml')]))
+			total += st.st_size
 
+		entries.sort()
+		for mtime, size, path in entries:
+			if total <= self.max_bytes:
+				break
+			for ext in ('.xml', '.meta'):
+				if os.path.exists(path + ext):
+					os.remove(path + ext)
+			total -= size
 
-	#
-	# update sheet from local data: for platform
-	#
-	def _UpdatePlatformSheet(self, isFullSync):
-		feed = self.gd_client.GetListFeed(self.doc_key, self.sheets['platform'])
 
-		existing_feature_list = []
-		for i, entry in enumerate(feed.entry):
-			existing_feature_list.append(unicode(entry.custom['ref-title'].text))
-
-		#
-		# removing unexisting entries
-		if isFullSync:
-			removing_item_set = set(existing_feature_list) - set(self.features.keys())
-			for feature in removing_item_set:
-				for i, entry in enumerate(feed.entry):
-					if feature == unicode(entry.custom['ref-title'].text):
-						print '[Platform]: Removing item:{0}'.format(feature)
-						self.gd_client.DeleteRow(entry)
-
-		#
-		# modifying existing entries with local data
-		for i, entry in enumerate(feed.entry):
-			strTitle = unicode(entry.custom['ref-title'].text)
-			try:
-				obj = self.features[strTitle]
-				newData = {}
-				isDirty = False
-				for key in StoreLicenseInfo.knownPlatforms:
-					newData[key] = 'check' if obj.platform[key] else ''
-					isDirty |= (entry.custom[key].text == 'check') != obj.platform[key]
-				newData['ref-title'] = obj.title[StoreLicenseInfo.default_locale]
-				if isDirty:
-					print "[Platform]: Updating:{0}".format(strTitle)
-					self.gd_client.UpdateRow(entry,newData)
-			except KeyError:
-				pass  # don't worry if strTitle is not found
+#
+# auth tokens kept between runs, so a run can skip ClientLogin. stored in one
+# json file readable only by the user, keyed by user and service:
+#   { "<user> <service>" : { "token" : ..., "issued" : <unix time> } }
+# ClientLogin tokens are valid for about two weeks; entries older than
+# max_age seconds are not used. a token revoked earlier is replaced when the
+# service rejects it (see GDataBackend._Request).
+#
+class TokenCache:
+	def __init__(self, file_path, max_age=13 * 24 * 3600):
+		self.file_path = file_path
+		self.max_age = max_age
+		self.lock = threading.Lock()
 
-		#
-		# adding new entries only exist in local data
-		new_item_set = set(self.features.keys()) - set(existing_feature_list)
-		for feature in new_item_set:
-			try:
-				obj = self.features[feature]
-				newData = {}
-				isDirty = False
-				for key in StoreLicenseInfo.knownPlatforms:
-					newData[key] = 'check' if obj.platform[key] else ''
-					isDirty |= (entry.custom[key].text == 'check') != obj.platform[key]
-				newData['ref-title'] = obj.title[StoreLicenseInfo.default_locale]
-				entry = self.gd_client.InsertRow(newData, self.doc_key, self.sheets['platform'])
-				if not isinstance(entry, gdata.spreadsheet.SpreadsheetsList):
-					print '[Platform]: Error: Failed to add {0}'.format(feature)
-				else:
-					print '[Platform]: Adding:{0}'.format(feature)
-			except KeyError:
-				print '[Platform]: FATAL: Object for "{0}" not found.'.format(feature)
-				pass  # don't worry if strTitle is not found
+	def Get(self, user, service):
+		with self.lock:
+			entry = self._Read().get(self._Key(user, service))
+		if entry is None or time.time() - entry.get('issued', 0) > self.max_age:
+			return None
+		return entry.get('token')
+
+	def Put(self, user, service, token):
+		with self.lock:
+			tokens = self._Read()
+			tokens[self._Key(user, service)] = {'token': token, 'issued': time.time()}
+			self._Write(tokens)
+
+	def Remove(self, user, service):
+		with self.lock:
+			tokens = self._Read()
+			if tokens.pop(self._Key(user, service), None) is not None:
+				self._Write(tokens)
+
+	def _Key(self, user, service):
+		return u'{0} {1}'.format(user, service)
 
+	def _Read(self):
+		try:
+			with open(self.file_path, 'rb') as f:
+				return json.load(f)
+		except (IOError, OSError, ValueError):
+			return {}
 
 	#
-	# update sheet from local data: for notes
+	# written to a temporary file created with mode 0600 and renamed, so the
+	# token is never readable by others, nor left half written
 	#
-	def _UpdateNotesSheet(self, isFullSync):
-		feed = self.gd_client.GetListFeed(self.doc_key, self.sheets['notes'])
+	def _Write(self, tokens):
+		directory = os.path.dirname(os.path.abspath(self.file_path))
+		if not os.path.isdir(directory):
+			os.makedirs(directory, 0700)
+		temp_path = self.file_path + '.tmp'
+		if os.path.exists(temp_path):
+			os.remove(temp_path)
+		fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0600)
+		with os.fdopen(fd, 'wb') as f:
+			json.dump(tokens, f)
+		os.rename(temp_path, self.file_path)
 
-		existing_feature_list = []
-		for i, entry in enumerate(feed.entry):
-			existing_feature_list.append(unicode(entry.custom['ref-title'].text))
-
-		#
-		# removing unexisting entries
-		if isFullSync:
-			removing_item_set = set(existing_feature_list) - set(self.features.keys())
-			for feature in removing_item_set:
-				for i, entry in enumerate(feed.entry):
-					if feature == unicode(entry.custom['ref-title'].text):
-						print '[Notes]: Removing item:{0}'.format(feature)
-						self.gd_client.DeleteRow(entry)
-
-		#
-		# modifying existing entries with local data
-		for i, entry in enumerate(feed.entry):
-			strTitle = unicode(entry.custom['ref-title'].text)
-			try:
-				obj = self.features[strTitle]
-				newData = {}
-				isDirty = False
-				for key in StoreLicenseInfo.knownPlatforms:
-					newData[key] = obj.notes[key]
-					isDirty |= entry.custom[key].text != newData[key]
-				newData['ref-title'] = obj.title[StoreLicenseInfo.default_locale]
-				if isDirty:
-					print "[Notes]: Updating:{0}".format(strTitle)
-					self.gd_client.UpdateRow(entry,newData)
-			except KeyError:
-				pass  # don't worry if strTitle is not found
 
-		#
-		# adding new entries only exist in local data
-		new_item_set = set(self.features.keys()) - set(existing_feature_list)
-		for feature in new_item_set:
+#
+# records every service call (count, latency histogram, bytes, rows) per
+# worksheet, and time spent in each phase of download / upload, for --profile.
+#
+#   with profiler.Phase('fetch'):
+#       with profiler.Call('GetListFeed', 'default') as call:
+#           feed = gd_client.GetListFeed(...)
+#           call.rows = len(feed.entry)
+#
+# phase time is exclusive: time spent in a nested phase only counts for the
+# nested one. phases entered from worker threads are counted separately.
+#
+class Profiler:
+	# upper bounds of latency histogram buckets, in milliseconds
+	histogramBounds = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.local = threading.local()  # current call and phase stack of each thread
+		self.start = time.time()
+		self.calls = {}  # (sheet name, operation):CallStats
+		self.phases = {}  # (sheet name, phase name):seconds
+
+	@contextlib.contextmanager
+	def Call(self, operation, sheet=None):
+		call = ProfiledCall()
+		previous = getattr(self.local, 'call', None)
+		self.local.call = call
+		start = time.time()
+		try:
+			yield call
+		except:
+			call.failed = True
+			raise
+		finally:
+			self.local.call = previous
+			elapsed = time.time() - start
+			with self.lock:
+				stats = self.calls.get((sheet, operation))
+				if stats is None:
+					stats = self.calls[(sheet, operation)] = CallStats()
+				stats.Add(call, elapsed)
+
+	@contextlib.contextmanager
+	def Phase(self, name, sheet=None):
+		stack = getattr(self.local, 'phases', None)
+		if stack is None:
+			stack = self.local.phases = []
+		now = time.time()
+		if stack:
+			self._AddPhase(stack[-1][0], now - stack[-1][1])
+		stack.append([(sheet, name), now])
+		try:
+			yield
+		finally:
+			now = time.time()
+			key, start = stack.pop()
+			self._AddPhase(key, now - start)
+			if stack:
+				stack[-1][1] = now
+
+	def _AddPhase(self, key, seconds):
+		with self.lock:
+			self.phases[key] = self.phases.get(key, 0.0) + seconds
+
+	#
+	# add bytes sent/received to the call in progress on this thread
+	#
+	def AddBytes(self, sent, received):
+		call = getattr(self.local, 'call', None)
+		if call is not None:
+			call.bytesSent += sent
+			call.bytesReceived += received
+
+	#
+	# count a retry of the call in progress on this thread
+	#
+	def AddRetry(self):
+		call = getattr(self.local, 'call', None)
+		if call is not None:
+			call.retries += 1
+
+	#
+	# report as dictionary:
+	#   { 'elapsed' : seconds, 'phases' : { phase : seconds },
+	#     'sheets' : { sheet name : { 'calls' : { operation : stats }, 'phases' : { phase : seconds } } },
+	#     'totals' : { operation : stats } }
+	# calls and phases not bound to a worksheet (login, worksheets feed) are
+	# under '(document)'
+	#
+	def Report(self):
+		with self.lock:
+			sheets = {}
+			totals = {}
+			phases = {}
+			for (sheet, operation), stats in self.calls.iteritems():
+				self._SheetReport(sheets, sheet)['calls'][operation] = stats.Report()
+				totals.setdefault(operation, CallStats()).Merge(stats)
+			for (sheet, name), seconds in self.phases.iteritems():
+				self._SheetReport(sheets, sheet)['phases'][name] = seconds
+				phases[name] = phases.get(name, 0.0) + seconds
+			return {'elapsed': time.time() - self.start,
+					'phases': phases,
+					'sheets': sheets,
+					'totals': dict([(operation, totals[operation].Report()) for operation in totals])}
+
+	def _SheetReport(self, sheets, sheet):
+		name = '(document)' if sheet is None else sheet
+		if name not in sheets:
+			sheets[name] = {'calls': {}, 'phases': {}}
+		return sheets[name]
+
+	def Write(self, path):
+		with open(path, 'wb') as f:
+			json.dump(self.Report(), f, indent=4, sort_keys=True)
+
+
+#
+# one call in progress; rows and bytes are filled in by the caller and
+# ProfiledHttpClient.
+#
+class ProfiledCall:
+	def __init__(self):
+		self.rows = 0
+		self.bytesSent = 0
+		self.bytesReceived = 0
+		self.retries = 0
+		self.failed = False
+
+
+#
+# totals of calls of one operation on one worksheet
+#
+class CallStats:
+	def __init__(self):
+		self.calls = 0
+		self.errors = 0
+		self.retries = 0
+		self.seconds = 0.0
+		self.maxSeconds = 0.0
+		self.rows = 0
+		self.bytesSent = 0
+		self.bytesReceived = 0
+		self.histogram = [0] * (len(Profiler.histogramBounds) + 1)
+
+	def Add(self, call, seconds):
+		self.calls += 1
+		self.errors += 1 if call.failed else 0
+		self.retries += call.retries
+		self.seconds += seconds
+		self.maxSeconds = max(self.maxSeconds, seconds)
+		self.rows += call.rows
+		self.bytesSent += call.bytesSent
+		self.bytesReceived += call.bytesReceived
+		ms = seconds * 1000
+		i = 0
+		while i < len(Profiler.histogramBounds) and ms > Profiler.histogramBounds[i]:
+			i += 1
+		self.histogram[i] += 1
+
+	def Merge(self, other):
+		self.calls += other.calls
+		self.errors += other.errors
+		self.retries += other.retries
+		self.seconds += other.seconds
+		self.maxSeconds = max(self.maxSeconds, other.maxSeconds)
+		self.rows += other.rows
+		self.bytesSent += other.bytesSent
+		self.bytesReceived += other.bytesReceived
+		self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+		return self
+
+	def Report(self):
+		histogram = collections.OrderedDict()
+		for i, bound in enumerate(Profiler.histogramBounds):
+			histogram['<={0}ms'.format(bound)] = self.histogram[i]
+		histogram['>{0}ms'.format(Profiler.histogramBounds[-1])] = self.histogram[-1]
+		return {'calls': self.calls, 'errors': self.errors, 'retries': self.retries, 'seconds': self.seconds,
+				'mean_seconds': self.seconds / self.calls if self.calls else 0.0,
+				'max_seconds': self.maxSeconds, 'rows': self.rows,
+				'bytes_sent': self.bytesSent, 'bytes_received': self.bytesReceived,
+				'latency_histogram': histogram}
+
+
+#
+# atom http client wrapper which counts bytes of requests and responses
+# for Profiler. everything else is passed to the wrapped client.
+#
+class ProfiledHttpClient(object):
+	def __init__(self, http_client, profiler):
+		self.http_client = http_client
+		self.profiler = profiler
+
+	def request(self, operation, url, data=None, headers=None):
+		response = self.http_client.request(operation, url, data=data, headers=headers)
+		# atom.service sets Content-Length of requests it makes; login sends a plain string
+		size = (headers or {}).get('Content-Length')
+		if size is None and isinstance(data, str):
+			size = len(data)
+		self.profiler.AddBytes(int(size or 0), 0)
+		return ProfiledHttpResponse(response, self.profiler)
+
+	def __getattr__(self, name):
+		return getattr(self.http_client, name)
+
+
+class ProfiledHttpResponse(object):
+	def __init__(self, response, profiler):
+		self.response = response
+		self.profiler = profiler
+
+	def read(self, *args):
+		body = self.response.read(*args)
+		self.profiler.AddBytes(0, len(body))
+		return body
+
+	def __getattr__(self, name):
+		return getattr(self.response, name)
+
+
+#
+# atom http client keeping one open connection per server and thread, so
+# only the first request to a server pays for the TCP and TLS handshakes.
+# when https_proxy / http_proxy is set, requests go through the proxy like
+# ProxiedHttpClient, without keeping connections.
+# wraps a ProxiedHttpClient rather than deriving from it, so atom is not
+# needed until the first client is made.
+#
+class PooledHttpClient(object):
+	def __init__(self, headers=None):
+		ImportGData()
+		self.client = atom.http.ProxiedHttpClient(headers)
+		self.client._prepare_connection = self._PrepareConnection
+		self.local = threading.local()  # connections of each thread, and state of current request
+
+	def request(self, operation, url, data=None, headers=None):
+		self.local.isReused = False
+		try:
+			return self.client.request(operation, url, data, headers)
+		except (httplib.HTTPException, socket.error):
+			if not self.local.isReused:
+				raise
+		# the server has closed the connection while it was idle; send the
+		# request again on a new one
+		self.local.connections.pop(self.local.key, None)
+		return self.client.request(operation, url, data, headers)
+
+	def __getattr__(self, name):
+		return getattr(self.client, name)
+
+	def _PrepareConnection(self, url, headers):
+		if os.environ.get('{0}_proxy'.format(url.protocol)):
+			return atom.http.ProxiedHttpClient._prepare_connection(self.client, url, headers)
+
+		connections = getattr(self.local, 'connections', None)
+		if connections is None:
+			connections = self.local.connections = {}
+		self.local.key = (url.protocol, url.host, url.port)
+		connection = connections.get(self.local.key)
+		if connection is None:
+			connection = atom.http.HttpClient._prepare_connection(self.client, url, headers)
+			connections[self.local.key] = connection
+		elif connection.sock is not None:
+			self.local.isReused = True
+		if connection.sock is None:
+			# headers and body are sent separately; without TCP_NODELAY the body
+			# waits for the ack of the headers on an open connection
+			connection.connect()
+			connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		return connection
+
+
+#
+# paces requests to the spreadsheet service, and retries the ones it rejects
+# because of load (429 and 5xx).
+#   - a token bucket lets through at most rate requests per second, in bursts
+#     of at most burst. rate 0 means no limit.
+#   - each 429 halves the rate (down to 1/16 of it) and each successful
+#     request gives back 1/50 of it, so long runs settle just below the quota.
+#   - rejected requests are retried up to maxRetries times, each after a
+#     random delay of up to baseDelay * 2^attempt seconds (maxDelay at most).
+#
+#   entry = scheduler.Run(lambda: gd_client.InsertRow(...), hasApplied)
+#
+# a 5xx may also come back for a request that was applied. before retrying
+# after one, hasApplied() is called if given: it returns the result of the
+# applied request to use instead, or None to send the request again.
+#
+class RequestScheduler:
+	def __init__(self, rate=0, burst=None, maxRetries=5, baseDelay=1.0, maxDelay=60.0):
+		self.maxRate = float(rate)
+		self.rate = float(rate)  # current rate, lowered while throttled
+		self.burst = burst if burst is not None else max(1, int(rate))
+		self.maxRetries = maxRetries
+		self.baseDelay = baseDelay
+		self.maxDelay = maxDelay
+		self.lock = threading.Lock()
+		self.tokens = float(self.burst)
+		self.lastFill = time.time()
+
+	def Run(self, request, hasApplied=None, onRetry=None):
+		attempt = 0
+		while True:
+			self.Acquire()
+			try:
+				result = request()
+				self._Adjust(False)
+				return result
+			except gdata.service.RequestError, e:
+				status = self.Status(e)
+				if status == 429:
+					self._Adjust(True)
+				if not self.IsTransient(status) or attempt >= self.maxRetries:
+					raise
+
+			self.Backoff(attempt)
+			attempt += 1
+			if onRetry is not None:
+				onRetry()
+			if status != 429 and hasApplied is not None:
+				result = hasApplied()
+				if result is not None:
+					return result
+
+	#
+	# take one token from the bucket, waiting for it if necessary
+	#
+	def Acquire(self):
+		if self.maxRate <= 0:
+			return
+		while True:
+			with self.lock:
+				now = time.time()
+				self.tokens = min(self.burst, self.tokens + (now - self.lastFill) * self.rate)
+				self.lastFill = now
+				if self.tokens >= 1:
+					self.tokens -= 1
+					return
+				wait = (1 - self.tokens) / self.rate
+			time.sleep(wait)
+
+	def Backoff(self, attempt):
+		time.sleep(random.uniform(0, min(self.maxDelay, self.baseDelay * 2 ** attempt)))
+
+	def _Adjust(self, isThrottled):
+		if self.maxRate <= 0:
+			return
+		with self.lock:
+			if isThrottled:
+				self.rate = max(self.maxRate / 16, self.rate / 2)
+			else:
+				self.rate = min(self.maxRate, self.rate + self.maxRate / 50)
+
+	#
+	# http status of gdata.service.RequestError, or None
+	#
+	@staticmethod
+	def Status(e):
+		info = e.args[0] if e.args else None
+		return info.get('status') if isinstance(info, dict) else None
+
+	@staticmethod
+	def IsTransient(status):
+		return status == 429 or (status is not None and 500 <= status < 600)
+
+
+#
+# a row of worksheet.
+#   row.values = { column name : text }, empty cells are u''
+#   row.handle = backend specific reference used to update/delete the row
+#
+class SheetRow(object):
+	__slots__ = ('values', 'handle')
+
+	def __init__(self, values, handle):
+		self.values = values
+		self.handle = handle
+
+
+#
+# interface to the storage of worksheets.
+# column names are in the form of list feed: lowercased header text without
+# spaces and symbols other than '-' and '.'
+#
+class SheetBackend:
+	# rows read per request by IterRows, 0 for whole worksheets
+	pageSize = 0
+
+	#
+	# list of (worksheet name, worksheet id, updated) of all worksheets
+	#
+	def ListWorksheets(self):
+		raise NotImplementedError
+
+	#
+	# list of SheetRow of given worksheet, in order of rows
+	#
+	def GetRows(self, wksht_id):
+		raise NotImplementedError
+
+	#
+	# list of SheetRow of given worksheet for reading only: values may hold
+	# only the given columns (all if None), and handles can not be used to
+	# update or delete rows.
+	#
+	def ReadRows(self, wksht_id, columns=None):
+		return self.GetRows(wksht_id)
+
+	#
+	# iterator over SheetRows of GetRows, or ReadRows with isReadOnly.
+	# backends with pageSize read them a page at a time. slots is a
+	# semaphore held during each request.
+	#
+	def IterRows(self, wksht_id, columns=None, isReadOnly=False, slots=None):
+		with slots or threading.Lock():
+			if isReadOnly:
+				return iter(self.ReadRows(wksht_id, columns))
+			return iter(self.GetRows(wksht_id))
+
+	#
+	# list of SheetRow of given worksheet whose column is one of values,
+	# in order of rows
+	#
+	def FindRows(self, wksht_id, column, values):
+		values = set(values)
+		return [row for row in self.GetRows(wksht_id) if row.values.get(column) in values]
+
+	#
+	# replace contents of row with data { column name : text }.
+	# returns True on success.
+	#
+	def UpdateRow(self, wksht_id, row, data):
+		raise NotImplementedError
+
+	#
+	# add data { column name : text } as a new row after the last row.
+	# returns True on success.
+	#
+	def InsertRow(self, wksht_id, data):
+		raise NotImplementedError
+
+	def DeleteRow(self, wksht_id, row):
+		raise NotImplementedError
+
+	#
+	# update and insert many rows at once.
+	#   rows: all current rows of the worksheet (after deletes), in order
+	#   updates = [(row, data)], inserts = [data]
+	#   appended: number of rows inserted since rows were read
+	# returns (list of results of updates, list of results of inserts)
+	#
+	def WriteRows(self, wksht_id, rows, updates, inserts, appended=0):
+		updated = [self.UpdateRow(wksht_id, row, data) for row, data in updates]
+		inserted = [self.InsertRow(wksht_id, data) for data in inserts]
+		return updated, inserted
+
+	#
+	# make all changes persistent
+	#
+	def Flush(self):
+		pass
+
+	def _ColumnName(self, header):
+		return re.sub(r'[^a-z0-9\-\.]', '', header.lower())
+
+
+#
+# worksheets on Google Docs, through gdata spreadsheet service
+#
+class GDataBackend(SheetBackend):
+	# upper limit of cells read (rows x columns around the written cells) and
+	# sent in one batch request
+	maxBatchCells = 1000
+	# upper limit of values looked up in one list feed query (FindRows)
+	maxQueryValues = 20
+
+	def __init__(self, email, password, doc_key, cache=None, http_client=None, profiler=None, scheduler=None,
+			tokens=None):
+		# http_client: atom.http client to send requests with, None for PooledHttpClient
+		# tokens: TokenCache to reuse auth token of earlier runs, or None to always log in
+		ImportGData()
+		if http_client is None:
+			http_client = PooledHttpClient()
+		self.gd_client = gdata.spreadsheet.service.SpreadsheetsService(http_client=http_client)
+		self.profiler = profiler if profiler is not None else Profiler()
+		self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+		self.gd_client.http_client = ProfiledHttpClient(self.gd_client.http_client, self.profiler)
+		self.names = {}  # worksheet id:worksheet name, for profiler
+		self.gd_client.email = email
+		self.gd_client.password = password
+		self.gd_client.source = 'SpreadSheetToJson'
+		self.tokens = tokens
+		self.loginLock = threading.Lock()
+		token = tokens.Get(email, self.gd_client.service) if tokens is not None else None
+		if token:
+			self.gd_client.SetClientLoginToken(token)
+		else:
+			self._Login()
+		self.doc_key = doc_key
+		self.cache = cache  # FeedCache, or None to always download feeds
+		self.updated = {}  # worksheet id:'updated' timestamp
+		self.rowCounts = {}  # worksheet id:number of rows including empty ones
+		self.dataRows = {}  # worksheet id:number of list feed rows, while known
+
+	def ListWorksheets(self):
+		# always downloaded: it is small, and the 'updated' timestamps in it
+		# tell which list feeds in the cache are still current
+		with self._Call('GetWorksheetsFeed') as call:
+			feed = self._Request(lambda: self.gd_client.GetWorksheetsFeed(self.doc_key))
+			call.rows = len(feed.entry)
+
+		# sheet id looks like this:
+		#   https://spreadsheets.google.com/feeds/worksheets/0AqJa9l8Ism8gdE9JeWFxMnhGS1FYZHdQQ01SNDNOTmc/private/full/od5
+		# sheet id of file is the last token (i.e:od5)
+		worksheets = []
+		for i, entry in enumerate(feed.entry):
+			id_parts = entry.id.text.split('/')
+			worksheet_id = id_parts[len(id_parts) - 1]
+			updated = entry.updated.text if entry.updated is not None else None
+			self.names[worksheet_id] = entry.title.text
+			self.updated[worksheet_id] = updated
+			self.rowCounts[worksheet_id] = int(entry.row_count.text)
+			worksheets.append((entry.title.text, worksheet_id, updated))
+		return worksheets
+
+	def GetRows(self, wksht_id):
+		with self._Call('GetListFeed', wksht_id) as call:
+			if self.cache is None:
+				feed = self._Request(lambda: self.gd_client.GetListFeed(self.doc_key, wksht_id))
+			else:
+				uri = 'https://{0}/feeds/list/{1}/{2}/private/full'.format(self.gd_client.server, self.doc_key, wksht_id)
+				feed = self._GetCachedFeed(uri, wksht_id, self.updated.get(wksht_id),
+					gdata.spreadsheet.SpreadsheetsListFeedFromString)
+			call.rows = len(feed.entry)
+		self.dataRows[wksht_id] = len(feed.entry)
+		return self._ListRows(feed)
+
+	#
+	# like GetRows, but the feed is read with ListFeedReader while it is
+	# downloaded instead of being made into gdata objects, which is several
+	# times faster and never holds the whole body in memory.
+	#
+	def ReadRows(self, wksht_id, columns=None):
+		uri = 'https://{0}/feeds/list/{1}/{2}/private/full'.format(self.gd_client.server, self.doc_key, wksht_id)
+		with self._Call('GetListFeed', wksht_id) as call:
+			rows = self._ReadFeed(uri, wksht_id, self.updated.get(wksht_id), ListFeedReader(columns))
+			call.rows = len(rows)
+		self.dataRows[wksht_id] = len(rows)
+		return rows
+
+	#
+	# with pageSize, rows are read with start-index / max-results, and the next
+	# page is requested while rows of the current one are being used. pages are
+	# cached separately. unlike GetRows, pages are not read at the same instant,
+	# so the worksheet should not be changed meanwhile.
+	#
+	def IterRows(self, wksht_id, columns=None, isReadOnly=False, slots=None):
+		if self.pageSize <= 0:
+			return SheetBackend.IterRows(self, wksht_id, columns, isReadOnly, slots)
+		return self._IterPages(wksht_id, columns, isReadOnly, slots or threading.Lock())
+
+	def _IterPages(self, wksht_id, columns, isReadOnly, slots):
+		def getPage(start):
+			with slots:
+				return self._GetPage(wksht_id, start, columns, isReadOnly)
+
+		pool = ThreadPool(1)
+		try:
+			page = pool.apply_async(getPage, (1,))
+			start = 1
+			while page is not None:
+				rows = page.get()
+				start += len(rows)
+				page = pool.apply_async(getPage, (start,)) if len(rows) >= self.pageSize else None
+				for row in rows:
+					yield row
+				del rows
+		finally:
+			pool.close()
+			pool.join()
+
+	def _GetPage(self, wksht_id, start, columns, isReadOnly):
+		uri = 'https://{0}/feeds/list/{1}/{2}/private/full?start-index={3}&max-results={4}'.format(
+			self.gd_client.server, self.doc_key, wksht_id, start, self.pageSize)
+		cacheKey = '{0}.{1}.{2}'.format(wksht_id, start, self.pageSize)
+		converter = gdata.spreadsheet.SpreadsheetsListFeedFromString
+		with self._Call('GetListFeed', wksht_id) as call:
+			if isReadOnly:
+				rows = self._ReadFeed(uri, cacheKey, self.updated.get(wksht_id), ListFeedReader(columns))
+			elif self.cache is None:
+				rows = self._ListRows(self._Request(lambda: self.gd_client.Get(uri, converter=converter)))
+			else:
+				rows = self._ListRows(self._GetCachedFeed(uri, cacheKey, self.updated.get(wksht_id), converter))
+			call.rows = len(rows)
+		return rows
+
+	def _ListRows(self, feed):
+		rows = []
+		for entry in feed.entry:
+			values = {}
+			for key in entry.custom:
+				text = entry.custom[key].text
+				values[key] = u'' if text is None else unicode(text)
+			rows.append(SheetRow(values, entry))
+		return rows
+
+	#
+	# rows are looked up with structured queries (sq) of up to
+	# maxQueryValues values each, instead of downloading the whole worksheet.
+	# values the query syntax cannot quote, or many of them, fall back to
+	# GetRows and its cache.
+	#
+	def FindRows(self, wksht_id, column, values):
+		values = sorted(set(values))
+		if len(values) > self.maxQueryValues * 4 or [value for value in values if '"' in value or '\\' in value]:
+			return SheetBackend.FindRows(self, wksht_id, column, values)
+
+		rows = []
+		for i in range(0, len(values), self.maxQueryValues):
+			query = gdata.spreadsheet.service.ListQuery()
+			query.sq = u' or '.join([u'{0} = "{1}"'.format(column, value)
+				for value in values[i:i + self.maxQueryValues]]).encode('utf-8')
+			with self._Call('GetListFeed', wksht_id) as call:
+				feed = self._Request(lambda: self.gd_client.GetListFeed(self.doc_key, wksht_id, query=query))
+				call.rows = len(feed.entry)
+			rows += self._ListRows(feed)
+		return rows
+
+	#
+	# after a 5xx, writes check whether the service applied them before
+	# sending them again (see RequestScheduler):
+	#   update: row already has the new values. otherwise retried against
+	#           the current version of the row.
+	#   insert: a row with the new values was added after the rows there were
+	#           before the insert. inserting again would leave a duplicate
+	#           row; rows above them are not looked at, so an equal row the
+	#           sheet already had does not count.
+	#   delete: row is gone.
+	#
+	def UpdateRow(self, wksht_id, row, data):
+		def hasApplied():
+			entry = self._FetchRow(wksht_id, row)
+			if entry is not None and self._IsSameRow(entry, data):
+				return entry
+			if entry is not None:
+				row.handle = entry
+			return None
+
+		with self._Call('UpdateRow', wksht_id) as call:
+			entry = self._Request(lambda: self.gd_client.UpdateRow(row.handle, data), hasApplied)
+			call.rows = 1
+		return isinstance(entry, gdata.spreadsheet.SpreadsheetsList)
+
+	def InsertRow(self, wksht_id, data):
+		count = self._DataRowCount(wksht_id)
+		# unknown until the insert is known to be done or not
+		self.dataRows.pop(wksht_id, None)
+		with self._Call('InsertRow', wksht_id) as call:
+			entry = self._Request(lambda: self.gd_client.InsertRow(data, self.doc_key, wksht_id),
+				lambda: self._FindInsertedRow(wksht_id, data, count))
+			call.rows = 1
+		if not isinstance(entry, gdata.spreadsheet.SpreadsheetsList):
+			return False
+		self.rowCounts[wksht_id] = self.rowCounts.get(wksht_id, 0) + 1
+		self.dataRows[wksht_id] = count + 1
+		return True
+
+	def DeleteRow(self, wksht_id, row):
+		def hasApplied():
+			entry = self._FetchRow(wksht_id, row)
+			if entry is None:
+				return True
+			row.handle = entry
+			return None
+
+		with self._Call('DeleteRow', wksht_id) as call:
+			self._Request(lambda: self.gd_client.DeleteRow(row.handle), hasApplied)
+			call.rows = 1
+		self.rowCounts[wksht_id] = self.rowCounts.get(wksht_id, 0) - 1
+		if wksht_id in self.dataRows:
+			self.dataRows[wksht_id] -= 1
+
+	#
+	# current entry of row, or None if the row does not exist any more
+	#
+	def _FetchRow(self, wksht_id, row):
+		row_id = row.handle.id.text.split('/')[-1]
+		try:
+			return self._Request(lambda: self.gd_client.GetListFeed(self.doc_key, wksht_id, row_id=row_id))
+		except gdata.service.RequestError, e:
+			if RequestScheduler.Status(e) == 404:
+				return None
+			raise
+
+	#
+	# number of list feed rows of worksheet; asked for with a one row query
+	# when not known from reading or writing the worksheet
+	#
+	def _DataRowCount(self, wksht_id):
+		count = self.dataRows.get(wksht_id)
+		if count is None:
+			query = gdata.spreadsheet.service.ListQuery()
+			query.max_results = '1'
+			with self._Call('GetListFeed', wksht_id) as call:
+				feed = self._Request(lambda: self.gd_client.GetListFeed(self.doc_key, wksht_id, query=query))
+				call.rows = len(feed.entry)
+			count = int(feed.total_results.text)
+			self.dataRows[wksht_id] = count
+		return count
+
+	#
+	# entry of a row with all values of data among the rows after the first
+	# count rows, or None. the list feed adds a row after its last row, so an
+	# applied insert is there.
+	#
+	def _FindInsertedRow(self, wksht_id, data, count):
+		query = gdata.spreadsheet.service.ListQuery()
+		query.start_index = str(count + 1)
+		feed = self._Request(lambda: self.gd_client.GetListFeed(self.doc_key, wksht_id, query=query))
+		for entry in feed.entry:
+			if self._IsSameRow(entry, data):
+				return entry
+		return None
+
+	def _IsSameRow(self, entry, data):
+		for key in data:
+			text = entry.custom[key].text if key in entry.custom else None
+			if unicode(text or u'') != unicode(data[key] or u''):
+				return False
+		return True
+
+	#
+	# write updates and inserts through the cells batch feed.
+	# the cells feed cannot remove rows, so deletes are done row by row
+	# before this; the remaining rows have shifted up accordingly.
+	#
+	def WriteRows(self, wksht_id, rows, updates, inserts, appended=0):
+		updated = [False] * len(updates)
+		inserted = [False] * len(inserts)
+		if not updates and not inserts:
+			return updated, inserted
+
+		# list feed rows start right below the header row
+		rowOf = dict([(id(row), i + 2) for i, row in enumerate(rows)])
+		rowCount = self.rowCounts.get(wksht_id, 0)
+
+		colOf = self._GetHeaderColumns(wksht_id)
+
+		# cellRows = [(row number, data, result list, index in result list)]
+		cellRows = []
+		fallbackUpdates = []
+		fallbackInserts = []
+		for i, (row, data) in enumerate(updates):
+			if self._CanWriteCells(colOf, data):
+				cellRows.append((rowOf[id(row)], data, updated, i))
+			else:
+				fallbackUpdates.append(i)
+
+		nextRow = len(rows) + 2 + appended
+		for i, data in enumerate(inserts):
+			# rows beyond current sheet size have no cells to write into
+			if nextRow <= rowCount and self._CanWriteCells(colOf, data):
+				cellRows.append((nextRow, data, inserted, i))
+				nextRow += 1
+			else:
+				fallbackInserts.append(i)
+
+		# writing the same cells again is harmless, so rows rejected because of
+		# load are simply sent again
+		attempt = 0
+		while cellRows:
+			failed = []
+			for batch in self._CellBatches(cellRows, colOf):
+				failed += self._ExecuteCellsBatch(wksht_id, colOf, batch)
+			if not failed or attempt >= self.scheduler.maxRetries:
+				break
+			self.scheduler.Backoff(attempt)
+			attempt += 1
+			cellRows = failed
+		if len(fallbackInserts) < len(inserts):
+			# rows were added through cells
+			self.dataRows.pop(wksht_id, None)
+
+		for i in fallbackUpdates:
+			updated[i] = self.UpdateRow(wksht_id, updates[i][0], updates[i][1])
+
+		for i in fallbackInserts:
+			inserted[i] = self.InsertRow(wksht_id, inserts[i])
+
+		return updated, inserted
+
+	#
+	# split cellRows into batches in order of rows. _ExecuteCellsBatch reads
+	# every cell from the first to the last row and column of a batch, so a
+	# batch ends before that area would exceed maxBatchCells; rows far apart
+	# (i.e. an update at the top and inserts at the bottom) go to different
+	# batches instead of reading the whole sheet. rows are never split across
+	# batches, so each row succeeds or fails as a whole.
+	#
+	def _CellBatches(self, cellRows, colOf):
+		batches = []
+		batch = []
+		for cellRow in sorted(cellRows, key=lambda cellRow: cellRow[0]):
+			cols = [colOf[key] for key in cellRow[1]] or [1]
+			if batch:
+				area = (cellRow[0] - batch[0][0] + 1) * (max(maxCol, max(cols)) - min(minCol, min(cols)) + 1)
+				if area > self.maxBatchCells:
+					batches.append(batch)
+					batch = []
+			if batch:
+				minCol = min(minCol, min(cols))
+				maxCol = max(maxCol, max(cols))
+			else:
+				minCol = min(cols)
+				maxCol = max(cols)
+			batch.append(cellRow)
+		if batch:
+			batches.append(batch)
+		return batches
+
+	#
+	# all columns of data must exist in the header row to be written as cells
+	#
+	def _CanWriteCells(self, colOf, data):
+		for key in data:
+			if key not in colOf:
+				return False
+		return True
+
+	#
+	# get dictionary { list feed column name : column index } from header row
+	#
+	def _GetHeaderColumns(self, wksht_id):
+		query = gdata.spreadsheet.service.CellQuery()
+		query.min_row = '1'
+		query.max_row = '1'
+		with self._Call('GetCellsFeed', wksht_id):
+			cells = self._Request(lambda: self.gd_client.GetCellsFeed(self.doc_key, wksht_id, query=query))
+
+		colOf = {}
+		for entry in cells.entry:
+			name = self._ColumnName(unicode(entry.cell.inputValue or u''))
+			if name:
+				colOf[name] = int(entry.cell.col)
+		return colOf
+
+	#
+	# write given rows in one cells batch request and store result of each row.
+	#   cellRows = [(row number, data, result list, index in result list)]
+	# returns cellRows that failed because of load, and can be sent again.
+	#
+	def _ExecuteCellsBatch(self, wksht_id, colOf, cellRows):
+		values = {}
+		for rowNum, data, results, i in cellRows:
+			for key in data:
+				value = data[key]
+				values[(rowNum, colOf[key])] = u'' if value is None else value
+
+		query = gdata.spreadsheet.service.CellQuery()
+		query.min_row = str(min([cellRow[0] for cellRow in cellRows]))
+		query.max_row = str(max([cellRow[0] for cellRow in cellRows]))
+		query.min_col = str(min([col for rowNum, col in values]))
+		query.max_col = str(max([col for rowNum, col in values]))
+		query.return_empty = 'true'
+		with self._Call('GetCellsFeed', wksht_id):
+			cells = self._Request(lambda: self.gd_client.GetCellsFeed(self.doc_key, wksht_id, query=query))
+
+		batchRequest = gdata.spreadsheet.SpreadsheetsCellsFeed()
+		for entry in cells.entry:
+			pos = (int(entry.cell.row), int(entry.cell.col))
+			if pos in values:
+				entry.cell.inputValue = values[pos]
+				batchRequest.AddUpdate(entry, batch_id_string='R{0}C{1}'.format(pos[0], pos[1]))
+
+		failed = set()
+		permanent = set()  # rows with a cell the service refused for other reasons than load
+		written = set()
+		with self._Call('ExecuteBatch', wksht_id) as call:
+			result = self._Request(lambda: self.gd_client.ExecuteBatch(batchRequest, cells.GetBatchLink().href))
+			call.rows = len(cellRows)
+		for entry in result.entry:
+			m = re.match(r'R(\d+)C(\d+)', entry.batch_id.text)
+			rowNum = int(m.group(1))
+			written.add((rowNum, int(m.group(2))))
+			if entry.batch_status is None or entry.batch_status.code != '200':
+				failed.add(rowNum)
+				code = entry.batch_status.code if entry.batch_status is not None else ''
+				if not (code.isdigit() and RequestScheduler.IsTransient(int(code))):
+					permanent.add(rowNum)
+
+		retry = []
+		for cellRow in cellRows:
+			rowNum, data, results, i = cellRow
+			for key in data:
+				if (rowNum, colOf[key]) not in written:
+					failed.add(rowNum)
+			results[i] = rowNum not in failed
+			if rowNum in failed and rowNum not in permanent:
+				retry.append(cellRow)
+		return retry
+
+	#
+	# backend for another document of the same account, sharing the
+	# authenticated client, connections, cache, profiler and scheduler
+	#
+	def ForDocument(self, doc_key):
+		backend = copy.copy(self)
+		backend.doc_key = doc_key
+		backend.names = {}
+		backend.updated = {}
+		backend.rowCounts = {}
+		backend.dataRows = {}
+		return backend
+
+	#
+	# send request through self.scheduler.
+	# a request rejected with 401 / 403 is sent once more after logging in
+	# again, as the token may have expired or been revoked since it was cached.
+	#
+	def _Request(self, request, hasApplied=None):
+		token = self.gd_client.GetClientLoginToken()
+		try:
+			return self.scheduler.Run(request, hasApplied, self.profiler.AddRetry)
+		except gdata.service.RequestError, e:
+			if RequestScheduler.Status(e) not in (401, 403):
+				raise
+		with self.loginLock:
+			# other threads rejected at the same time wait for one login
+			if self.gd_client.GetClientLoginToken() == token:
+				self._Login()
+		return self.scheduler.Run(request, hasApplied, self.profiler.AddRetry)
+
+	def _Login(self):
+		with self._Call('ProgrammaticLogin'):
+			self.scheduler.Run(self.gd_client.ProgrammaticLogin, None, self.profiler.AddRetry)
+		if self.tokens is not None:
+			self.tokens.Put(self.gd_client.email, self.gd_client.service, self.gd_client.GetClientLoginToken())
+
+	#
+	# context of Profiler.Call for a request on given worksheet
+	#
+	def _Call(self, operation, wksht_id=None):
+		return self.profiler.Call(operation, self.names.get(wksht_id, wksht_id))
+
+	#
+	# get feed through self.cache.
+	# if updated (taken from worksheets feed) matches the cached one, the feed
+	# is not downloaded at all. otherwise it is downloaded and cached with
+	# updated. feeds are read in GData protocol version 1 like every other
+	# request of gdata.spreadsheet.service, which has no ETags, so a changed
+	# worksheet is always downloaded in full.
+	#
+	def _GetCachedFeed(self, uri, wksht_id, updated, converter):
+		cached = self.cache.Get(self.doc_key, wksht_id)
+		if cached is not None:
+			meta, body = cached
+			if updated is not None and meta.get('updated') == updated:
+				return converter(body)
+
+		body = self._Request(lambda: self.gd_client.Get(uri, converter=lambda body: body))
+		feed = converter(body)
+		self.cache.Put(self.doc_key, wksht_id, {'updated': updated}, body)
+		return feed
+
+	#
+	# rows of list feed at uri, read by reader (ListFeedReader) from the http
+	# response as it arrives. with self.cache, the feed is read from the cache
+	# when updated matches like in _GetCachedFeed, and otherwise written to it
+	# while being read.
+	#
+	def _ReadFeed(self, uri, wksht_id, updated, reader):
+		if self.cache is not None and updated is not None:
+			cached = self.cache.Open(self.doc_key, wksht_id)
+			if cached is not None:
+				meta, f = cached
+				with f:
+					if meta.get('updated') == updated:
+						return reader.Read(f)
+
+		def read():
+			response = self._OpenFeed(uri)
+			try:
+				if self.cache is None:
+					return reader.Read(response)
+				return self.cache.PutFrom(self.doc_key, wksht_id, {'updated': updated},
+					lambda f: reader.Read(TeeReader(response, f)))
+			finally:
+				# rest of the body, so the connection can be used again
+				response.read()
+		return self._Request(read)
+
+	#
+	# http response of GET uri, following redirects like gd_client.Get.
+	# other statuses raise gdata.service.RequestError as Get does, so
+	# _Request retries them the same way.
+	#
+	def _OpenFeed(self, uri, redirects=4):
+		response = self.gd_client.request('GET', uri)
+		if response.status == 200:
+			return response
+		body = response.read()
+		location = response.getheader('Location')
+		if response.status == 302 and location is not None and redirects > 0:
+			return self._OpenFeed(location, redirects - 1)
+		raise gdata.service.RequestError({'status': response.status, 'reason': response.reason, 'body': body})
+
+
+#
+# reads list feed xml into SheetRows with cElementTree.iterparse, without
+# making gdata objects. only gsx columns in columns (all if None) are kept,
+# and each entry is dropped once read. Read takes a file object, so reading
+# from an http response, only the rows and the part of the body being parsed
+# are in memory. handles of the rows are None.
+#
+#   rows = ListFeedReader(['title', 'category']).Read(open('list.xml', 'rb'))
+#
+class ListFeedReader:
+	atomEntry = '{http://www.w3.org/2005/Atom}entry'
+	gsxPrefix = '{http://schemas.google.com/spreadsheets/2006/extended}'
+
+	def __init__(self, columns=None):
+		self.tags = None  # element tag:column name of wanted columns
+		if columns is not None:
+			self.tags = dict([(self.gsxPrefix + column, column) for column in columns])
+
+	def Read(self, source):
+		rows = []
+		feed = None
+		prefixLength = len(self.gsxPrefix)
+		for event, element in cElementTree.iterparse(source, ('start', 'end')):
+			if feed is None:
+				feed = element
+			elif event == 'end' and element.tag == self.atomEntry:
+				values = {}
+				for cell in element:
+					if self.tags is not None:
+						column = self.tags.get(cell.tag)
+					elif cell.tag.startswith(self.gsxPrefix):
+						column = cell.tag[prefixLength:]
+					else:
+						column = None
+					if column is not None:
+						values[column] = unicode(cell.text) if cell.text is not None else u''
+				rows.append(SheetRow(values, None))
+				feed.remove(element)
+		return rows
+
+
+#
+# file object reading from source, and writing everything read to out
+#
+class TeeReader:
+	def __init__(self, source, out):
+		self.source = source
+		self.out = out
+
+	def read(self, *args):
+		data = self.source.read(*args)
+		self.out.write(data)
+		return data
+
+
+#
+# worksheets stored in a local directory, one csv file (utf-8, first line is
+# header) per worksheet named <worksheet name>.csv. worksheet id is the
+# worksheet name. changes are kept in memory until Flush().
+#
+#   $> ./storelicense.py --backend local:./mystore
+#
+class LocalBackend(SheetBackend):
+	def __init__(self, path):
+		self.path = path
+		self.lock = threading.Lock()
+		self.worksheets = {}  # worksheet id:LocalWorksheet
+		for file_name in sorted(os.listdir(path)):
+			if file_name.endswith('.csv'):
+				self.worksheets[file_name[:-len('.csv')]] = self._ReadWorksheet(os.path.join(path, file_name))
+
+	def ListWorksheets(self):
+		return [(name, name, self.worksheets[name].updated) for name in sorted(self.worksheets)]
+
+	def GetRows(self, wksht_id):
+		sheet = self.worksheets[wksht_id]
+		with self.lock:
+			return [SheetRow(sheet.Values(cells), rowId) for rowId, cells in sheet.rows.iteritems()]
+
+	def UpdateRow(self, wksht_id, row, data):
+		sheet = self.worksheets[wksht_id]
+		with self.lock:
+			if row.handle not in sheet.rows:
+				return False
+			sheet.rows[row.handle] = sheet.Cells(data, sheet.rows[row.handle])
+			sheet.isDirty = True
+		return True
+
+	def InsertRow(self, wksht_id, data):
+		sheet = self.worksheets[wksht_id]
+		with self.lock:
+			sheet.rows[sheet.nextId] = sheet.Cells(data)
+			sheet.nextId += 1
+			sheet.isDirty = True
+		return True
+
+	def DeleteRow(self, wksht_id, row):
+		sheet = self.worksheets[wksht_id]
+		with self.lock:
+			del sheet.rows[row.handle]
+			sheet.isDirty = True
+
+	def Flush(self):
+		with self.lock:
+			for name in self.worksheets:
+				sheet = self.worksheets[name]
+				if not sheet.isDirty:
+					continue
+				path = os.path.join(self.path, name + '.csv')
+				with open(path + '.tmp', 'wb') as f:
+					writer = csv.writer(f)
+					writer.writerow([text.encode(g_charcode) for text in sheet.header])
+					for cells in sheet.rows.itervalues():
+						writer.writerow([text.encode(g_charcode) for text in cells])
+				os.rename(path + '.tmp', path)
+				sheet.isDirty = False
+				sheet.updated = '{0:.6f}'.format(os.stat(path).st_mtime)
+
+	def _ReadWorksheet(self, path):
+		with open(path, 'rb') as f:
+			lines = [[text.decode(g_charcode) for text in cells] for cells in csv.reader(f)]
+		if lines and lines[0]:
+			lines[0][0] = lines[0][0].lstrip(u'\ufeff')
+		sheet = LocalWorksheet(lines[0] if lines else [], [self._ColumnName(text) for text in (lines[0] if lines else [])])
+		for cells in lines[1:]:
+			# like list feed, empty rows are not part of the data
+			if any(cells):
+				sheet.rows[sheet.nextId] = cells + [u''] * (len(sheet.header) - len(cells))
+				sheet.nextId += 1
+		sheet.updated = '{0:.6f}'.format(os.stat(path).st_mtime)
+		return sheet
+
+
+#
+# contents of one csv file of LocalBackend.
+# each row is a list of cells aligned with header; cells under empty headers
+# are kept as they are but not visible as columns.
+#
+class LocalWorksheet:
+	def __init__(self, header, columns):
+		self.header = header  # header texts as written in file
+		self.columns = columns  # list feed column names of header
+		self.rows = collections.OrderedDict()  # row id:list of cells
+		self.nextId = 0
+		self.isDirty = False
+		self.updated = None
+
+	def Values(self, cells):
+		values = {}
+		for i, column in enumerate(self.columns):
+			if column:
+				values[column] = cells[i]
+		return values
+
+	#
+	# cells of row replaced with data; like list feed, every named column is
+	# overwritten and columns not in data become empty.
+	#
+	def Cells(self, data, cells=None):
+		cells = list(cells) if cells is not None else [u''] * len(self.columns)
+		for i, column in enumerate(self.columns):
+			if column:
+				value = data.get(column)
+				cells[i] = u'' if value is None else unicode(value)
+		return cells
+
+
+#
+# backend without any worksheet, for commands that only work on json files
+# and must not connect anywhere (validate, diff, convert)
+#
+class OfflineBackend(SheetBackend):
+	def ListWorksheets(self):
+		return []
+
+
+#
+#  Unity Store json file manager
+#  All data stored in Google docs (Spreadsheet), or any other SheetBackend
+#
+class StoreLicenseParser:
+	pattern_title = re.compile("title_([a-z\-_]+)")
+	pattern_desc = re.compile("description_([a-z\-_]+)")
+	# formats of ExportFiles
+	exportFormats = ['json', 'locale-json', 'properties']
+
+	def __init__(self, email, password, doc_key, jobs=1, batch=False, cache=None, backend=None, profiler=None,
+			scheduler=None):
+		self.profiler = profiler if profiler is not None else Profiler()
+		if backend is None:
+			with self.profiler.Phase('login'):
+				backend = GDataBackend(email, password, doc_key, cache, None, self.profiler, scheduler)
+		self.backend = backend
+		self.doc_key = doc_key
+		self.curr_wksht_id = 'default'
+		self.knownSheets = ['default', 'notes', 'platform', 'how to use']
+		self.sheets = {}  # name:id dictionary of each sheets
+		self.sheetUpdated = {}  # name:'updated' timestamp dictionary of each sheets
+		self.features = {}  # all values representation
+		self.jobs = max(1, jobs)  # number of concurrent requests
+		self.requestSlots = threading.BoundedSemaphore(self.jobs)
+		self.logLock = threading.Lock()
+		self.logPrefix = ''  # put before each line of log, i.e. document key in batch mode
+		self.batch = batch  # write many rows at once with SheetBackend.WriteRows
+		self.journal = None  # UploadJournal to record writes in, if any
+		# features loaded from google docs keep the texts made for export
+		# (see StoreLicenseInfo.KeepFragments), for exporting them again (--watch)
+		self.keepFragments = False
+		# login and get all necessary information from spreadsheet on google
+		# docs
+		self._GetAllWorksheetsIds()
+
+	# Get the list of worksheets
+	# sheets removed from the document since the last call are forgotten.
+	def _GetAllWorksheetsIds(self):
+		with self.profiler.Phase('worksheets'):
+			worksheets = self.backend.ListWorksheets()
+		sheets = {}
+		sheetUpdated = {}
+		for worksheet_name, worksheet_id, updated in worksheets:
+			sheets[worksheet_name] = worksheet_id
+			sheetUpdated[worksheet_name] = updated
+		self.sheets = sheets
+		self.sheetUpdated = sheetUpdated
+
+	#
+	# names of sheets holding features: default, platform, notes and locales
+	#
+	def _DocumentSheets(self):
+		# if not known sheet, must be for localization:
+		localeSheets = [key for key in self.sheets if key not in self.knownSheets]
+		return ['default', 'platform', 'notes'] + localeSheets
+
+	#
+	# Get all sheets and make intermediate object for exporting/importing.
+	# rows of sheets in sheetRows { sheet name : list of SheetRow } are used
+	# instead of downloading them.
+	#
+	def _SheetToObject(self, sheetRows=None):
+		sheetNames = self._DocumentSheets()
+		if sheetRows is None:
+			sheetRows = {}
+
+		# with more than one job, download every sheet first and then join them
+		# in the same order as the serial path, so the result is identical.
+		if self.jobs > 1:
+			missing = [name for name in sheetNames if name not in sheetRows]
+			if missing:
+				sheetRows = dict(sheetRows)
+				sheetRows.update(self._FetchRows(missing, True))
+
+		previous = self.features
+		self.features = {}
+		with self.profiler.Phase('parse', 'default'):
+			self._ParseDefaultSheet(sheetRows.get('default'))
+		with self.profiler.Phase('parse', 'platform'):
+			self._ParsePlatformSheet(sheetRows.get('platform'))
+		with self.profiler.Phase('parse', 'notes'):
+			self._ParseNotesSheet(sheetRows.get('notes'))
+
+		for key in sheetNames[3:]:
+			with self.profiler.Phase('parse', key):
+				self._ParseLocalizedSheet(key, sheetRows.get(key))
+
+		# loading again (i.e. --watch) keeps features that did not change, so
+		# their fragments made by the last export are used again
+		for key, obj in previous.iteritems():
+			if key in self.features and obj.HasSameContents(self.features[key]):
+				self.features[key] = obj
+		if self.keepFragments:
+			for obj in self.features.itervalues():
+				obj.KeepFragments()
+
+	#
+	# get rows of given sheet name. with isReadOnly, rows only hold the
+	# columns _Parse*Sheet use and can not be written (see SheetBackend.ReadRows).
+	#
+	def _GetRows(self, sheet_name, isReadOnly=False):
+		with self.profiler.Phase('fetch', sheet_name):
+			return self._GetRowsUnprofiled(sheet_name, isReadOnly)
+
+	#
+	# get rows of given sheet names in parallel, using self.jobs workers.
+	# returns dictionary { sheet name : list of SheetRow }
+	#
+	def _FetchRows(self, sheet_names, isReadOnly=False):
+		pool = ThreadPool(min(self.jobs, max(1, len(sheet_names))))
+		try:
+			with self.profiler.Phase('fetch'):
+				rows = pool.map(lambda sheet_name: self._GetRowsUnprofiled(sheet_name, isReadOnly), sheet_names)
+		finally:
+			pool.close()
+			pool.join()
+		return dict(zip(sheet_names, rows))
+
+	def _GetRowsUnprofiled(self, sheet_name, isReadOnly=False):
+		with self.requestSlots:
+			if self.backend.pageSize > 0:
+				columns = self._ParsedColumns(sheet_name) if isReadOnly else None
+				return list(self.backend.IterRows(self.sheets[sheet_name], columns, isReadOnly))
+			if isReadOnly:
+				return self.backend.ReadRows(self.sheets[sheet_name], self._ParsedColumns(sheet_name))
+			return self.backend.GetRows(self.sheets[sheet_name])
+
+	#
+	# rows of given sheet for a single pass over them. with page size of the
+	# backend, this is an iterator reading them a page at a time, so only a
+	# page or two are in memory; otherwise the list of _GetRows.
+	#
+	def _StreamRows(self, sheet_name, isReadOnly=False):
+		if self.backend.pageSize <= 0:
+			return self._GetRows(sheet_name, isReadOnly)
+		columns = self._ParsedColumns(sheet_name) if isReadOnly else None
+		return self.backend.IterRows(self.sheets[sheet_name], columns, isReadOnly, self.requestSlots)
+
+	#
+	# list feed columns _Parse*Sheet read from sheet; other columns are ignored
+	#
+	def _ParsedColumns(self, sheet_name):
+		if sheet_name == 'default':
+			return ['title', 'description', 'category']
+		elif sheet_name in ('platform', 'notes'):
+			return ['ref-title'] + StoreLicenseInfo.knownPlatforms
+		return ['ref-title', 'title', 'description']
+
+	#
+	# takes care of 'default' sheet
+	#
+	def _ParseDefaultSheet(self, rows=None):
+		if rows is None:
+			rows = self._StreamRows('default', True)
+
+		for row in rows:
+			obj = StoreLicenseInfo()
+			for key, s in row.values.iteritems():
+				if key == 'title':
+					obj.title[StoreLicenseInfo.default_locale] = s
+				elif key == 'description':
+					obj.description[StoreLicenseInfo.default_locale] = s
+				elif key == 'category':
+					obj.category = s
+			self.features[ obj.title[StoreLicenseInfo.default_locale] ] = obj
+
+	#
+	# takes care of platform checksheet
+	#
+	def _ParsePlatformSheet(self, rows=None):
+		if rows is None:
+			rows = self._StreamRows('platform', True)
+
+		for row in rows:
+			ref_title = ''
+			plaf_dic = {}
+
+			for key, s in row.values.iteritems():
+				if key == 'ref-title':
+					ref_title = s
+				else:
+					plaf_dic[key] = (s.strip() == 'check')
+
 			try:
-				obj = self.features[feature]
-				newData = {}
-				isDirty = False
-				for key in StoreLicenseInfo.knownPlatforms:
-					newData[key] = obj.notes[key]
-					isDirty |= entry.custom[key].text != newData[key]
-				newData['ref-title'] = obj.title[StoreLicenseInfo.default_locale]
-				entry = self.gd_client.InsertRow(newData, self.doc_key, self.sheets['notes'])
-				if not isinstance(entry, gdata.spreadsheet.SpreadsheetsList):
-					print '[Notes]: Error: Failed to add {0}'.format(feature)
+				obj = self.features[ref_title]
+				obj.platform = plaf_dic
+			except KeyError:
+				print 'ParsePlatform: {0} not found.'.format(ref_title)
+				pass
+
+	#
+	# takes care of notes sheet
+	#
+	def _ParseNotesSheet(self, rows=None):
+		if rows is None:
+			rows = self._StreamRows('notes', True)
+
+		for row in rows:
+			ref_title = ''
+			note_dic = {}
+
+			for key, s in row.values.iteritems():
+				if key == 'ref-title':
+					ref_title = s
+				else:
+					note_dic[key] = s
+
+			try:
+				obj = self.features[ref_title]
+				obj.notes = note_dic
+			except KeyError:
+				print 'ParseNote: {0} not found.'.format(ref_title)
+				pass
+
+	#
+	# takes care of localization sheet for all locales found
+	#
+	def _ParseLocalizedSheet(self, lang, rows=None):
+		if rows is None:
+			rows = self._StreamRows(lang, True)
+
+		for row in rows:
+			ref_title = ''
+			localized_title = ''
+			localized_desc = ''
+
+			for key, s in row.values.iteritems():
+				if key == 'ref-title':
+					ref_title = s
+				elif key == 'title':
+					localized_title = s
+				elif key == 'description':
+					localized_desc = s
+
+			try:
+				obj = self.features[ref_title]
+				obj.title[lang] = localized_title
+				obj.description[lang] = localized_desc
+			except KeyError:
+				print 'ParseLocalized: {0} for {1} not found.'.format(ref_title, lang)
+				pass
+
+	#
+	# prepare internal data structure from google docs contents, see
+	# _SheetToObject for sheetRows
+	#
+	def LoadDocumentFromGoogleDocs(self, sheetRows=None):
+		self._SheetToObject(sheetRows)
+
+	#
+	# prepare internal data structure from given json file
+	#
+	def LoadDocumentFromJSONFile(self, file_path):
+		with self.profiler.Phase('read json'):
+			for feature in JSONFeatureReader(file_path):
+				self.features[feature['title']] = self._FeatureToObject(feature)
+
+	#
+	# make StoreLicenseInfo from one element of "features" in json file
+	#
+	def _FeatureToObject(self, feature):
+		obj = StoreLicenseInfo()
+		for key in feature:
+			if key == 'title':
+				obj.title[StoreLicenseInfo.default_locale] = feature[key]
+			elif key == 'description':
+				obj.description[
+					StoreLicenseInfo.default_locale] = feature[key]
+			elif key == 'category':
+				obj.category = feature[key]
+			elif key == 'platform':
+				pf_list = feature[key]
+				for i in range(len(StoreLicenseInfo.knownPlatforms)):
+					obj.platform[StoreLicenseInfo.knownPlatforms[
+						i]] = (pf_list[i].strip() == 'check')
+			elif key == 'notes':
+				nt_list = feature[key]
+				for i in range(len(StoreLicenseInfo.knownPlatforms)):
+					obj.notes[
+						StoreLicenseInfo.knownPlatforms[i]] = nt_list[i]
+			else:
+				# if none of known keys, try find localized title/desc
+				search_localized_title = self.pattern_title.search(key)
+				if search_localized_title:
+					locale = search_localized_title.groups(0)[0]
+					obj.title[locale] = feature[key]
+				else:
+					search_localized_desc = self.pattern_desc.search(key)
+					if search_localized_desc:
+						locale = search_localized_desc.groups(0)[0]
+						obj.description[locale] = feature[key]
+		return obj
+
+	#
+	# upload given json file to google doc, reading chunkSize features at a time.
+	# only one chunk of features from the file is held in memory; with
+	# isFullSync, titles of all features are remembered to remove the rest at
+	# the end. the rows of every worksheet are read once at the start and kept
+	# for the whole upload, to find the rows of each chunk, so memory still
+	# grows with the size of the document on Google Docs.
+	#
+	def UploadJSONFileInChunks(self, file_path, isFullSync, chunkSize, isPlan=False):
+		localeSheets = [key for key in self.sheets if key not in self.knownSheets]
+		sheetRows = self._FetchRows(['default', 'platform', 'notes'] + localeSheets)
+
+		appended = {}  # sheet name:number of rows added by previous chunks
+		known = set()
+		self.features = {}
+		for feature in JSONFeatureReader(file_path):
+			self.features[feature['title']] = self._FeatureToObject(feature)
+			if len(self.features) >= chunkSize:
+				known.update(self.features)
+				self._UploadChunk(sheetRows, appended, isPlan)
+		if self.features:
+			known.update(self.features)
+			self._UploadChunk(sheetRows, appended, isPlan)
+
+		if isFullSync and self.jobs > 1 and not isPlan:
+			UploadPipeline(self, True, sheetRows, known).Run()
+		elif isFullSync:
+			changes = self.ComputeChangeSet(True, sheetRows, known)
+			if isPlan:
+				self.PrintChangeSet(changes)
+			else:
+				self.ApplyChangeSet(changes)
+
+	def _UploadChunk(self, sheetRows, appended, isPlan):
+		if self.jobs > 1 and not isPlan:
+			UploadPipeline(self, False, sheetRows, appended=appended).Run()
+			self.features = {}
+			return
+
+		changes = self.ComputeChangeSet(False, sheetRows)
+		for change in changes:
+			change.appended = appended.get(change.sheet_name, 0)
+			appended[change.sheet_name] = change.appended + len(change.inserts)
+		if isPlan:
+			self.PrintChangeSet(changes)
+		else:
+			self.ApplyChangeSet(changes)
+		self.features = {}
+
+	#
+	# print internal structure in json form
+	#
+	def ExportSheet(self, out=None):
+		if out is None:
+			out = sys.stdout
+		with self.profiler.Phase('export'):
+			self._WriteJSON(out)
+
+	#
+	# write json to file_path, replacing it only when complete so that readers
+	# never see a partial file. returns list of the path written.
+	#
+	def ExportSheetToFile(self, file_path):
+		try:
+			with open(file_path + '.tmp', 'wb') as f:
+				self.ExportSheet(f)
+		except:
+			os.remove(file_path + '.tmp')
+			raise
+		os.rename(file_path + '.tmp', file_path)
+		return [file_path]
+
+	#
+	# write internal structure in json form to file object, one feature at a time.
+	# output is the same as json.dumps(document, sort_keys=True, indent=4).
+	#
+	def _WriteJSON(self, out):
+		FeatureExporter(self.features).Run([JSONSink(out)])
+
+	#
+	# write features to files in directory, in one pass over them:
+	#   'json'        : store.json, as ExportSheet writes it
+	#   'locale-json' : <locale>.json for each locale (see LocaleJSONSink)
+	#   'properties'  : <locale>.properties for each locale (see PropertiesSink)
+	# files of different locales are written concurrently with self.jobs threads.
+	# with isIncremental, only files whose contents change are written, files
+	# of locales no longer in the document are removed (see ExportManifest),
+	# and the rest are left untouched.
+	# returns list of paths written, changed or removed.
+	#
+	def ExportFiles(self, directory, formats, isIncremental=False):
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		outputs = []  # (file name, format, function making sink that writes to given file)
+		if 'json' in formats:
+			outputs.append(('store.json', 'json', JSONSink))
+		for locale in self.Locales():
+			if 'locale-json' in formats:
+				outputs.append((locale + '.json', 'locale-json', lambda out, locale=locale: LocaleJSONSink(out, locale)))
+			if 'properties' in formats:
+				outputs.append((locale + '.properties', 'properties', lambda out, locale=locale: PropertiesSink(out, locale)))
+
+		manifest = None
+		if isIncremental:
+			manifest = ExportManifest(directory)
+			with self.profiler.Phase('hash'):
+				stale = set(manifest.Compare(self.features, [(name, makeSink(None)) for name, fileFormat, makeSink in outputs]))
+			outputs = [output for output in outputs if output[0] in stale]
+
+		files = []
+		sinks = []
+		try:
+			for name, fileFormat, makeSink in outputs:
+				path = os.path.join(directory, name)
+				if manifest is not None:
+					files.append(HashingWriter(open(path + '.tmp', 'wb')))
+				else:
+					files.append(open(path, 'wb'))
+				sinks.append(makeSink(files[-1]))
+			with self.profiler.Phase('export'):
+				FeatureExporter(self.features, self.jobs).Run(sinks)
+		except:
+			for f in files:
+				f.close()
+				if manifest is not None:
+					os.remove(f.name)
+			raise
+		for f in files:
+			f.close()
+		if manifest is None:
+			return [f.name for f in files]
+
+		changed = [name for (name, fileFormat, makeSink), f in zip(outputs, files)
+				   if manifest.Commit(name, fileFormat, f.name, f.hexdigest())]
+		changed += manifest.RemoveOthers(formats)
+		manifest.Save()
+		return [os.path.join(directory, name) for name in sorted(changed)]
+
+	#
+	# locales of title or description of any feature, sorted
+	#
+	def Locales(self):
+		locales = set()
+		for obj in self.features.itervalues():
+			locales.update(obj.title)
+			locales.update(obj.description)
+		return sorted(locales)
+
+	#
+	# upload internal structure to google doc, returns list of SheetChangeSet
+	#
+	def UploadSheet(self, isFullSync):
+		if self.jobs > 1 and self.journal is None:
+			return UploadPipeline(self, isFullSync).Run()
+		changes = self.ComputeChangeSet(isFullSync)
+		if self.jobs > 1:
+			# with a journal, all writes are planned before the first one
+			self.journal.Start(self.doc_key, changes)
+			try:
+				UploadPipeline(self, isFullSync, changes=changes).Run()
+			finally:
+				self.journal.Close()
+			self.journal.Finish()
+		else:
+			self.ApplyChangeSet(changes)
+		return changes
+
+	#
+	# compare local data with all sheets on google docs and return
+	# list of SheetChangeSet, without writing anything.
+	#   sheetRows: already read { sheet name : list of SheetRow }, if any
+	#   known: titles to keep with isFullSync, defaults to self.features
+	#
+	def ComputeChangeSet(self, isFullSync, sheetRows=None, known=None):
+		sheetSpecs = self._SheetSpecs()
+
+		if sheetRows is None:
+			sheetRows = {}
+			if self.jobs > 1:
+				sheetRows = self._FetchRows([spec[1] for spec in sheetSpecs])
+		if known is None:
+			known = self.features
+
+		changes = []
+		for label, sheet_name, keyColumn, rowData in sheetSpecs:
+			changes.append(self._DiffSheet(SheetChangeSet(label, sheet_name, sheetRows.get(sheet_name)),
+				keyColumn, isFullSync, known, rowData))
+		return changes
+
+	#
+	# list of (label, sheet name, key column, row data function) of every
+	# sheet to upload, in the order they are written
+	#
+	def _SheetSpecs(self):
+		localeSheets = [key for key in self.sheets if key not in self.knownSheets]
+		specs = [('Default', 'default', 'title', self._DefaultRowData),
+				 ('Platform', 'platform', 'ref-title', self._PlatformRowData),
+				 ('Notes', 'notes', 'ref-title', self._NotesRowData)]
+		for key in localeSheets:
+			rowData = lambda obj, row, lang=key: self._LocalizedRowData(lang, obj, row)
+			specs.append(('Localization({0})'.format(key), key, 'ref-title', rowData))
+		return specs
+
+	#
+	# upload changes of given DocumentChangeSet, returns list of SheetChangeSet.
+	# only rows of the features in it are read and written, so a small
+	# changeset takes a few requests however large the document is.
+	#
+	def UploadChangeSet(self, documentChanges, isPlan=False):
+		changes = self.ComputeChangeSetFrom(documentChanges)
+		if isPlan:
+			self.PrintChangeSet(changes)
+			return changes
+		self._ApplyUnbatched(changes)
+		return changes
+
+	#
+	# list of SheetChangeSet making the changes of given DocumentChangeSet.
+	# a sheet is only read (with SheetBackend.FindRows, for rows of the
+	# features in the changeset) when it has changes: added and removed
+	# features touch every sheet, modified ones only the sheets of their
+	# changed keys.
+	#
+	def ComputeChangeSetFrom(self, documentChanges):
+		added = dict([(feature['title'], self._FeatureToObject(feature)) for feature in documentChanges.added])
+		removed = set(documentChanges.removed)
+		changes = []
+		for label, sheet_name, keyColumn, rowData in self._SheetSpecs():
+			modified = {}
+			for entry in documentChanges.modified:
+				columns = self._ModifiedColumns(sheet_name, entry['fields'])
+				if columns:
+					modified[entry['title']] = columns
+			keys = set(added) | removed | set(modified)
+			if not keys:
+				continue
+
+			with self.profiler.Phase('fetch', sheet_name):
+				rows = self.backend.FindRows(self.sheets[sheet_name], keyColumn, keys)
+			change = SheetChangeSet(label, sheet_name, rows)
+			with self.profiler.Phase('diff', sheet_name):
+				found = set()
+				for row in rows:
+					key = row.values[keyColumn]
+					found.add(key)
+					if key in removed:
+						change.deletes.append((key, row))
+						continue
+					if key in added:
+						newData = rowData(added[key], row)
+					else:
+						newData = dict(row.values)
+						newData.update(modified[key])
+					if self._ChangedColumns(row, newData):
+						change.updates.append((key, row, newData))
+
+				for key in sorted(keys - found - removed):
+					if key in added:
+						newData = rowData(added[key], None)
+					else:
+						newData = dict(modified[key])
+						newData[keyColumn] = key
+					change.inserts.append((key, newData))
+			changes.append(change)
+		return changes
+
+	#
+	# { column : text } of given sheet for the changed keys of a modified
+	# feature (see DocumentChangeSet)
+	#
+	def _ModifiedColumns(self, sheet_name, fields):
+		columns = {}
+		if sheet_name == 'default':
+			for key in ('description', 'category'):
+				if key in fields:
+					columns[key] = fields[key] or u''
+		elif sheet_name == 'platform' and fields.get('platform') is not None:
+			for i, key in enumerate(StoreLicenseInfo.knownPlatforms):
+				columns[key] = u'check' if fields['platform'][i].strip() == 'check' else u''
+		elif sheet_name == 'notes' and fields.get('notes') is not None:
+			for i, key in enumerate(StoreLicenseInfo.knownPlatforms):
+				columns[key] = fields['notes'][i]
+		elif sheet_name not in self.knownSheets:
+			for key in ('title', 'description'):
+				name = '{0}_{1}'.format(key, sheet_name)
+				# like --upload, texts of a locale no longer in the feature are kept
+				if fields.get(name) is not None:
+					columns[key] = fields[name]
+		return columns
+
+	#
+	# write all changes in given list of SheetChangeSet, recording them in
+	# self.journal if any
+	#
+	def ApplyChangeSet(self, changes):
+		if self.journal is not None:
+			self.journal.Start(self.doc_key, changes)
+		try:
+			for change in changes:
+				if not change.IsEmpty():
+					with self.profiler.Phase('write', change.sheet_name):
+						self._CommitSheetChanges(change)
+			with self.profiler.Phase('write'):
+				self.backend.Flush()
+		finally:
+			if self.journal is not None:
+				self.journal.Close()
+		if self.journal is not None:
+			self.journal.Finish()
+
+	#
+	# ApplyChangeSet without batch writes, for changes whose rows were looked
+	# up one by one (SheetBackend.FindRows), so the positions batch writes
+	# need are not known
+	#
+	def _ApplyUnbatched(self, changes):
+		isBatch, self.batch = self.batch, False
+		try:
+			self.ApplyChangeSet(changes)
+		finally:
+			self.batch = isBatch
+
+	#
+	# finish the upload recorded in self.journal. rows of the writes not done
+	# yet are looked up by key (SheetBackend.FindRows), and each write is made
+	# only if still needed: a row to insert may already be there, or a row to
+	# delete already gone. so only the remaining rows are read and written.
+	# returns list of SheetChangeSet, None if there is no journal.
+	#
+	def ResumeUpload(self, isPlan=False):
+		pending = UploadJournal.Read(self.journal.file_path)
+		if pending is None:
+			return None
+		doc_key, plans = pending
+		if doc_key != self.doc_key:
+			raise ValueError('{0} is a journal of document {1}'.format(self.journal.file_path, doc_key))
+
+		keyColumns = dict([(spec[1], spec[2]) for spec in self._SheetSpecs()])
+		changes = []
+		for label, sheet_name, deletes, updates, inserts in plans:
+			updates = dict(updates)
+			inserts = dict(inserts)
+			keys = set(deletes) | set(updates) | set(inserts)
+			if not keys:
+				continue
+			keyColumn = keyColumns[sheet_name]
+			with self.profiler.Phase('fetch', sheet_name):
+				rows = self.backend.FindRows(self.sheets[sheet_name], keyColumn, keys)
+			found = collections.defaultdict(list)
+			for row in rows:
+				found[row.values[keyColumn]].append(row)
+
+			change = SheetChangeSet(label, sheet_name)
+			for key in sorted(set(deletes)):
+				change.deletes += [(key, row) for row in found[key]]
+			for key in sorted(updates):
+				change.updates += [(key, row, updates[key]) for row in found[key]
+								   if self._ChangedColumns(row, updates[key])]
+			for key in sorted(inserts):
+				if not found[key]:
+					change.inserts.append((key, inserts[key]))
+			changes.append(change)
+
+		if isPlan:
+			self.PrintChangeSet(changes)
+			return changes
+		self._ApplyUnbatched(changes)
+		return changes
+
+	#
+	# print given list of SheetChangeSet for review (--plan)
+	#
+	def PrintChangeSet(self, changes):
+		for change in changes:
+			self._Log('[{0}]: {1} to add, {2} to update, {3} to remove'.format(
+				change.label, len(change.inserts), len(change.updates), len(change.deletes)))
+			for feature, row in change.deletes:
+				self._Log('[{0}]:   - {1}'.format(change.label, feature))
+			for feature, row, newData in change.updates:
+				self._Log('[{0}]:   ~ {1} ({2})'.format(change.label, feature,
+					', '.join(self._ChangedColumns(row, newData))))
+			for feature, newData in change.inserts:
+				self._Log('[{0}]:   + {1}'.format(change.label, feature))
+
+	#
+	# compute inserts/updates/deletes of one sheet in a single pass over its rows.
+	# rows are matched to self.features by keyColumn ('title' or 'ref-title'),
+	# rows not in known are removed with isFullSync,
+	# rowData(obj, row) returns new row contents (row is None for new rows).
+	#
+	def _DiffSheet(self, change, keyColumn, isFullSync, known, rowData):
+		with self.profiler.Phase('diff', change.sheet_name):
+			rows = change.rows
+			if rows is None:
+				rows = self._StreamRows(change.sheet_name)
+				# batch writes need positions of all rows; otherwise only rows
+				# to update or delete are kept
+				if self.batch and not isinstance(rows, list):
+					rows = list(rows)
+				if isinstance(rows, list):
+					change.rows = rows
+
+			existing = set()
+			for row in rows:
+				strTitle = row.values[keyColumn]
+				existing.add(strTitle)
+
+				#
+				# removing unexisting entries
+				if strTitle not in known:
+					if isFullSync:
+						change.deletes.append((strTitle, row))
+					continue
+				if strTitle not in self.features:
+					continue
+
+				#
+				# modifying existing entries with local data
+				try:
+					newData = rowData(self.features[strTitle], row)
+					if self._ChangedColumns(row, newData):
+						change.updates.append((strTitle, row, newData))
+				except KeyError:
+					pass  # don't worry if column or locale is not found
+
+			#
+			# adding new entries only exist in local data
+			for feature in self.features:
+				if feature in existing:
+					continue
+				try:
+					change.inserts.append((feature, rowData(self.features[feature], None)))
+				except KeyError:
+					self._Log('[{0}]: FATAL: Object for "{1}" not found.'.format(change.label, feature))
+
+		return change
+
+	#
+	# list of columns in newData that differ from row. empty cells are
+	# compared as empty strings.
+	#
+	def _ChangedColumns(self, row, newData):
+		changed = []
+		for key in newData:
+			new = u'' if newData[key] is None else newData[key]
+			if row.values[key] != new:
+				changed.append(key)
+		return changed
+
+	#
+	# row contents of each sheet for given feature
+	#
+	def _DefaultRowData(self, obj, row):
+		newData = {}
+		newData['title'] 		= obj.title[StoreLicenseInfo.default_locale]
+		newData['description'] 	= obj.description[StoreLicenseInfo.default_locale]
+		newData['category'] 	= obj.category
+		return newData
+
+	def _PlatformRowData(self, obj, row):
+		newData = {}
+		for key in StoreLicenseInfo.knownPlatforms:
+			newData[key] = 'check' if obj.platform[key] else ''
+		newData['ref-title'] = obj.title[StoreLicenseInfo.default_locale]
+		return newData
+
+	def _NotesRowData(self, obj, row):
+		newData = {}
+		for key in StoreLicenseInfo.knownPlatforms:
+			newData[key] = obj.notes[key]
+		newData['ref-title'] = obj.title[StoreLicenseInfo.default_locale]
+		return newData
+
+	def _LocalizedRowData(self, lang, obj, row):
+		newData = {}
+		# keep sheet contents for locales missing in local data
+		try:
+			newData['title'] 	= obj.title[lang]
+		except KeyError:
+			newData['title']	= row.values['title'] if row is not None else ''
+
+		try:
+			newData['description'] 	= obj.description[lang]
+		except KeyError:
+			newData['description']	= row.values['description'] if row is not None else ''
+
+		newData['ref-title'] 	= obj.title[StoreLicenseInfo.default_locale]
+		return newData
+
+	#
+	# send changes of one sheet to backend.
+	#
+	def _CommitSheetChanges(self, change):
+		self._CommitDeletes(change)
+		self._CommitWrites(change)
+
+	def _CommitDeletes(self, change):
+		label = change.label
+		wksht_id = self.sheets[change.sheet_name]
+		for feature, row in change.deletes:
+			self._Log('[{0}]: Removing item:{1}'.format(label, feature))
+			with self.requestSlots:
+				self.backend.DeleteRow(wksht_id, row)
+			change.removed.add(id(row))
+			self._JournalDone(change, 'delete', feature)
+
+	#
+	# write updates and inserts of change.
+	# beforeInserts, if given, is called before the first row is added.
+	#
+	def _CommitWrites(self, change, beforeInserts=None):
+		label = change.label
+		wksht_id = self.sheets[change.sheet_name]
+		if self.batch:
+			if beforeInserts is not None and change.inserts:
+				beforeInserts()
+			remaining = [row for row in change.rows if id(row) not in change.removed]
+			with self.requestSlots:
+				updated, inserted = self.backend.WriteRows(wksht_id, remaining,
+					[(row, newData) for feature, row, newData in change.updates],
+					[newData for feature, newData in change.inserts], change.appended)
+			for (feature, row, newData), isDone in zip(change.updates, updated):
+				if isDone:
+					self._Log("[{0}]: Updating:{1}".format(label, feature))
+					self._JournalDone(change, 'update', feature)
 				else:
-					print '[Notes]: Adding:{0}'.format(feature)
-			except KeyError:
-				print '[Notes]: FATAL: Object for "{0}" not found.'.format(feature)
-				pass  # don't worry if strTitle is not found
+					self._Log('[{0}]: Error: Failed to update {1}'.format(label, feature))
+		else:
+			for feature, row, newData in change.updates:
+				self._Log("[{0}]: Updating:{1}".format(label, feature))
+				with self.requestSlots:
+					self.backend.UpdateRow(wksht_id, row, newData)
+				self._JournalDone(change, 'update', feature)
+			inserted = None
+			if beforeInserts is not None and change.inserts:
+				beforeInserts()
+
+		for i, (feature, newData) in enumerate(change.inserts):
+			if inserted is not None:
+				isDone = inserted[i]
+			else:
+				with self.requestSlots:
+					isDone = self.backend.InsertRow(wksht_id, newData)
+			if not isDone:
+				self._Log('[{0}]: Error: Failed to add {1}'.format(label, feature))
+			else:
+				self._Log('[{0}]: Adding:{1}'.format(label, feature))
+				self._JournalDone(change, 'insert', feature)
 
 	#
-	# update sheet from local data: for localization
+	# record a confirmed write of change in self.journal, if any
 	#
-	def _UpdateLocalizedSheet(self, isFullSync, lang):
-		feed = self.gd_client.GetListFeed(self.doc_key, self.sheets[lang])
+	def _JournalDone(self, change, kind, feature):
+		if self.journal is not None:
+			self.journal.Done(change.sheet_name, kind, feature)
 
-		existing_feature_list = []
-		for i, entry in enumerate(feed.entry):
-			existing_feature_list.append(unicode(entry.custom['ref-title'].text))
-
-		#
-		# removing unexisting entries
-		if isFullSync:
-			removing_item_set = set(existing_feature_list) - set(self.features.keys())
-			for feature in removing_item_set:
-				for i, entry in enumerate(feed.entry):
-					if feature == unicode(entry.custom['ref-title'].text):
-						print '[Localization({0})]: Removing item:{1}'.format(lang, feature)
-						self.gd_client.DeleteRow(entry)
-
-		#
-		# modifying existing entries with local data
-		for i, entry in enumerate(feed.entry):
-			strTitle = unicode(entry.custom['ref-title'].text)
-			try:
-				obj = self.features[strTitle]
-				newData = {}
-				isDirty = False
+	#
+	# print one line of log; lines from concurrent sheets are not mixed up
+	#
+	def _Log(self, message):
+		with self.logLock:
+			print self.logPrefix + message
 
-				try:
-					newData['title'] 	= obj.title[lang]
-				except KeyError:
-					newData['title']	= entry.custom['title'].text
 
-				try:
-					newData['description'] 	= obj.description[lang]
-				except KeyError:
-					newData['description']	= entry.custom['description'].text
+#
+# uploads all sheets concurrently, each sheet going through fetch, diff and
+# write on its own thread, so one sheet is fetched and compared while rows of
+# another are being written. parser.requestSlots keeps at most parser.jobs
+# requests in flight across all sheets.
+#
+# platform, notes and locale rows refer to default rows by title, so writes
+# are ordered to never leave a row pointing to a missing title:
+#   - rows are added to other sheets only after they are added to default
+#   - rows are removed from default only after they are removed from all
+#     other sheets
+#
+#   UploadPipeline(parser, isFullSync).Run()
+#
+class UploadPipeline:
+	def __init__(self, parser, isFullSync, sheetRows=None, known=None, appended=None, changes=None):
+		self.parser = parser
+		self.isFullSync = isFullSync
+		self.sheetRows = sheetRows or {}  # already read { sheet name : list of SheetRow }
+		self.known = known if known is not None else parser.features
+		self.appended = appended  # sheet name:rows added by previous chunks, updated
+		self.planned = dict([(change.sheet_name, change) for change in changes or []])  # SheetChangeSet already computed
+		self.sheetSpecs = parser._SheetSpecs()
+		self.defaultInserted = threading.Event()
+		self.deleted = dict([(spec[1], threading.Event()) for spec in self.sheetSpecs if spec[1] != 'default'])
+		self.isFailed = False
+		self.errors = []  # sys.exc_info() of failed sheets, first failure first
+		self.lock = threading.Lock()
+		self.changes = {}  # sheet name:SheetChangeSet
 
-				newData['ref-title'] 	= obj.title[StoreLicenseInfo.default_locale]
+	def Run(self):
+		threads = []
+		for spec in self.sheetSpecs:
+			thread = threading.Thread(target=self._RunSheet, args=spec)
+			thread.daemon = True
+			thread.start()
+			threads.append(thread)
+		for thread in threads:
+			# join with timeout to keep Ctrl-C working
+			while thread.isAlive():
+				thread.join(0.5)
 
-				isDirty = ( entry.custom['title'].text != newData['title'] )
-				isDirty |= ( entry.custom['description'].text != newData['description'] )
+		if self.errors:
+			raise self.errors[0][0], self.errors[0][1], self.errors[0][2]
+		with self.parser.requestSlots:
+			self.parser.backend.Flush()
+		return [self.changes[spec[1]] for spec in self.sheetSpecs]
 
-				if isDirty:
-					print "[Localization({0})]: Updating:{1}".format(lang, strTitle)
-					self.gd_client.UpdateRow(entry,newData)
-			except KeyError:
-				pass  # don't worry if strTitle is not found
+	def _RunSheet(self, label, sheet_name, keyColumn, rowData):
+		parser = self.parser
+		try:
+			change = self.planned.get(sheet_name)
+			if change is None:
+				change = parser._DiffSheet(SheetChangeSet(label, sheet_name, self.sheetRows.get(sheet_name)),
+					keyColumn, self.isFullSync, self.known, rowData)
+			if self.appended is not None:
+				change.appended = self.appended.get(sheet_name, 0)
+				self.appended[sheet_name] = change.appended + len(change.inserts)
+			self.changes[sheet_name] = change
+
+			with parser.profiler.Phase('write', sheet_name):
+				if sheet_name == 'default':
+					parser._CommitWrites(change)
+					self.defaultInserted.set()
+					for event in self.deleted.values():
+						self._Wait(event)
+					parser._CommitDeletes(change)
+				else:
+					parser._CommitDeletes(change)
+					self.deleted[sheet_name].set()
+					parser._CommitWrites(change, lambda: self._Wait(self.defaultInserted))
+		except:
+			with self.lock:
+				self.isFailed = True
+				self.errors.append(sys.exc_info())
+		finally:
+			# never keep other sheets waiting
+			if sheet_name == 'default':
+				self.defaultInserted.set()
+			else:
+				self.deleted[sheet_name].set()
+
+	#
+	# wait for another sheet; gives up if any sheet has failed, so nothing is
+	# written out of order
+	#
+	def _Wait(self, event):
+		with self.parser.profiler.Phase('wait'):
+			while not event.wait(0.5):
+				pass
+		if self.isFailed:
+			raise UploadAborted()
+
+
+class UploadAborted(Exception):
+	def __str__(self):
+		return 'upload aborted because another sheet failed'
+
+
+#
+# output file written by FeatureExporter. Write() is called once per feature
+# with its document, the dictionary of StoreLicenseInfo.JSONObject().
+#
+# sinks with a fragmentName instead give the text of each feature with
+# Fragment(), which FeatureExporter keeps in the feature under that name
+# (see StoreLicenseInfo.Fragment) and passes to WriteFragment(); features
+# that did not change since the last export are then not formatted again.
+# sinks writing different texts for the same document need different names.
+#
+class FeatureSink:
+	locale = None  # locale of the file, None if it has all locales
+	fragmentName = None
+
+	def Begin(self):
+		pass
+
+	def Write(self, key, document):
+		self.WriteFragment(self.Fragment(key, document))
+
+	def Fragment(self, key, document):
+		raise NotImplementedError
+
+	def WriteFragment(self, text):
+		raise NotImplementedError
+
+	def End(self):
+		pass
+
+	#
+	# keys of document written to the file, or None for all of them. the file
+	# only changes when one of them changes (see ExportManifest).
+	#
+	def Fields(self):
+		return None
+
+	#
+	# title or description of document in given locale, or None
+	#
+	@staticmethod
+	def Text(document, field, locale):
+		return document.get(FeatureSink.TextField(field, locale))
+
+	#
+	# key of title or description of given locale in document
+	#
+	@staticmethod
+	def TextField(field, locale):
+		if locale == StoreLicenseInfo.default_locale:
+			return field
+		return '{0}_{1}'.format(field, locale)
+
+
+#
+# json of all features and locales, as ExportSheet writes it. the output is
+# the same as json.dumps({'features': [...]}, sort_keys=True, indent=4).
+#
+class JSONSink(FeatureSink):
+	fragmentName = 'json'
+
+	def __init__(self, out):
+		self.out = out
+		self.isFirst = True
+
+	def Begin(self):
+		self.out.write('{\n    "features": [')
 
-		#
-		# adding new entries only exist in local data
-		new_item_set = set(self.features.keys()) - set(existing_feature_list)
-		for feature in new_item_set:
+	def Fragment(self, key, document):
+		return self.Format(self.Document(document))
+
+	def WriteFragment(self, text):
+		self.out.write('\n' if self.isFirst else ', \n')
+		self.isFirst = False
+		self.out.write(text)
+
+	def End(self):
+		self.out.write(']\n}\n' if self.isFirst else '\n    ]\n}\n')
+
+	def Document(self, document):
+		return document
+
+	#
+	# document as an element of "features", in the form of
+	# json.dumps(document, sort_keys=True, indent=4) shifted by 8 spaces.
+	# documents only hold strings and lists of strings, so they are formatted
+	# here with the c string encoder; json.dumps uses its much slower python
+	# encoder whenever indent is given.
+	#
+	@staticmethod
+	def Format(document):
+		items = []
+		for key in sorted(document):
+			value = document[key]
 			try:
-				obj = self.features[feature]
-				newData = {}
-				isDirty = False
-				try:
-					newData['title'] 	= obj.title[lang]
-				except KeyError:
-					newData['title']	= ''
+				if isinstance(value, list):
+					text = ('[\n                ' + ', \n                '.join(map(g_encodeJSONString, value)) +
+							'\n            ]') if value else '[]'
+				else:
+					text = g_encodeJSONString(value)
+			except TypeError:
+				# not a string; escaped json strings never contain newlines, so
+				# each line can be shifted to its nesting level as-is
+				text = json.dumps(value, sort_keys=True, indent=4).replace('\n', '\n            ')
+			items.append('            ' + g_encodeJSONString(key) + ': ' + text)
+		if not items:
+			return '        {}'
+		return '        {\n' + ', \n'.join(items) + '\n        }'
+
+
+#
+# json of features in one locale, in the same form as JSONSink with 'title'
+# and 'description' in the locale (in default locale where not translated),
+# and 'ref-title' with the title in default locale to identify the feature.
+#
+class LocaleJSONSink(JSONSink):
+	def __init__(self, out, locale):
+		JSONSink.__init__(self, out)
+		self.locale = locale
+		self.fragmentName = ('locale-json', locale)
+
+	def Document(self, document):
+		title = self.Text(document, 'title', self.locale)
+		description = self.Text(document, 'description', self.locale)
+		return {'ref-title': document['title'], 'title': title or document['title'],
+				'description': description or document['description'], 'category': document['category'],
+				'platform': document['platform'], 'notes': document['notes']}
+
+	def Fields(self):
+		return ['title', 'description', 'category', 'platform', 'notes',
+				self.TextField('title', self.locale), self.TextField('description', self.locale)]
+
+
+#
+# java .properties of features in one locale, keyed by title in default locale:
+#   <title>.title=..., <title>.description=...
+# features without text in the locale are left out.
+#
+class PropertiesSink(FeatureSink):
+	def __init__(self, out, locale):
+		self.out = out
+		self.locale = locale
+		self.fragmentName = ('properties', locale)
+
+	def Fragment(self, key, document):
+		lines = []
+		for field in ('title', 'description'):
+			text = self.Text(document, field, self.locale)
+			if text:
+				lines.append('{0}={1}\n'.format(PropertiesEscape(u'{0}.{1}'.format(key, field), True),
+					PropertiesEscape(text)))
+		return ''.join(lines)
+
+	def WriteFragment(self, text):
+		self.out.write(text)
+
+	def Fields(self):
+		return [self.TextField('title', self.locale), self.TextField('description', self.locale)]
 
-				try:
-					newData['description'] 	= obj.description[lang]
-				except KeyError:
-					newData['description']	= ''
 
-				newData['ref-title'] 	= obj.title[StoreLicenseInfo.default_locale]
+#
+# writes features to many FeatureSink in one pass over them. each feature is
+# converted to its json document once, and the document is given to all sinks.
+# texts of sinks with a fragmentName are kept in the features, and written
+# from there while the features do not change.
+#
+#   FeatureExporter(parser.features, 4).Run([JSONSink(f), PropertiesSink(g, 'ja'), ...])
+#
+# with jobs > 1, sinks are split by locale over jobs writer threads, each fed
+# chunks of documents through a bounded queue, so the files of different
+# locales are formatted and written at the same time while features are
+# still being read.
+#
+class FeatureExporter:
+	chunkSize = 64  # documents put in queue at once
+	queueSize = 8  # chunks waiting for each writer thread
+
+	def __init__(self, features, jobs=1):
+		self.features = features  # key:StoreLicenseInfo
+		self.jobs = max(1, jobs)
+
+	def Run(self, sinks):
+		groups = {}
+		for sink in sinks:
+			groups.setdefault(sink.locale, []).append(sink)
+		writers = [[] for i in range(min(self.jobs, len(groups)))]
+		for i, locale in enumerate(sorted(groups)):
+			writers[i % len(writers)].extend(groups[locale])
+
+		if len(writers) <= 1:
+			self._Write(sinks, self._Chunks())
+			return
+
+		queues = [Queue.Queue(self.queueSize) for sinks in writers]
+		errors = []
+		threads = [threading.Thread(target=self._RunWriter, args=(sinks, queue, errors))
+				   for sinks, queue in zip(writers, queues)]
+		for thread in threads:
+			thread.start()
+		try:
+			for chunk in self._Chunks():
+				for queue in queues:
+					queue.put(chunk)
+		finally:
+			for queue in queues:
+				queue.put(None)
+			for thread in threads:
+				thread.join()
+		if errors:
+			raise errors[0][0], errors[0][1], errors[0][2]
+
+	def _Chunks(self):
+		chunk = []
+		for key in self.features:
+			obj = self.features[key]
+			# made here, so writer threads only read or add fragments
+			chunk.append((key, obj, obj.Document()))
+			if len(chunk) == self.chunkSize:
+				yield chunk
+				chunk = []
+		if chunk:
+			yield chunk
+
+	def _Write(self, sinks, chunks):
+		for sink in sinks:
+			sink.Begin()
+		for chunk in chunks:
+			for key, obj, document in chunk:
+				for sink in sinks:
+					if sink.fragmentName is None:
+						sink.Write(key, document)
+					else:
+						sink.WriteFragment(obj.Fragment((sink.fragmentName, key), sink.Fragment, key, document))
+		for sink in sinks:
+			sink.End()
+
+	def _RunWriter(self, sinks, queue, errors):
+		try:
+			self._Write(sinks, iter(queue.get, None))
+		except Exception:
+			errors.append(sys.exc_info())
+			# keep taking chunks so the exporting thread is not blocked
+			while queue.get() is not None:
+				pass
+
+
+#
+# content hashes of the files written by StoreLicenseParser.ExportFiles,
+# kept in .export-manifest.json of the export directory, so that an
+# incremental export only writes the files whose contents change. hashes
+# are md5: they only tell changes apart, and md5 is several times faster.
+#
+#   { "features" : { key : hash of feature },
+#     "files" : { file name : { "format" : ..., "inputs" : ..., "hash" : ..., "size" : ... } } }
+#
+# "inputs" is the hash of the part of every feature the file holds (see
+# FeatureSink.Fields), so a change in one locale does not touch the files
+# of other locales. "hash" is the hash of the file itself: a file written
+# again with the same contents is not replaced, and does not count as changed.
+#
+class ExportManifest:
+	fileName = '.export-manifest.json'
 
-				entry = self.gd_client.InsertRow(newData, self.doc_key, self.sheets[lang])
-				if not isinstance(entry, gdata.spreadsheet.SpreadsheetsList):
-					print '[Localization({0})]: Error: Failed to add {1}'.format(lang, feature)
+	def __init__(self, directory):
+		self.directory = directory
+		self.path = os.path.join(directory, self.fileName)
+		try:
+			with open(self.path, 'rb') as f:
+				manifest = json.load(f)
+			self.features = manifest['features']
+			self.files = manifest['files']
+		except (IOError, OSError, ValueError, KeyError):
+			self.features = {}
+			self.files = {}
+		self.inputs = {}  # file name:hash of inputs in this export
+		self.changedFeatures = []  # keys of features added, changed or removed since last export
+
+	#
+	# hash inputs of every file for given features. sinks is a list of
+	# (file name, FeatureSink). returns names of the files that must be
+	# written: their inputs changed, or they were changed or removed on disk.
+	#
+	def Compare(self, features, sinks):
+		hashes = [hashlib.md5() for name, sink in sinks]
+		fields = [sink.Fields() for name, sink in sinks]
+		featureHashes = {}
+		for key in features:
+			obj = features[key]
+			# each value is encoded once for all files, and kept in the feature
+			document = obj.Document()
+			encoded = obj.Fragment('fields', self._EncodeFields, document)
+			prefix = g_encodeJSONString(key)
+			text = obj.CompactJSON(document)
+			featureHashes[key] = obj.ContentHash(text)
+			for h, names in zip(hashes, fields):
+				if names is None:
+					h.update(prefix + text)
 				else:
-					print '[Localization({0})]: Adding:{1}'.format(lang, feature)
-			except KeyError:
-				print '[Localization({0})]: FATAL: Object for "{1}" not found.'.format(lang, feature)
-				pass  # don't worry if strTitle is not found
+					h.update('\0'.join([prefix] + [encoded.get(name, 'null') for name in names]))
+		self.changedFeatures = sorted([key for key in set(featureHashes) | set(self.features)
+			if featureHashes.get(key) != self.features.get(key)])
+		self.features = featureHashes
+		self.inputs = dict([(name, h.hexdigest()) for (name, sink), h in zip(sinks, hashes)])
+		return [name for name, sink in sinks if not self._IsCurrent(name)]
+
+	@staticmethod
+	def _EncodeFields(document):
+		return dict([(field, g_encodeJSON(document[field])) for field in document])
+
+	def _IsCurrent(self, name):
+		entry = self.files.get(name)
+		if entry is None or entry.get('inputs') != self.inputs[name]:
+			return False
+		path = os.path.join(self.directory, name)
+		return os.path.isfile(path) and os.path.getsize(path) == entry.get('size')
+
+	#
+	# file written to temp_path replaces the one of given name, unless both
+	# have the same contents. returns True if the file changed.
+	#
+	def Commit(self, name, fileFormat, temp_path, digest):
+		path = os.path.join(self.directory, name)
+		entry = self.files.get(name) or {}
+		isChanged = (entry.get('hash') != digest or not os.path.isfile(path) or
+					 os.path.getsize(path) != entry.get('size'))
+		if isChanged:
+			os.rename(temp_path, path)
+		else:
+			os.remove(temp_path)
+		self.files[name] = {'format': fileFormat, 'inputs': self.inputs.get(name), 'hash': digest,
+			'size': os.path.getsize(path)}
+		return isChanged
+
+	#
+	# remove files of given formats written by an earlier export and not by
+	# this one, i.e. of a locale no longer in the document. returns their names.
+	#
+	def RemoveOthers(self, formats):
+		removed = [name for name in self.files if self.files[name].get('format') in formats and name not in self.inputs]
+		for name in removed:
+			path = os.path.join(self.directory, name)
+			if os.path.isfile(path):
+				os.remove(path)
+			del self.files[name]
+		return sorted(removed)
+
+	def Save(self):
+		temp_path = self.path + '.tmp'
+		with open(temp_path, 'wb') as f:
+			json.dump({'features': self.features, 'files': self.files}, f, sort_keys=True)
+		os.rename(temp_path, self.path)
+
+
+#
+# file object computing md5 of everything written to it
+#
+class HashingWriter:
+	def __init__(self, out):
+		self.out = out
+		self.md5 = hashlib.md5()
+		self.name = out.name
+
+	def write(self, data):
+		self.md5.update(data)
+		self.out.write(data)
+
+	def close(self):
+		self.out.close()
+
+	def hexdigest(self):
+		return self.md5.hexdigest()
+
+
+#
+# features in an sqlite database, for other tools to query without reading
+# and scanning the exported json:
+#   features (title, hash, category, document, one 0/1 column per knownPlatforms)
+#   locales (locale, title) : locales whose title and description are not empty
+# category, every platform column and locale are indexed. Update only writes
+# features whose ContentHash changed since the last update, and removes the
+# ones no longer there, in one transaction.
+#
+#   catalog = FeatureCatalog('store.db')
+#   catalog.Update(parser.features)
+#   catalog.Titles(category='graphics', platforms=['iospro'], missingLocale='ja')
+#
+class FeatureCatalog:
+	def __init__(self, file_path):
+		import sqlite3
+		self.file_path = file_path
+		self.db = sqlite3.connect(file_path)
+		self._CreateTables()
+
+	def _CreateTables(self):
+		platforms = ','.join(StoreLicenseInfo.knownPlatforms)
+		with self.db:
+			self.db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+			row = self.db.execute("SELECT value FROM meta WHERE key = 'platforms'").fetchone()
+			if row is not None and row[0] != platforms:
+				# made with other knownPlatforms; build again from scratch
+				self.db.execute('DROP TABLE IF EXISTS features')
+				self.db.execute('DROP TABLE IF EXISTS locales')
+			self.db.execute("INSERT OR REPLACE INTO meta VALUES ('platforms', ?)", (platforms,))
+			self.db.execute('CREATE TABLE IF NOT EXISTS features (title TEXT PRIMARY KEY, hash TEXT, category TEXT, '
+				'document TEXT, {0})'.format(', '.join(['{0} INTEGER'.format(key) for key in StoreLicenseInfo.knownPlatforms])))
+			self.db.execute('CREATE TABLE IF NOT EXISTS locales (locale TEXT, title TEXT, PRIMARY KEY (locale, title))')
+			self.db.execute('CREATE INDEX IF NOT EXISTS locales_title ON locales (title)')
+			self.db.execute('CREATE INDEX IF NOT EXISTS features_category ON features (category)')
+			for key in StoreLicenseInfo.knownPlatforms:
+				self.db.execute('CREATE INDEX IF NOT EXISTS features_{0} ON features ({0})'.format(key))
+
+	#
+	# make catalog hold given features { title : StoreLicenseInfo }.
+	# returns (number of features written, number removed).
+	#
+	def Update(self, features):
+		stored = dict(self.db.execute('SELECT title, hash FROM features'))
+		changed = []
+		for title, obj in features.iteritems():
+			digest = obj.ContentHash()
+			if stored.pop(title, None) != digest:
+				changed.append((title, digest, obj))
+		removed = [(title,) for title in stored]
+
+		featureRows = []
+		localeRows = []
+		for title, digest, obj in changed:
+			document = obj.Document()
+			featureRows.append([title, digest, document['category'], g_encodeJSON(document)] +
+				[int(obj.platform[key]) for key in StoreLicenseInfo.knownPlatforms])
+			localeRows += [(locale, title) for locale in obj.title if obj.title[locale] and obj.description.get(locale)]
+		with self.db:
+			self.db.executemany('DELETE FROM features WHERE title = ?', removed)
+			self.db.executemany('DELETE FROM locales WHERE title = ?', removed + [(row[0],) for row in featureRows])
+			self.db.executemany('INSERT OR REPLACE INTO features VALUES ({0})'.format(
+				', '.join(['?'] * (4 + len(StoreLicenseInfo.knownPlatforms)))), featureRows)
+			self.db.executemany('INSERT INTO locales VALUES (?, ?)', localeRows)
+		return len(changed), len(removed)
+
+	#
+	# sorted titles of features matching all given conditions:
+	#   category: in this category
+	#   platforms: checked for every platform in list
+	#   locale: with title and description in this locale
+	#   missingLocale: without title or description in this locale
+	#
+	def Titles(self, category=None, platforms=None, locale=None, missingLocale=None):
+		conditions = []
+		values = []
+		if category is not None:
+			conditions.append('category = ?')
+			values.append(category)
+		for key in platforms or []:
+			if key not in StoreLicenseInfo.platformIndex:
+				raise ValueError('unknown platform: {0}'.format(key))
+			conditions.append('{0} = 1'.format(key))
+		if locale is not None:
+			conditions.append('title IN (SELECT title FROM locales WHERE locale = ?)')
+			values.append(locale)
+		if missingLocale is not None:
+			conditions.append('title NOT IN (SELECT title FROM locales WHERE locale = ?)')
+			values.append(missingLocale)
+		query = 'SELECT title FROM features'
+		if conditions:
+			query += ' WHERE ' + ' AND '.join(conditions)
+		return [row[0] for row in self.db.execute(query + ' ORDER BY title', values)]
+
+	#
+	# json documents of given titles (see StoreLicenseInfo.JSONObject), in the same order
+	#
+	def Documents(self, titles):
+		documents = []
+		for title in titles:
+			row = self.db.execute('SELECT document FROM features WHERE title = ?', (title,)).fetchone()
+			if row is None:
+				raise KeyError(title)
+			documents.append(json.loads(row[0]))
+		return documents
+
+	#
+	# { category : number of features }
+	#
+	def Categories(self):
+		return dict(self.db.execute('SELECT category, COUNT(*) FROM features GROUP BY category'))
+
+	#
+	# { locale : number of features with title and description in it }
+	#
+	def Coverage(self):
+		return dict(self.db.execute('SELECT locale, COUNT(*) FROM locales GROUP BY locale'))
+
+	def Close(self):
+		self.db.close()
+
+
+#
+# exports / uploads many documents of one account listed in a manifest,
+# logging in once and sharing connections, cache and request scheduler.
+# documents are processed by a pool of workers threads.
+# manifest is a json file:
+#
+#   { "documents" : [
+#       { "key" : "0AqJa9l8Ism8...", "output" : "store-jp.json" },
+#       { "key" : "0AqJa9l8Ism9...", "upload" : "store-us.json", "fullsync" : true }
+#   ] }
+#
+#   $> ./storelicense.py --user [your@google.acount] --password [your.password] --manifest ./stores.json
+#
+# upload files are checked with ValidateUploads before logging in, and
+# locales without a worksheet before the first write to each document.
+#
+class DocumentBatch:
+	def __init__(self, backend, documents, workers=4, jobs=1, batch=False, isPlan=False, validators=None):
+		self.backend = backend  # logged in GDataBackend, used for all documents
+		self.documents = documents
+		self.workers = max(1, workers)
+		self.jobs = jobs
+		self.batch = batch
+		self.isPlan = isPlan
+		self.validators = validators or {}  # upload file:FeatureValidator, from ValidateUploads
+
+	@staticmethod
+	def ReadManifest(file_path):
+		with open(file_path, 'rb') as f:
+			documents = json.load(f)['documents']
+		for document in documents:
+			if 'key' not in document or ('output' in document) == ('upload' in document):
+				raise ValueError('{0}: each document needs "key" and either "output" or "upload": {1}'.format(
+					file_path, json.dumps(document)))
+		return documents
+
+	#
+	# { upload file : FeatureValidator } of the upload files of documents.
+	# problems of all files are printed together; returns None if there are
+	# any.
+	#
+	@staticmethod
+	def ValidateUploads(documents):
+		validators = {}
+		isValid = True
+		for document in documents:
+			file_path = document.get('upload')
+			if file_path is None or file_path in validators:
+				continue
+			try:
+				validators[file_path] = ValidateJSONFile(file_path)
+			except jsonFileErrors, e:
+				print >> sys.stderr, '{0}: invalid: {1!r}'.format(file_path, e)
+				validators[file_path] = None
+				isValid = False
+				continue
+			if validators[file_path].problems:
+				PrintProblems(file_path, validators[file_path].problems)
+				isValid = False
+		return validators if isValid else None
+
+	#
+	# process all documents and return list of summaries, in manifest order:
+	#   { 'key', 'action' : 'export' / 'upload', 'seconds', 'features',
+	#     'added', 'updated', 'removed', 'error' : message or None }
+	#
+	def Run(self):
+		pool = ThreadPool(min(self.workers, max(1, len(self.documents))))
+		try:
+			return pool.map(self._Process, self.documents)
+		finally:
+			pool.close()
+			pool.join()
+
+	def _Process(self, document):
+		key = document['key']
+		summary = {'key': key, 'action': 'upload' if 'upload' in document else 'export',
+				   'seconds': 0.0, 'features': 0, 'added': 0, 'updated': 0, 'removed': 0, 'error': None}
+		start = time.time()
+		try:
+			parser = StoreLicenseParser(None, None, key, self.jobs, self.batch, None,
+				self.backend.ForDocument(key), self.backend.profiler)
+			parser.logPrefix = '[{0}]'.format(key)
+			if 'upload' in document:
+				validator = self.validators.get(document['upload'])
+				if validator is not None:
+					problems = validator.WorksheetProblems(parser.sheets)
+					if problems:
+						PrintProblems(document['upload'], problems)
+						raise ValueError('{0}: {1} problems'.format(document['upload'], len(problems)))
+				parser.LoadDocumentFromJSONFile(document['upload'])
+				isFullSync = bool(document.get('fullsync'))
+				if self.isPlan:
+					changes = parser.ComputeChangeSet(isFullSync)
+					parser.PrintChangeSet(changes)
+				else:
+					changes = parser.UploadSheet(isFullSync)
+				for change in changes:
+					summary['added'] += len(change.inserts)
+					summary['updated'] += len(change.updates)
+					summary['removed'] += len(change.deletes)
+			else:
+				parser.LoadDocumentFromGoogleDocs()
+				with open(document['output'], 'wb') as f:
+					parser.ExportSheet(f)
+			summary['features'] = len(parser.features)
+		except Exception, e:
+			summary['error'] = '{0}: {1}'.format(e.__class__.__name__, e)
+		summary['seconds'] = time.time() - start
+		return summary
+
+	@staticmethod
+	def PrintSummary(summaries):
+		print '{0:<46} {1:<7} {2:>8} {3:>8} {4:>6} {5:>8} {6:>8}  {7}'.format(
+			'key', 'action', 'time(s)', 'features', 'added', 'updated', 'removed', 'status')
+		for s in summaries:
+			print '{0:<46} {1:<7} {2:>8.2f} {3:>8} {4:>6} {5:>8} {6:>8}  {7}'.format(
+				s['key'], s['action'], s['seconds'], s['features'], s['added'], s['updated'], s['removed'],
+				s['error'] or 'ok')
+
+
+#
+# exports the document again whenever it changes, for --watch.
+# every interval seconds only the worksheets feed is read, and only sheets
+# whose 'updated' timestamp moved are downloaded again; rows of the other sheets
+# are kept from the previous round. the backend stays logged in with its
+# connections open for the whole run. with parser.keepFragments, features
+# that did not change keep the texts made by the previous export (see
+# StoreLicenseInfo.Fragment), so only the changed ones are formatted again.
+#   export: called without arguments after the document is loaded again,
+#           returns list of paths written
+#   catalog: FeatureCatalog to update after each export, or None
+# after every round, status is written to status_path as json:
+#   { "state" : "ok" / "error" / "stopped", "pid", "started", "last_poll",
+#     "last_sync", "last_error" : <unix time> or null, "error" : message,
+#     "polls", "syncs", "errors", "consecutive_errors", "sheets_fetched",
+#     "files_written", "features", "sync_seconds" }
+#
+#   parser.keepFragments = True
+#   ExportWatcher(parser, lambda: parser.ExportFiles(...), 60, 'status.json').Run()
+#
+class ExportWatcher:
+	def __init__(self, parser, export, interval=60, status_path='', catalog=None):
+		self.parser = parser
+		self.export = export
+		self.catalog = catalog  # FeatureCatalog updated after each export, if any
+		self.interval = interval
+		self.status_path = status_path
+		self.rows = {}  # sheet name:list of SheetRow of last download
+		self.updated = {}  # sheet name:'updated' timestamp of rows in self.rows
+		self.isExported = False  # self.rows are exported
+		self.status = {'state': 'starting', 'pid': os.getpid(), 'started': time.time(), 'last_poll': None,
+					   'last_sync': None, 'last_error': None, 'error': None, 'polls': 0, 'syncs': 0, 'errors': 0,
+					   'consecutive_errors': 0, 'sheets_fetched': 0, 'files_written': 0, 'features': 0,
+					   'sync_seconds': None}
+
+	#
+	# poll until interrupted
+	#
+	def Run(self):
+		try:
+			while True:
+				start = time.time()
+				self.Poll()
+				time.sleep(max(0, self.interval - (time.time() - start)))
+		except KeyboardInterrupt:
+			self.status['state'] = 'stopped'
+			self._WriteStatus()
+
+	#
+	# one round: check for changes and export them. errors are reported and
+	# the next round tries again. returns list of paths written.
+	#
+	def Poll(self):
+		written = []
+		try:
+			written = self._Sync()
+		except Exception, e:
+			self.status['state'] = 'error'
+			self.status['error'] = '{0}: {1}'.format(e.__class__.__name__, e)
+			self.status['last_error'] = time.time()
+			self.status['errors'] += 1
+			self.status['consecutive_errors'] += 1
+			print >> sys.stderr, 'watch: {0}'.format(self.status['error'])
+		else:
+			self.status['state'] = 'ok'
+			self.status['consecutive_errors'] = 0
+			for path in written:
+				print path
+			sys.stdout.flush()
+		self.status['polls'] += 1
+		self.status['last_poll'] = time.time()
+		self._WriteStatus()
+		return written
+
+	def _Sync(self):
+		parser = self.parser
+		parser._GetAllWorksheetsIds()
+		sheetNames = parser._DocumentSheets()
+		# sheets without timestamp can not be compared and are always downloaded
+		stale = [name for name in sheetNames if name not in self.rows or parser.sheetUpdated.get(name) is None
+				 or parser.sheetUpdated[name] != self.updated[name]]
+		removed = [name for name in self.rows if name not in sheetNames]
+		if not stale and not removed and self.isExported:
+			return []
+
+		start = time.time()
+		for name in removed:
+			del self.rows[name]
+			del self.updated[name]
+		if parser.jobs > 1 and len(stale) > 1:
+			rows = parser._FetchRows(stale, True)
+		else:
+			rows = dict([(name, parser._GetRows(name, True)) for name in stale])
+		for name in stale:
+			# timestamp read before the download; a change made meanwhile is
+			# downloaded again on the next round
+			self.rows[name] = rows[name]
+			self.updated[name] = parser.sheetUpdated.get(name)
+
+		self.isExported = False
+		parser.LoadDocumentFromGoogleDocs(self.rows)
+		written = self.export()
+		if self.catalog is not None:
+			self.catalog.Update(parser.features)
+		self.isExported = True
+
+		self.status['syncs'] += 1
+		self.status['last_sync'] = time.time()
+		self.status['sync_seconds'] = self.status['last_sync'] - start
+		self.status['sheets_fetched'] += len(stale)
+		self.status['files_written'] += len(written)
+		self.status['features'] = len(parser.features)
+		return written
+
+	def _WriteStatus(self):
+		if self.status_path is '':
+			return
+		with open(self.status_path + '.tmp', 'wb') as f:
+			json.dump(self.status, f, indent=4, sort_keys=True)
+		os.rename(self.status_path + '.tmp', self.status_path)
+
+
+g_propertiesSpecial = re.compile(u'[\\\\\n\r\t]|[^ -~]')
+g_propertiesEscapes = {'\\': '\\\\', '\n': '\\n', '\r': '\\r', '\t': '\\t'}
+
+
+#
+# text escaped for java .properties: backslash escapes for special characters
+# and \uXXXX for anything outside printable ascii, so the file is plain ascii.
+# in keys, spaces, ':', '=' and a leading '#' / '!' are also escaped.
+#
+def PropertiesEscape(text, isKey=False):
+	text = g_propertiesSpecial.sub(_PropertiesEscapeChar, text)
+	if isKey:
+		text = text.replace(' ', '\\ ').replace(':', '\\:').replace('=', '\\=')
+		if text.startswith('#') or text.startswith('!'):
+			text = '\\' + text
+	elif text.startswith(' '):
+		text = '\\' + text
+	return text
+
+
+def _PropertiesEscapeChar(match):
+	c = match.group(0)
+	if c in g_propertiesEscapes:
+		return g_propertiesEscapes[c]
+	code = ord(c)
+	if code > 0xffff:
+		# outside basic multilingual plane, as utf-16 surrogate pair
+		code -= 0x10000
+		return '\\u{0:04x}\\u{1:04x}'.format(0xd800 + (code >> 10), 0xdc00 + (code & 0x3ff))
+	return '\\u{0:04x}'.format(code)
+
+
+#
+# StoreLicenseParser with features of given json file, without connecting to
+# Google Docs
+#
+def LoadJSONFile(file_path, jobs=1):
+	parser = StoreLicenseParser(None, None, None, jobs, backend=OfflineBackend())
+	parser.LoadDocumentFromJSONFile(file_path)
+	return parser
+
+
+#
+# FeatureValidator of all features of json file to upload (--upload), or of
+# the added and modified features of a changeset file (--apply-changeset)
+#
+def ValidateJSONFile(file_path, isChangeSet=False):
+	validator = FeatureValidator()
+	if not isChangeSet:
+		for feature in JSONFeatureReader(file_path):
+			validator.Check(feature)
+		return validator
+	changes = DocumentChangeSet.Read(file_path)
+	for feature in changes.added:
+		validator.Check(feature)
+	for entry in changes.modified:
+		feature = dict(entry['fields'])
+		feature['title'] = entry['title']
+		validator.Check(feature, True)
+	return validator
+
+
+def PrintProblems(file_path, problems):
+	for problem in problems:
+		print >> sys.stderr, u'{0}: {1}'.format(file_path, problem).encode(g_charcode)
+	print >> sys.stderr, '{0}: {1} problems'.format(file_path, len(problems))
+
+
+# errors of a malformed json file, reported by offline commands
+jsonFileErrors = (IOError, ValueError, KeyError, IndexError, TypeError, AttributeError)
+
+
+#
+# offline commands, given as first argument:
+#   $> ./storelicense.py validate ./myfile.json
+#   $> ./storelicense.py diff ./old.json ./new.json
+#   $> ./storelicense.py convert ./myfile.json --to properties --output ./locales
+#
+def ValidateCommand(argv):
+	parser = argparse.ArgumentParser(prog='storelicense.py validate', description='check json file for problems that would stop or spoil an upload (see FeatureValidator), and print all of them.')
+	parser.add_argument('file', help='json file to check.')
+	parser.add_argument('--changeset', action='store_true', help='file is a changeset written by diff --changeset.')
+	parser.add_argument('--worksheets', nargs='+', default=None, help='names of the worksheets of the document, to also check that every locale has one.')
+	args = parser.parse_args(argv)
+
+	try:
+		validator = ValidateJSONFile(args.file, args.changeset)
+	except jsonFileErrors, e:
+		print >> sys.stderr, '{0}: invalid: {1!r}'.format(args.file, e)
+		return 1
+	if args.worksheets is not None:
+		validator.CheckWorksheets(args.worksheets)
+	if validator.problems:
+		PrintProblems(args.file, validator.problems)
+		return 1
+	print '{0}: {1} features, locales: {2}'.format(args.file, validator.count, ' '.join(sorted(validator.locales)))
+	return 0
+
+
+#
+# prints features added (+), removed (-) and changed (~, with changed keys)
+# from the first file to the second, and writes them as DocumentChangeSet
+# with --changeset. returns 1 if they differ, like diff(1).
+#
+def DiffCommand(argv):
+	parser = argparse.ArgumentParser(prog='storelicense.py diff', description='compare features of two json files by title.')
+	parser.add_argument('old', help='json file before changes.')
+	parser.add_argument('new', help='json file after changes.')
+	parser.add_argument('--changeset', default='', help='also write changes to given file, to upload with --apply-changeset.')
+	args = parser.parse_args(argv)
+
+	try:
+		old = LoadJSONFile(args.old).features
+		new = LoadJSONFile(args.new).features
+	except jsonFileErrors, e:
+		print >> sys.stderr, 'invalid json file: {0!r}'.format(e)
+		return 2
+
+	changes = DocumentChangeSet.Compute(old, new)
+	if args.changeset is not '':
+		with open(args.changeset, 'wb') as f:
+			changes.Write(f)
+
+	lines = [(obj['title'], u'+ {0}'.format(obj['title'])) for obj in changes.added]
+	lines += [(key, u'- {0}'.format(key)) for key in changes.removed]
+	lines += [(change['title'], u'~ {0}: {1}'.format(change['title'], ', '.join(sorted(change['fields']))))
+			  for change in changes.modified]
+	for key, line in sorted(lines):
+		print line.encode(g_charcode)
+	return 0 if changes.IsEmpty() else 1
+
+
+def ConvertCommand(argv):
+	parser = argparse.ArgumentParser(prog='storelicense.py convert', description='convert json file to other formats.')
+	parser.add_argument('file', help='json file to convert.')
+	parser.add_argument('--to', nargs='+', choices=StoreLicenseParser.exportFormats, required=True, help='"json": same format as export (store.json when written with other formats). "locale-json": <locale>.json with the texts of one locale. "properties": <locale>.properties.')
+	parser.add_argument('--output', default='', help='directory to write files in (default: current directory), or file to write json to when it is the only format (default: standard output).')
+	parser.add_argument('--jobs', type=int, default=1, help='number of files written concurrently.')
+	parser.add_argument('--incremental', action='store_true', help='only write files whose contents changed since the last convert to the same directory, and print their paths.')
+	args = parser.parse_args(argv)
+
+	try:
+		document = LoadJSONFile(args.file, args.jobs)
+	except jsonFileErrors, e:
+		print >> sys.stderr, '{0}: invalid: {1!r}'.format(args.file, e)
+		return 1
+
+	if args.to == ['json'] and not args.incremental:
+		if args.output is not '':
+			with open(args.output, 'wb') as f:
+				document.ExportSheet(f)
+		else:
+			document.ExportSheet()
+		return 0
+
+	changed = document.ExportFiles(args.output or '.', args.to, args.incremental)
+	if args.incremental:
+		for path in changed:
+			print path
+	return 0
+
+
+#
+# builds or updates catalog database (see FeatureCatalog) from json file
+#
+def CatalogCommand(argv):
+	parser = argparse.ArgumentParser(prog='storelicense.py catalog', description='build or update sqlite catalog of features for "query", writing only features changed since the last update.')
+	parser.add_argument('file', help='json file of features.')
+	parser.add_argument('database', help='sqlite database to build or update.')
+	args = parser.parse_args(argv)
+
+	try:
+		document = LoadJSONFile(args.file)
+	except jsonFileErrors, e:
+		print >> sys.stderr, '{0}: invalid: {1!r}'.format(args.file, e)
+		return 1
+	catalog = FeatureCatalog(args.database)
+	written, removed = catalog.Update(document.features)
+	catalog.Close()
+	print '{0}: {1} features, {2} written, {3} removed'.format(args.database, len(document.features), written, removed)
+	return 0
+
+
+#
+# prints titles (or json documents) of features in catalog database matching
+# all given conditions, or counts of categories and locales with --summary
+#
+def QueryCommand(argv):
+	parser = argparse.ArgumentParser(prog='storelicense.py query', description='find features in sqlite catalog made by "catalog" or --catalog.')
+	parser.add_argument('database', help='sqlite database to query.')
+	parser.add_argument('--category', help='features in this category.')
+	parser.add_argument('--platform', nargs='+', default=[], choices=StoreLicenseInfo.knownPlatforms, help='features checked for all these platforms.')
+	parser.add_argument('--locale', help='features with title and description in this locale.')
+	parser.add_argument('--missing-locale', help='features without title or description in this locale.')
+	parser.add_argument('--json', action='store_true', help='print features as json, in the format of export, instead of titles.')
+	parser.add_argument('--summary', action='store_true', help='print number of features of each category and locale instead.')
+	args = parser.parse_args(argv)
+
+	if not os.path.exists(args.database):
+		print >> sys.stderr, '{0}: not found'.format(args.database)
+		return 1
+	catalog = FeatureCatalog(args.database)
+	if args.summary:
+		for category, count in sorted(catalog.Categories().items()):
+			print u'category {0}: {1}'.format(category, count).encode(g_charcode)
+		for locale, count in sorted(catalog.Coverage().items()):
+			print u'locale {0}: {1}'.format(locale, count).encode(g_charcode)
+		return 0
+
+	titles = catalog.Titles(args.category, args.platform, args.locale, args.missing_locale)
+	if args.json:
+		json.dump({'features': catalog.Documents(titles)}, sys.stdout, sort_keys=True, indent=4)
+		print
+	else:
+		for title in titles:
+			print title.encode(g_charcode)
+	return 0
+
+
+offlineCommands = {'validate': ValidateCommand, 'diff': DiffCommand, 'convert': ConvertCommand,
+				   'catalog': CatalogCommand, 'query': QueryCommand}
 
 
 def main():
+	if len(sys.argv) > 1 and sys.argv[1] in offlineCommands:
+		sys.exit(offlineCommands[sys.argv[1]](sys.argv[2:]))
 
-	parser = argparse.ArgumentParser(description='download and format Google spereadsheet to json/properties.')
-	parser.add_argument('--user', required=True, help='Google apps user id')
+	parser = argparse.ArgumentParser(description='download and format Google spereadsheet to json/properties.',
+		epilog='offline commands, without connecting to Google Docs: "validate FILE", "diff OLD NEW", "convert FILE --to properties|json", "catalog FILE DATABASE", "query DATABASE". see %(prog)s COMMAND --help.')
+	parser.add_argument('--user', help='Google apps user id')
 	parser.add_argument(
-		'--password', required=True, help='Google apps user password')
-	parser.add_argument('--key', required=True, help='key ID of spereadsheet. you can retrieve this from Google Spreadsheet\'s URL.')
+		'--password', help='Google apps user password')
+	parser.add_argument('--key', help='key ID of spereadsheet. you can retrieve this from Google Spreadsheet\'s URL.')
+	parser.add_argument('--backend', default='gdata', help='where worksheets are stored: "gdata" (Google Docs, default) or "local:PATH" (directory of csv files, one per worksheet).')
 	parser.add_argument('--upload', help='instead of downloading from google docs, parse json file and reflect it to google docs.', default='')
 	parser.add_argument('--fullsync', action='store_true', help='paired with --upload. --fullsync will remove entries in Spreadsheet that are not in given json.')
+	parser.add_argument('--output', help='write exported json to given file instead of standard output.', default='')
+	parser.add_argument('--export-dir', default='', help='write exported files to given directory instead, in formats of --formats.')
+	parser.add_argument('--incremental', action='store_true', help='paired with --export-dir. only write files whose contents changed since the last export, keeping hashes in .export-manifest.json of the directory, and print paths of changed files.')
+	parser.add_argument('--formats', nargs='+', choices=StoreLicenseParser.exportFormats, default=StoreLicenseParser.exportFormats, help='paired with --export-dir. "json": store.json, same as --output. "locale-json": <locale>.json with the texts of one locale. "properties": <locale>.properties. all of them by default.')
+	parser.add_argument('--page-size', type=int, default=0, help='read worksheets this many rows per request, requesting the next rows while the current ones are used, so memory use does not grow with the size of worksheets (0: whole worksheet in one request).')
+	parser.add_argument('--jobs', type=int, default=1, help='number of requests to make concurrently. with --upload, all worksheets are fetched, compared and written at the same time. with --export-dir, also the number of files written at the same time.')
+	parser.add_argument('--batch', action='store_true', help='paired with --upload. write changes of each sheet with cells batch requests instead of one request per row.')
+	parser.add_argument('--chunk-size', type=int, default=0, help='paired with --upload. read and upload json file this many features at a time, so the file is never loaded in memory at once. rows of all worksheets are still read and kept for the whole upload.')
+	parser.add_argument('--apply-changeset', default='', help='upload changes in given file written by "diff OLD NEW --changeset FILE", reading and writing only the rows of changed features.')
+	parser.add_argument('--skip-validation', action='store_true', help='paired with --upload, --apply-changeset or --manifest. upload without first checking the file for problems (see "validate" command), and without checking that every locale has a worksheet.')
+	parser.add_argument('--plan', action='store_true', help='paired with --upload or --apply-changeset. print changes that would be made to Spreadsheet without writing anything.')
+	parser.add_argument('--journal', default='', help='paired with --upload or --apply-changeset. record all writes in given file before making them, and each write once done, so an interrupted upload can be finished with --resume. the file is removed when the upload finishes.')
+	parser.add_argument('--resume', action='store_true', help='finish the upload recorded in --journal, reading and writing only the rows it had not written yet. with --plan, print those writes instead.')
+	parser.add_argument('--cache-dir', default=os.path.join(os.path.expanduser('~'), '.storelicense', 'cache'), help='directory to cache downloaded worksheets.')
+	parser.add_argument('--cache-size', type=int, default=64, help='maximum size of worksheet cache in megabytes.')
+	parser.add_argument('--no-cache', action='store_true', help='always download all worksheets, bypassing the cache.')
+	parser.add_argument('--clear-cache', action='store_true', help='remove all cached worksheets before running.')
+	parser.add_argument('--token-cache', default=os.path.join(os.path.expanduser('~'), '.storelicense', 'tokens.json'), help='file to keep auth token in between runs, readable only by the user.')
+	parser.add_argument('--no-token-cache', action='store_true', help='log in on every run, without reading or saving auth token.')
+	parser.add_argument('--rate', type=float, default=0, help='send at most this many requests per second to Google Docs (0: no limit). lowered automatically while the service is throttling.')
+	parser.add_argument('--retries', type=int, default=5, help='times to retry a request rejected with 429 or 5xx, with exponential backoff.')
+	parser.add_argument('--manifest', default='', help='export / upload every document listed in given json file, logging in only once. see DocumentBatch for the format.')
+	parser.add_argument('--workers', type=int, default=4, help='paired with --manifest. number of documents processed at the same time.')
+	parser.add_argument('--catalog', default='', help='after exporting, also update given sqlite catalog of features (see "query" command), writing only features that changed.')
+	parser.add_argument('--watch', type=float, default=0, metavar='SECONDS', help='keep running and export again to --output or --export-dir whenever the document changes, checking every SECONDS seconds. only worksheets changed since the last check are downloaded. paths of written files are printed.')
+	parser.add_argument('--status-file', default='', help='paired with --watch. after every check, write state, time of last check, export and error, and counters to given json file.')
+	parser.add_argument('--profile', default='', help='write call counts, latencies, bytes and rows of every request per worksheet, and time of each phase, to given json file.')
 
 	args = parser.parse_args()
 
-	parser = StoreLicenseParser(args.user, args.password, args.key)
+	backend = None
+	if args.backend.startswith('local:'):
+		backend = LocalBackend(args.backend[len('local:'):])
+	elif args.backend != 'gdata':
+		parser.error('unknown backend: {0}'.format(args.backend))
+	elif args.manifest is not '':
+		if not (args.user and args.password):
+			parser.error('--user and --password are required with --manifest')
+	elif not (args.user and args.password and args.key):
+		parser.error('--user, --password and --key are required with gdata backend')
+	if args.manifest is not '' and backend is not None:
+		parser.error('--manifest only works with gdata backend')
+	if args.resume and args.journal is '':
+		parser.error('--resume needs --journal')
+	if args.journal is not '':
+		if args.manifest is not '' or args.chunk_size > 0 or args.watch > 0:
+			parser.error('--journal does not work with --manifest, --chunk-size or --watch')
+		if args.resume and (args.upload is not '' or args.apply_changeset is not ''):
+			parser.error('--resume takes the writes to make from --journal, not from --upload or --apply-changeset')
+	if args.watch > 0:
+		if backend is not None:
+			parser.error('--watch only works with gdata backend')
+		if args.manifest is not '' or args.upload is not '' or args.apply_changeset is not '':
+			parser.error('--watch only works with export')
+		if args.output is '' and args.export_dir is '':
+			parser.error('--watch needs --output or --export-dir')
 
-	if args.upload is not '':
-		parser.LoadDocumentFromJSONFile(args.upload)
-		parser.UploadSheet(args.fullsync)
-	else:
-		parser.LoadDocumentFromGoogleDocs()
-		parser.ExportSheet()
+	# problems of the file are reported before logging in, all at once
+	validator = None
+	if (args.upload is not '' or args.apply_changeset is not '') and not args.skip_validation:
+		file_path = args.upload or args.apply_changeset
+		try:
+			validator = ValidateJSONFile(file_path, args.apply_changeset is not '')
+		except jsonFileErrors, e:
+			print >> sys.stderr, '{0}: invalid: {1!r}'.format(file_path, e)
+			sys.exit(1)
+		if validator.problems:
+			PrintProblems(file_path, validator.problems)
+			sys.exit(1)
+
+	cache = None
+	if backend is None:
+		cache = FeedCache(args.cache_dir, args.cache_size * 1024 * 1024)
+		if args.clear_cache:
+			cache.Clear()
+		if args.no_cache:
+			cache = None
+
+	profiler = Profiler()
+	try:
+		documents = []
+		validators = None
+		if args.manifest is not '':
+			documents = DocumentBatch.ReadManifest(args.manifest)
+			if not documents:
+				return
+			if not args.skip_validation:
+				validators = DocumentBatch.ValidateUploads(documents)
+				if validators is None:
+					sys.exit(1)
+		if backend is None:
+			scheduler = RequestScheduler(args.rate, maxRetries=args.retries)
+			tokens = TokenCache(args.token_cache) if not args.no_token_cache else None
+			with profiler.Phase('login'):
+				backend = GDataBackend(args.user, args.password, documents[0]['key'] if documents else args.key, cache,
+					None, profiler, scheduler, tokens)
+			backend.pageSize = args.page_size
+
+		if documents:
+			summaries = DocumentBatch(backend, documents, args.workers, args.jobs, args.batch, args.plan,
+				validators).Run()
+			DocumentBatch.PrintSummary(summaries)
+			if [summary for summary in summaries if summary['error']]:
+				sys.exit(1)
+			return
+
+		parser = StoreLicenseParser(args.user, args.password, args.key, args.jobs, args.batch, cache, backend, profiler)
+		if args.journal is not '':
+			parser.journal = UploadJournal(args.journal)
+		if validator is not None:
+			validator.CheckWorksheets(parser.sheets)
+			if validator.problems:
+				PrintProblems(args.upload or args.apply_changeset, validator.problems)
+				sys.exit(1)
+
+		if args.resume:
+			if parser.ResumeUpload(args.plan) is None:
+				print 'nothing to resume: {0} not found'.format(args.journal)
+		elif args.apply_changeset is not '':
+			parser.UploadChangeSet(DocumentChangeSet.Read(args.apply_changeset), args.plan)
+		elif args.upload is not '' and args.chunk_size > 0:
+			parser.UploadJSONFileInChunks(args.upload, args.fullsync, args.chunk_size, args.plan)
+		elif args.upload is not '':
+			parser.LoadDocumentFromJSONFile(args.upload)
+			if args.plan:
+				parser.PrintChangeSet(parser.ComputeChangeSet(args.fullsync))
+			else:
+				parser.UploadSheet(args.fullsync)
+		elif args.watch > 0:
+			if args.export_dir is not '':
+				export = lambda: parser.ExportFiles(args.export_dir, args.formats, args.incremental)
+			else:
+				export = lambda: parser.ExportSheetToFile(args.output)
+			catalog = FeatureCatalog(args.catalog) if args.catalog is not '' else None
+			parser.keepFragments = True
+			ExportWatcher(parser, export, args.watch, args.status_file, catalog).Run()
+		else:
+			parser.LoadDocumentFromGoogleDocs()
+			if args.export_dir is not '':
+				changed = parser.ExportFiles(args.export_dir, args.formats, args.incremental)
+				if args.incremental:
+					for path in changed:
+						print path
+			elif args.output is not '':
+				with open(args.output, 'wb') as f:
+					parser.ExportSheet(f)
+			else:
+				parser.ExportSheet()
+			if args.catalog is not '':
+				FeatureCatalog(args.catalog).Update(parser.features)
+	finally:
+		# written also for failed runs, to see where they stopped
+		if args.profile is not '':
+			profiler.Write(args.profile)
 
 if __name__ == '__main__':
 	main()
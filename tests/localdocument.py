@@ -0,0 +1,83 @@
+#!/usr/bin/python
+#
+# Copyright (C) 2012 Unity Technologies Japan, G.K.
+#
+# small documents for tests, as LocalBackend directories, and features in
+# the format of export.
+#
+
+import os
+import sys
+import csv
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from storelicense import StoreLicenseInfo, StoreLicenseParser, LocalBackend
+
+
+#
+# feature as in exported json, with title and description in given locales
+#
+def MakeFeature(title, locales=(), category='general', platform=None, notes=None):
+	count = len(StoreLicenseInfo.knownPlatforms)
+	feature = {'title': title, 'description': u'{0} description'.format(title), 'category': category,
+			   'platform': platform if platform is not None else [u'check'] * count,
+			   'notes': notes if notes is not None else [u''] * count}
+	for locale in locales:
+		feature['title_' + locale] = u'[{0}] {1}'.format(locale, title)
+		feature['description_' + locale] = u'[{0}] {1} description'.format(locale, title)
+	return feature
+
+
+def WriteJSON(path, features):
+	with open(path, 'wb') as f:
+		json.dump({'features': features}, f)
+	return path
+
+
+#
+# write features as csv worksheets of LocalBackend in path, one worksheet
+# per locale; features without a locale have no row in its worksheet
+#
+def WriteDocument(path, features, locales):
+	def write(name, header, rows):
+		with open(os.path.join(path, name + '.csv'), 'wb') as f:
+			writer = csv.writer(f)
+			writer.writerow(header)
+			for row in rows:
+				writer.writerow([text.encode('utf-8') for text in row])
+
+	platforms = StoreLicenseInfo.knownPlatforms
+	write('default', ['Title', 'Description', 'Category'],
+		  [[feature['title'], feature['description'], feature['category']] for feature in features])
+	write('platform', ['Ref-Title'] + platforms, [[feature['title']] + feature['platform'] for feature in features])
+	write('notes', ['Ref-Title'] + platforms, [[feature['title']] + feature['notes'] for feature in features])
+	write('how to use', ['Text'], [[u'Edit default sheet first.']])
+	for locale in locales:
+		write(locale, ['Ref-Title', 'Title', 'Description'],
+			  [[feature['title'], feature['title_' + locale], feature['description_' + locale]]
+			   for feature in features if 'title_' + locale in feature])
+
+
+def Parser(path, jobs=1, batch=False):
+	return StoreLicenseParser(None, None, None, jobs, batch, None, LocalBackend(path))
+
+
+#
+# { title : feature } of the document in path, as exported
+#
+def ReadDocument(path):
+	parser = Parser(path)
+	parser.LoadDocumentFromGoogleDocs()
+	return dict([(key, obj.JSONObject()) for key, obj in parser.features.iteritems()])
+
+
+#
+# rows of each worksheet of the document in path, to check that no row was
+# written twice
+#
+def ReadRows(path):
+	backend = LocalBackend(path)
+	return dict([(name, [row.values for row in backend.GetRows(wksht_id)])
+				 for name, wksht_id, updated in backend.ListWorksheets()])
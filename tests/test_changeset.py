@@ -0,0 +1,140 @@
+#!/usr/bin/python
+#
+# Copyright (C) 2012 Unity Technologies Japan, G.K.
+#
+# Tests of DocumentChangeSet, and of uploading one (--apply-changeset) to a
+# LocalBackend document.
+#
+#   $> python -m unittest discover -s tests
+#
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import cStringIO
+
+import localdocument
+from localdocument import MakeFeature
+from storelicense import DocumentChangeSet, LoadJSONFile
+
+
+class ChangeSetTestCase(unittest.TestCase):
+	def setUp(self):
+		self.workDir = tempfile.mkdtemp(prefix='storelicense-test-')
+		self.stdout = sys.stdout
+		sys.stdout = open(os.devnull, 'w')
+
+	def tearDown(self):
+		sys.stdout.close()
+		sys.stdout = self.stdout
+		shutil.rmtree(self.workDir)
+
+	def Compute(self, old, new):
+		oldPath = localdocument.WriteJSON(os.path.join(self.workDir, 'old.json'), old)
+		newPath = localdocument.WriteJSON(os.path.join(self.workDir, 'new.json'), new)
+		return DocumentChangeSet.Compute(LoadJSONFile(oldPath).features, LoadJSONFile(newPath).features)
+
+
+class DocumentChangeSetTest(ChangeSetTestCase):
+	def testAddedRemovedModified(self):
+		old = [MakeFeature(u'a', ['ja']), MakeFeature(u'b'), MakeFeature(u'c')]
+		new = [MakeFeature(u'a', ['ja']), MakeFeature(u'b', category=u'physics'), MakeFeature(u'd', ['ko'])]
+		new[0]['description_ja'] = u'new'
+		new[0]['platform'] = [u''] + new[0]['platform'][1:]
+		changes = self.Compute(old, new)
+		self.assertEqual(changes.added, [new[2]])
+		self.assertEqual(changes.removed, [u'c'])
+		self.assertEqual(changes.modified, [
+			{'title': u'a', 'fields': {'description_ja': u'new', 'platform': new[0]['platform']}},
+			{'title': u'b', 'fields': {'category': u'physics'}}])
+
+	def testRemovedLocaleIsNull(self):
+		changes = self.Compute([MakeFeature(u'a', ['ja', 'ko'])], [MakeFeature(u'a', ['ko'])])
+		self.assertEqual(changes.modified, [{'title': u'a', 'fields': {'title_ja': None, 'description_ja': None}}])
+
+	def testAddedLocale(self):
+		changes = self.Compute([MakeFeature(u'a')], [MakeFeature(u'a', ['ja'])])
+		self.assertEqual(changes.modified, [{'title': u'a', 'fields': {'title_ja': u'[ja] a', 'description_ja': u'[ja] a description'}}])
+
+	def testUnchangedIsEmpty(self):
+		changes = self.Compute([MakeFeature(u'a', ['ja']), MakeFeature(u'b')], [MakeFeature(u'b'), MakeFeature(u'a', ['ja'])])
+		self.assertTrue(changes.IsEmpty())
+
+	def testWriteRead(self):
+		changes = DocumentChangeSet([MakeFeature(u'\u6a5f\u80fd', ['ja'])], [u'b', u'c'],
+			[{'title': u'd', 'fields': {'title_ja': None, 'description_ja': None, 'category': u'x'}}])
+		path = os.path.join(self.workDir, 'changes.json')
+		with open(path, 'wb') as f:
+			changes.Write(f)
+		read = DocumentChangeSet.Read(path)
+		self.assertEqual(read.added, changes.added)
+		self.assertEqual(read.removed, changes.removed)
+		self.assertEqual(read.modified, changes.modified)
+
+	def testWriteEmpty(self):
+		out = cStringIO.StringIO()
+		DocumentChangeSet().Write(out)
+		path = os.path.join(self.workDir, 'changes.json')
+		with open(path, 'wb') as f:
+			f.write(out.getvalue())
+		self.assertTrue(DocumentChangeSet.Read(path).IsEmpty())
+
+
+class UploadChangeSetTest(ChangeSetTestCase):
+	def setUp(self):
+		ChangeSetTestCase.setUp(self)
+		self.docDir = os.path.join(self.workDir, 'doc')
+		os.mkdir(self.docDir)
+		self.old = [MakeFeature(u'a', ['ja']), MakeFeature(u'b', ['ja', 'ko']), MakeFeature(u'c', ['ko']),
+					MakeFeature(u'e')]
+		localdocument.WriteDocument(self.docDir, self.old, ['ja', 'ko'])
+
+		self.new = [MakeFeature(u'a', ['ja']), MakeFeature(u'b', ['ko']), MakeFeature(u'd', ['ja', 'ko']),
+					MakeFeature(u'e')]
+		self.new[0]['description'] = u'changed'
+		self.new[0]['notes'] = [u'note'] + self.new[0]['notes'][1:]
+		self.new[3]['title_ko'] = u'[ko] e'
+		self.new[3]['description_ko'] = u'[ko] e description'
+		self.changes = self.Compute(self.old, self.new)
+
+	def Expected(self):
+		expected = dict([(feature['title'], feature) for feature in self.new])
+		# a locale removed from a feature is left in the spreadsheet
+		expected[u'b']['title_ja'] = u'[ja] b'
+		expected[u'b']['description_ja'] = u'[ja] b description'
+		return expected
+
+	def Apply(self, jobs=1, batch=False):
+		parser = localdocument.Parser(self.docDir, jobs, batch)
+		parser.UploadChangeSet(self.changes)
+		self.assertEqual(localdocument.ReadDocument(self.docDir), self.Expected())
+
+	def testApply(self):
+		self.Apply()
+
+	def testApplyConcurrently(self):
+		self.Apply(4, True)
+
+	def testApplyTwice(self):
+		self.Apply()
+		rows = localdocument.ReadRows(self.docDir)
+		self.Apply()
+		self.assertEqual(localdocument.ReadRows(self.docDir), rows)
+
+	def testRowsOfOtherFeaturesKept(self):
+		self.Apply()
+		rows = localdocument.ReadRows(self.docDir)
+		self.assertEqual([row['title'] for row in rows['default']], [u'a', u'b', u'e', u'd'])
+		self.assertEqual(sorted([row['ref-title'] for row in rows['ja']]), [u'a', u'b', u'd'])
+		self.assertEqual(sorted([row['ref-title'] for row in rows['ko']]), [u'b', u'd', u'e'])
+
+	def testPlanWritesNothing(self):
+		rows = localdocument.ReadRows(self.docDir)
+		localdocument.Parser(self.docDir).UploadChangeSet(self.changes, True)
+		self.assertEqual(localdocument.ReadRows(self.docDir), rows)
+
+
+if __name__ == '__main__':
+	unittest.main()
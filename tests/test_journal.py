@@ -0,0 +1,191 @@
+#!/usr/bin/python
+#
+# Copyright (C) 2012 Unity Technologies Japan, G.K.
+#
+# Tests of UploadJournal and StoreLicenseParser.ResumeUpload: uploads to a
+# LocalBackend document interrupted after some writes, then resumed, must
+# end like an upload that was not interrupted, without rows written twice.
+#
+#   $> python -m unittest discover -s tests
+#
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+
+import localdocument
+from localdocument import MakeFeature
+from storelicense import StoreLicenseParser, LocalBackend, UploadJournal, DocumentChangeSet, LoadJSONFile
+
+
+class Interrupted(Exception):
+	pass
+
+
+#
+# LocalBackend making every write persistent at once, like the service does,
+# and failing once given number of writes were made. with isLost, the failed
+# write is made anyway, like a request whose response was lost.
+#
+class InterruptedBackend(LocalBackend):
+	def __init__(self, path, writes, isLost=False):
+		LocalBackend.__init__(self, path)
+		self.writes = writes
+		self.isLost = isLost
+		self.writeLock = threading.Lock()
+
+	def UpdateRow(self, wksht_id, row, data):
+		return self._Write(lambda: LocalBackend.UpdateRow(self, wksht_id, row, data))
+
+	def InsertRow(self, wksht_id, data):
+		return self._Write(lambda: LocalBackend.InsertRow(self, wksht_id, data))
+
+	def DeleteRow(self, wksht_id, row):
+		return self._Write(lambda: LocalBackend.DeleteRow(self, wksht_id, row))
+
+	def _Write(self, write):
+		with self.writeLock:
+			if self.writes <= 0:
+				if self.isLost:
+					write()
+					self.Flush()
+				raise Interrupted()
+			self.writes -= 1
+			result = write()
+			self.Flush()
+			return result
+
+
+class ResumeUploadTest(unittest.TestCase):
+	def setUp(self):
+		self.workDir = tempfile.mkdtemp(prefix='storelicense-test-')
+		self.stdout = sys.stdout
+		sys.stdout = open(os.devnull, 'w')
+
+		locales = ['ja', 'ko']
+		old = [MakeFeature(u'feature {0:02}'.format(i), locales[:i % 3]) for i in range(30)]
+		new = [MakeFeature(u'feature {0:02}'.format(i), locales[:i % 3]) for i in range(5, 40)]
+		for feature in new[:10]:
+			feature['description'] = u'changed'
+			feature['platform'] = [u''] + feature['platform'][1:]
+		for feature in new[10:15]:
+			feature['title_ko'] = u'[ko] changed'
+			feature['description_ko'] = u'[ko] changed'
+		self.old = old
+		self.oldPath = localdocument.WriteJSON(os.path.join(self.workDir, 'old.json'), old)
+		self.newPath = localdocument.WriteJSON(os.path.join(self.workDir, 'new.json'), new)
+		self.journalPath = os.path.join(self.workDir, 'journal')
+
+	def tearDown(self):
+		sys.stdout.close()
+		sys.stdout = self.stdout
+		shutil.rmtree(self.workDir)
+
+	def _Document(self, name):
+		path = os.path.join(self.workDir, name)
+		os.mkdir(path)
+		localdocument.WriteDocument(path, self.old, ['ja', 'ko'])
+		return path
+
+	def _Parser(self, backend, jobs, batch):
+		parser = StoreLicenseParser(None, None, None, jobs, batch, None, backend)
+		parser.journal = UploadJournal(self.journalPath)
+		return parser
+
+	# --upload --fullsync
+	def Upload(self, parser):
+		parser.LoadDocumentFromJSONFile(self.newPath)
+		parser.UploadSheet(True)
+
+	# --apply-changeset
+	def ApplyChangeSet(self, parser):
+		changes = DocumentChangeSet.Compute(LoadJSONFile(self.oldPath).features, LoadJSONFile(self.newPath).features)
+		parser.UploadChangeSet(changes)
+
+	#
+	# document after upload(parser), not interrupted
+	#
+	def Expected(self, upload):
+		docDir = self._Document('expected')
+		upload(localdocument.Parser(docDir))
+		expected = localdocument.ReadDocument(docDir)
+		shutil.rmtree(docDir)
+		return expected
+
+	#
+	# upload interrupted after given number of writes, then resume it
+	#
+	def Resume(self, upload, expected, writes, jobs=1, batch=False, isLost=False):
+		docDir = self._Document('doc')
+		parser = self._Parser(InterruptedBackend(docDir, writes, isLost), jobs, batch)
+		self.assertRaises(Interrupted, upload, parser)
+		self.assertTrue(os.path.exists(self.journalPath))
+
+		changes = self._Parser(LocalBackend(docDir), jobs, batch).ResumeUpload()
+		self.assertNotEqual(changes, None)
+		self.assertFalse(os.path.exists(self.journalPath))
+		self.assertEqual(localdocument.ReadDocument(docDir), expected)
+		self.assertNoDuplicates(docDir)
+		shutil.rmtree(docDir)
+
+	def assertNoDuplicates(self, docDir):
+		for name, rows in localdocument.ReadRows(docDir).iteritems():
+			if name == 'how to use':
+				continue
+			keys = [row.get('ref-title', row.get('title')) for row in rows]
+			self.assertEqual(len(keys), len(set(keys)), name)
+
+	def testResume(self):
+		expected = self.Expected(self.Upload)
+		for writes in (0, 1, 5, 40):
+			for jobs in (1, 4):
+				for batch in (False, True):
+					self.Resume(self.Upload, expected, writes, jobs, batch)
+
+	def testResumeAfterLostWrite(self):
+		expected = self.Expected(self.Upload)
+		for writes in (0, 1, 5, 40):
+			for jobs in (1, 4):
+				for batch in (False, True):
+					self.Resume(self.Upload, expected, writes, jobs, batch, True)
+
+	def testResumeChangeSet(self):
+		expected = self.Expected(self.ApplyChangeSet)
+		for writes in (0, 1, 5, 40):
+			for isLost in (False, True):
+				self.Resume(self.ApplyChangeSet, expected, writes, 1, False, isLost)
+
+	def testResumeTwice(self):
+		docDir = self._Document('doc')
+		self.assertRaises(Interrupted, self.Upload, self._Parser(InterruptedBackend(docDir, 5, True), 1, False))
+		self.assertRaises(Interrupted, self._Parser(InterruptedBackend(docDir, 10, True), 1, False).ResumeUpload)
+		self._Parser(LocalBackend(docDir), 1, False).ResumeUpload()
+		self.assertEqual(localdocument.ReadDocument(docDir), self.Expected(self.Upload))
+		self.assertNoDuplicates(docDir)
+
+	def testNothingToResume(self):
+		self.assertEqual(self._Parser(LocalBackend(self._Document('doc')), 1, False).ResumeUpload(), None)
+
+
+class UploadJournalTest(unittest.TestCase):
+	def setUp(self):
+		self.workDir = tempfile.mkdtemp(prefix='storelicense-test-')
+		self.path = os.path.join(self.workDir, 'journal')
+
+	def tearDown(self):
+		shutil.rmtree(self.workDir)
+
+	def testPartialLastLineIgnored(self):
+		with open(self.path, 'wb') as f:
+			f.write('{"journal": 1, "key": "doc"}\n')
+			f.write('{"plan": "default", "label": "Default", "deletes": ["a"], "updates": [], "inserts": [["b", {}], ["b", {}]]}\n')
+			f.write('{"done": "default", "kind": "insert", "key": "b"}\n')
+			f.write('{"done": "default", "kind": "del')
+		self.assertEqual(UploadJournal.Read(self.path), ('doc', [('Default', 'default', ['a'], [], [['b', {}]])]))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,176 @@
+#!/usr/bin/python
+#
+# Copyright (C) 2012 Unity Technologies Japan, G.K.
+#
+# Tests of PropertiesEscape and .properties export: texts are read back with
+# a reader following java.util.Properties.load strictly, and must come back
+# unchanged.
+#
+#   $> python -m unittest discover -s tests
+#
+
+import os
+import re
+import shutil
+import struct
+import tempfile
+import unittest
+
+import localdocument
+from localdocument import MakeFeature
+from storelicense import StoreLicenseInfo, PropertiesEscape, ConvertCommand
+
+
+class PropertiesError(Exception):
+	pass
+
+
+#
+# { key : value } of .properties text, read like java.util.Properties.load.
+# raises PropertiesError for anything load would read differently from what
+# PropertiesEscape means (characters outside ascii) or reject (malformed
+# \uXXXX), and for keys given twice.
+#
+def ReadProperties(text):
+	try:
+		text.decode('ascii')
+	except UnicodeDecodeError:
+		raise PropertiesError('not ascii')
+
+	properties = {}
+	for line in _LogicalLines(text):
+		i = 0
+		while i < len(line) and line[i] in ' \t\f':
+			i += 1
+		if i == len(line) or line[i] in '#!':
+			continue
+		start = i
+		while i < len(line) and line[i] not in ' \t\f=:':
+			i += 2 if line[i] == '\\' else 1
+		key = line[start:i]
+		while i < len(line) and line[i] in ' \t\f':
+			i += 1
+		if i < len(line) and line[i] in '=:':
+			i += 1
+		while i < len(line) and line[i] in ' \t\f':
+			i += 1
+		key = _Unescape(key)
+		if key in properties:
+			raise PropertiesError('key given twice: {0!r}'.format(key))
+		properties[key] = _Unescape(line[i:])
+	return properties
+
+
+#
+# natural lines joined where one ends with an odd number of backslashes,
+# dropping the leading whitespace of the continuation line. comment lines
+# are never continued.
+#
+def _LogicalLines(text):
+	lines = []
+	current = None
+	for line in re.split('\r\n|\r|\n', text):
+		if current is not None:
+			line = current + line.lstrip(' \t\f')
+		elif line.lstrip(' \t\f')[:1] in ('#', '!'):
+			lines.append(line)
+			continue
+		trailing = len(line) - len(line.rstrip('\\'))
+		if trailing % 2 == 1:
+			current = line[:-1]
+			continue
+		current = None
+		lines.append(line)
+	if current is not None:
+		lines.append(current)
+	return lines
+
+
+def _Unescape(text):
+	units = []  # utf-16 code units, as java strings are
+	i = 0
+	while i < len(text):
+		c = text[i]
+		i += 1
+		if c != '\\':
+			units.append(ord(c))
+			continue
+		if i == len(text):
+			break
+		c = text[i]
+		i += 1
+		if c == 'u':
+			digits = text[i:i + 4]
+			if not re.match('^[0-9a-fA-F]{4}$', digits):
+				raise PropertiesError('malformed \\uxxxx encoding: {0!r}'.format(text))
+			units.append(int(digits, 16))
+			i += 4
+		else:
+			units.append(ord({'t': '\t', 'n': '\n', 'r': '\r', 'f': '\f'}.get(c, c)))
+	return ''.join([struct.pack('<H', unit) for unit in units]).decode('utf-16-le')
+
+
+class PropertiesEscapeTest(unittest.TestCase):
+	texts = [u'plain', u'#! x=y: z', u'line\nbreak', u'tab\there', u'cr\r\nlf', u'\U0001F600 smile',
+			 u'\u65e5\u672c\u8a9e', u'caf\xe9', u' leading space', u'\tleading tab', u'  two spaces',
+			 u'trailing space ', u'back\\slash', u'ends with backslash\\', u'\\u0041 not escaped',
+			 u'form\ffeed', u'=:', u'#', u'!', u'\\']
+	keys = texts + [u'a b', u'a=b', u'a:b', u'#title', u'!title', u' leading', u'key.title']
+
+	def RoundTrip(self, key, value):
+		line = u'{0}={1}\n'.format(PropertiesEscape(key, True), PropertiesEscape(value)).encode('ascii')
+		self.assertEqual(ReadProperties(line), {key: value}, repr(line))
+
+	def testValues(self):
+		for text in self.texts:
+			self.RoundTrip(u'key', text)
+
+	def testKeys(self):
+		for text in self.keys:
+			self.RoundTrip(text, u'value')
+
+	def testEscapes(self):
+		self.assertEqual(PropertiesEscape(u'#! x=y: z'), u'#! x=y: z')
+		self.assertEqual(PropertiesEscape(u'#! x=y: z', True), u'\\#!\\ x\\=y\\:\\ z')
+		self.assertEqual(PropertiesEscape(u'a\nb\tc'), u'a\\nb\\tc')
+		self.assertEqual(PropertiesEscape(u'\U0001F600'), u'\\ud83d\\ude00')
+		self.assertEqual(PropertiesEscape(u' a'), u'\\ a')
+
+	def testReaderIsStrict(self):
+		self.assertRaises(PropertiesError, ReadProperties, u'a=\xe9\n'.encode('utf-8'))
+		self.assertRaises(PropertiesError, ReadProperties, 'a=\\u00e\n')
+		self.assertRaises(PropertiesError, ReadProperties, 'a=1\na=2\n')
+		self.assertEqual(ReadProperties('# c\\\n! c\n  a = b \\\n   c\nd:e\nf g\n'), {u'a': u'b c', u'd': u'e', u'f': u'g'})
+
+
+class PropertiesExportTest(unittest.TestCase):
+	def setUp(self):
+		self.workDir = tempfile.mkdtemp(prefix='storelicense-test-')
+
+	def tearDown(self):
+		shutil.rmtree(self.workDir)
+
+	def testConvert(self):
+		features = []
+		for i, text in enumerate(PropertiesEscapeTest.texts):
+			feature = MakeFeature(u'{0} {1}'.format(text, i), ['ja'])
+			feature['description'] = text
+			feature['title_ja'] = text + u' ja'
+			feature['description_ja'] = u'\u3042' + text
+			features.append(feature)
+		path = localdocument.WriteJSON(os.path.join(self.workDir, 'store.json'), features)
+		output = os.path.join(self.workDir, 'out')
+		self.assertEqual(ConvertCommand([path, '--to', 'properties', '--output', output]), 0)
+
+		for locale, suffix in ((StoreLicenseInfo.default_locale, ''), ('ja', '_ja')):
+			with open(os.path.join(output, locale + '.properties'), 'rb') as f:
+				properties = ReadProperties(f.read())
+			expected = {}
+			for feature in features:
+				expected[feature['title'] + u'.title'] = feature['title' + suffix]
+				expected[feature['title'] + u'.description'] = feature['description' + suffix]
+			self.assertEqual(properties, expected)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,141 @@
+#!/usr/bin/python
+#
+# Copyright (C) 2012 Unity Technologies Japan, G.K.
+#
+# Tests of FeatureValidator and the validate command.
+#
+#   $> python -m unittest discover -s tests
+#
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import localdocument
+from localdocument import MakeFeature
+from storelicense import StoreLicenseInfo, FeatureValidator, ValidateCommand, DocumentBatch
+
+
+def Validate(features, isPartial=False):
+	validator = FeatureValidator()
+	for feature in features:
+		validator.Check(feature, isPartial)
+	return validator
+
+
+class FeatureValidatorTest(unittest.TestCase):
+	def testValid(self):
+		validator = Validate([MakeFeature('a', ['ja']), MakeFeature('b')])
+		self.assertEqual(validator.problems, [])
+		self.assertEqual(validator.count, 2)
+		self.assertEqual(validator.locales, set(['en', 'ja']))
+
+	def testMissingKeys(self):
+		for key in ['title', 'description', 'category', 'platform', 'notes']:
+			feature = MakeFeature('a')
+			del feature[key]
+			problems = Validate([feature]).problems
+			self.assertEqual(len(problems), 1, key)
+			self.assertTrue('"{0}" missing'.format(key) in problems[0], problems[0])
+
+	def testPartialOnlyNeedsTitle(self):
+		self.assertEqual(Validate([{'title': 'a', 'title_ja': None, 'description_ja': None}], True).problems, [])
+		self.assertEqual(len(Validate([{'description': 'x'}], True).problems), 1)
+
+	def testArrayLength(self):
+		short = MakeFeature('a', platform=['check'])
+		long = MakeFeature('b', notes=[''] * (len(StoreLicenseInfo.knownPlatforms) + 1))
+		notList = MakeFeature('c', notes='')
+		notTexts = MakeFeature('d', platform=[1] * len(StoreLicenseInfo.knownPlatforms))
+		problems = Validate([short, long, notList, notTexts]).problems
+		self.assertEqual(len(problems), 4)
+		self.assertTrue('"platform" is not a list of 8 texts' in problems[0])
+		self.assertTrue('"notes" is not a list of 8 texts' in problems[1])
+		self.assertTrue('"notes" is not a list of 8 texts' in problems[2])
+		self.assertTrue('"platform" has values that are not texts' in problems[3])
+
+	def testDuplicateTitle(self):
+		problems = Validate([MakeFeature('a'), MakeFeature('b'), MakeFeature('a')]).problems
+		self.assertEqual(problems, [u'feature 3 "a": more than one feature has this title'])
+
+	def testOrphanedLocaleFields(self):
+		orphanTitle = MakeFeature('a', ['ja'])
+		del orphanTitle['description_ja']
+		orphanDescription = MakeFeature('b', ['ko'])
+		del orphanDescription['title_ko']
+		problems = Validate([orphanTitle, orphanDescription]).problems
+		self.assertEqual(problems, [u'feature 1 "a": "title_ja" without "description_ja"',
+									u'feature 2 "b": "description_ko" without "title_ko"'])
+
+	def testNotText(self):
+		feature = MakeFeature('a', ['ja'], category=3)
+		feature['title_ja'] = None
+		problems = Validate([feature]).problems
+		self.assertEqual(sorted(problems), [u'feature 1 "a": "category" is not a text',
+											u'feature 1 "a": "title_ja" is not a text'])
+
+	def testLocalesWithoutWorksheet(self):
+		validator = Validate([MakeFeature('a', ['ja']), MakeFeature('b', ['ko'])])
+		self.assertEqual(validator.WorksheetProblems(['default', 'ja']), ['locale "ko" has no worksheet'])
+		self.assertEqual(validator.problems, [])
+		validator.CheckWorksheets(['default', 'platform', 'notes', 'how to use', 'ja'])
+		self.assertEqual(validator.problems, ['locale "ko" has no worksheet'])
+
+	def testEveryProblemReported(self):
+		bad = MakeFeature('a', ['ja'], platform=[])
+		del bad['description']
+		del bad['description_ja']
+		problems = Validate([bad, MakeFeature('a')]).problems
+		self.assertEqual(len(problems), 4)
+
+
+class ValidateCommandTest(unittest.TestCase):
+	def setUp(self):
+		self.workDir = tempfile.mkdtemp(prefix='storelicense-test-')
+		self.stderr = sys.stderr
+		self.stdout = sys.stdout
+		sys.stderr = sys.stdout = open(os.devnull, 'w')
+
+	def tearDown(self):
+		sys.stderr.close()
+		sys.stderr = self.stderr
+		sys.stdout = self.stdout
+		shutil.rmtree(self.workDir)
+
+	def _Write(self, features, name='store.json'):
+		return localdocument.WriteJSON(os.path.join(self.workDir, name), features)
+
+	def testMissingDescriptionFails(self):
+		feature = MakeFeature('b')
+		del feature['description']
+		self.assertEqual(ValidateCommand([self._Write([MakeFeature('a'), feature])]), 1)
+
+	def testValidFilePasses(self):
+		self.assertEqual(ValidateCommand([self._Write([MakeFeature('a'), MakeFeature('b')])]), 0)
+
+	def testManifestUploads(self):
+		good = self._Write([MakeFeature('a', ['ja'])], 'good.json')
+		documents = [{'key': '1', 'output': 'out.json'}, {'key': '2', 'upload': good}, {'key': '3', 'upload': good}]
+		validators = DocumentBatch.ValidateUploads(documents)
+		self.assertEqual(sorted(validators), [good])
+		self.assertEqual(validators[good].locales, set(['en', 'ja']))
+
+		duplicate = self._Write([MakeFeature('a'), MakeFeature('a')], 'duplicate.json')
+		short = self._Write([MakeFeature('a', platform=['check'])], 'short.json')
+		missing = os.path.join(self.workDir, 'missing.json')
+		devnull, sys.stderr = sys.stderr, open(os.path.join(self.workDir, 'stderr'), 'w')
+		documents = [{'key': str(i), 'upload': path} for i, path in enumerate([good, duplicate, short, missing])]
+		self.assertEqual(DocumentBatch.ValidateUploads(documents), None)
+		sys.stderr.close()
+		sys.stderr = devnull
+		with open(os.path.join(self.workDir, 'stderr')) as f:
+			reported = f.read()
+		for path in (duplicate, short, missing):
+			self.assertTrue(path in reported, path)
+		self.assertFalse(good in reported)
+
+
+if __name__ == '__main__':
+	unittest.main()